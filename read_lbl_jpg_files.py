@@ -1,32 +1,40 @@
-import numpy as np
-from PIL import Image
-import matplotlib.pyplot as plt
 import re
 from datetime import datetime
+from vmc_pds3 import parse_label_text
+from vmc_lazy import lazy_import
+
+# Image libraries are only needed by read_jpg/display_data, not by read_lbl
+np = lazy_import('numpy')
+Image = lazy_import('PIL.Image')
+plt = lazy_import('matplotlib.pyplot')
 
 def read_lbl(lbl_path):
     """Read and parse LBL file"""
     try:
-        with open(lbl_path, 'r') as f:
+        with open(lbl_path, 'r', errors='replace') as f:
             content = f.read()
+        label = parse_label_text(content)
             
-        # Extract key metadata using simple regex
+        # Key metadata in the same form as before
         metadata = {}
-        patterns = {
-            'product_id': r'PRODUCT_ID\s*=\s*"([^"]*)"',
-            'start_time': r'START_TIME\s*=\s*"([^"]*)"',
-            'filter_name': r'FILTER_NAME\s*=\s*"([^"]*)"',
-            'exposure_duration': r'EXPOSURE_DURATION\s*=\s*([\d.]+)'
+        keys = {
+            'product_id': 'PRODUCT_ID',
+            'start_time': 'START_TIME',
+            'filter_name': 'FILTER_NAME',
+            'exposure_duration': 'EXPOSURE_DURATION'
         }
         
-        for key, pattern in patterns.items():
-            match = re.search(pattern, content)
-            if match:
-                value = match.group(1)
-                # Convert exposure duration to float
-                if key == 'exposure_duration':
-                    value = float(value)
-                metadata[key] = value
+        for key, label_key in keys.items():
+            value = label.get(label_key)
+            if value is None:
+                continue
+            if isinstance(value, datetime):
+                # Return times exactly as written in the label
+                match = re.search(rf'{label_key}\s*=\s*"?([^"\r\n]*)', content)
+                value = match.group(1).strip() if match else value.isoformat()
+            elif key == 'exposure_duration':
+                value = float(value)
+            metadata[key] = value
                 
         return metadata
             
@@ -34,9 +42,11 @@ def read_lbl(lbl_path):
         print(f"Error reading LBL file: {e}")
         return None
 
-def read_jpg(jpg_path):
-    """Read JPG file"""
+def read_jpg(jpg_path, quicklook=None):
+    """Read JPG file (or its cached thumbnail if a QuicklookCache is given)"""
     try:
+        if quicklook is not None:
+            return quicklook.thumbnail(jpg_path)
         # Read image
         img = Image.open(jpg_path)
         # Convert to numpy array
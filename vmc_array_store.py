@@ -0,0 +1,90 @@
+import os
+import json
+import numpy as np
+from pathlib import Path
+
+UINT16_SCALE = 65535.0
+
+def save_array(path, image, dtype='float32'):
+    """
+    Write a 0-1 float image as a single-channel .npy file
+
+    Parameters:
+    path: output path (.npy)
+    image: 2-D array with values in 0-1
+    dtype: 'float32' (lossless for our pipeline) or 'uint16' (half the size)
+    """
+    if dtype == 'uint16':
+        data = np.round(np.clip(image, 0, 1) * UINT16_SCALE).astype(np.uint16)
+    else:
+        data = np.asarray(image, dtype=np.float32)
+
+    # Write to a temporary name and move into place so readers never see a partial file
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        np.save(f, data)
+    os.replace(tmp_path, path)
+
+def load_array(path, as_float=True):
+    """
+    Memory-map a .npy image
+
+    float32 files are returned as a read-only memmap without copying.
+    uint16 files are scaled to float32 0-1 (one copy) unless as_float is False.
+    """
+    data = np.load(path, mmap_mode='r')
+    if as_float and data.dtype == np.uint16:
+        return data.astype(np.float32) / np.float32(UINT16_SCALE)
+    return data
+
+def build_orbit_stack(orbit_dir, pattern="proc_*.npy", stack_name="proc_stack"):
+    """
+    Pack the per-frame arrays of one orbit into a single memory-mapped (N, H, W) stack
+
+    Writes <stack_name>.npy and <stack_name>.json (frame names in stack order).
+    Returns the path of the stack file.
+    """
+    orbit_dir = Path(orbit_dir)
+    frames = sorted(p for p in orbit_dir.glob(pattern) if not p.name.startswith(stack_name))
+    if not frames:
+        return None
+
+    first = np.load(frames[0], mmap_mode='r')
+    stack_path = orbit_dir / f"{stack_name}.npy"
+    tmp_path = orbit_dir / f"{stack_name}.npy.tmp"
+    stack = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=first.dtype,
+                                      shape=(len(frames),) + first.shape)
+    for i, frame in enumerate(frames):
+        stack[i] = np.load(frame, mmap_mode='r')
+    stack.flush()
+    del stack
+    os.replace(tmp_path, stack_path)
+
+    with open(orbit_dir / f"{stack_name}.json", 'w') as f:
+        json.dump([frame.name for frame in frames], f)
+    return stack_path
+
+def open_orbit_stack(orbit_dir, stack_name="proc_stack", rebuild=True):
+    """
+    Memory-map an orbit stack, rebuilding it if any frame is newer than the stack
+
+    Returns (stack, frame_names) or (None, []) if the orbit has no arrays.
+    """
+    orbit_dir = Path(orbit_dir)
+    stack_path = orbit_dir / f"{stack_name}.npy"
+    index_path = orbit_dir / f"{stack_name}.json"
+
+    if rebuild:
+        frames = [p for p in orbit_dir.glob("proc_*.npy") if not p.name.startswith(stack_name)]
+        stale = not stack_path.exists() or not index_path.exists() or \
+            any(p.stat().st_mtime > stack_path.stat().st_mtime for p in frames) or \
+            len(frames) != len(json.loads(index_path.read_text()))
+        if stale and build_orbit_stack(orbit_dir, stack_name=stack_name) is None:
+            return None, []
+
+    if not stack_path.exists():
+        return None, []
+    with open(index_path) as f:
+        names = json.load(f)
+    return np.load(stack_path, mmap_mode='r'), names
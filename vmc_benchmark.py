@@ -0,0 +1,340 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import platform
+import resource
+import tempfile
+import argparse
+import subprocess
+import multiprocessing
+from glob import glob
+from contextlib import redirect_stdout
+from datetime import datetime
+
+import numpy as np
+
+from vmc_synthetic import make_synthetic_orbit_tree, serve_directory
+
+STAGES = ('imports', 'labels', 'catalog', 'timing', 'extract', 'preprocess', 'edges', 'blobs', 'regions',
+          'download')
+IMPORT_TARGETS = ('vmc_catalog', 'vmc_timing', 'vmc_product_index', 'vmc_downloader', 'read_lbl_jpg_files',
+                  'vmc_processor', 'vmc_feature_detector', 'vmc_cli')
+# Commands that cron jobs run and that must start quickly
+STARTUP_COMMANDS = (('catalog',), ('timing',), ('list-downloaded',))
+
+def _timed(fn, items):
+    """Call fn on every item; return (per-item latencies, total seconds)"""
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - start)
+    return latencies, sum(latencies)
+
+def _quiet(fn, *args, **kwargs):
+    with redirect_stdout(io.StringIO()):
+        return fn(*args, **kwargs)
+
+def _import_seconds(module):
+    """Time `import module` in a fresh interpreter (interpreter startup excluded)"""
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+    return float(output.strip().splitlines()[-1])
+
+def _command_seconds(args):
+    """Wall time of one vmc_cli.py run, interpreter startup included"""
+    cli = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vmc_cli.py')
+    start = time.perf_counter()
+    subprocess.run([sys.executable, cli, *args], capture_output=True, check=True)
+    return time.perf_counter() - start
+
+def benchmark_imports(modules=IMPORT_TARGETS, repeats=5, data_dir=None):
+    """
+    Median import time of each module and startup time of the metadata CLI commands
+
+    Each measurement runs in a new interpreter so nothing is cached in
+    sys.modules. CLI commands are timed against data_dir (an empty temporary
+    directory by default). Returns {name: median seconds}.
+    """
+    temporary = data_dir is None
+    data_dir = data_dir or tempfile.mkdtemp(prefix="vmc_imports_")
+    try:
+        timings = {f"import {module}": [_import_seconds(module) for _ in range(repeats)] for module in modules}
+        for command in STARTUP_COMMANDS:
+            timings[f"vmc_cli {' '.join(command)}"] = [_command_seconds([*command, data_dir])
+                                                       for _ in range(repeats)]
+    finally:
+        if temporary:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    print("\nImport and Startup Times:")
+    print("-" * 50)
+    medians = {}
+    for name, seconds in timings.items():
+        medians[name] = float(np.median(seconds))
+        print(f"{name:<40} {medians[name] * 1000:8.1f} ms")
+    return medians
+
+def _bench_imports(tree, work_dir, options):
+    medians = benchmark_imports(repeats=options['repeats'], data_dir=tree)
+    return list(medians.values()), sum(medians.values()), 0, {'ms': {k: v * 1000 for k, v in medians.items()}}
+
+def _bench_labels(tree, work_dir, options):
+    from read_lbl_jpg_files import read_lbl
+    paths = sorted(glob(os.path.join(tree, '*', '*.LBL')))
+    return _timed(read_lbl, paths) + (sum(os.path.getsize(p) for p in paths),)
+
+def _bench_catalog(tree, work_dir, options):
+    from vmc_catalog import catalog_images
+    return _timed(lambda _: _quiet(catalog_images, tree), range(options['repeats'])) + (0,)
+
+def _bench_timing(tree, work_dir, options):
+    from vmc_timing import analyze_orbit_timing
+    return _timed(lambda _: _quiet(analyze_orbit_timing, tree), range(options['repeats'])) + (0,)
+
+def _bench_extract(tree, work_dir, options):
+    from vmc_uv2_extract import extract_filter_images, FILTERS
+
+    def extract(i):
+        _quiet(extract_filter_images, tree, os.path.join(work_dir, f"extract_{i}"), FILTERS,
+               mode=options['extract_mode'])
+    paths = glob(os.path.join(tree, '*', '*.*'))
+    return _timed(extract, range(options['repeats'])) + (sum(os.path.getsize(p) for p in paths),)
+
+def _uv2_frames(tree, limit=None):
+    paths = sorted(glob(os.path.join(tree, '*', '*_UV2.JPG')))
+    return paths[:limit] if limit else paths
+
+def _bench_preprocess(tree, work_dir, options):
+    from vmc_processor import VMCImageProcessor
+    processor = VMCImageProcessor(tree, work_dir)
+    paths = _uv2_frames(tree, options['max_frames'])
+    timings = _timed(lambda path: processor.preprocess_image(processor.load_image(path)), paths)
+    return timings + (sum(os.path.getsize(p) for p in paths),)
+
+def _bench_detector(method):
+    def bench(tree, work_dir, options):
+        from vmc_processor import VMCImageProcessor
+        from vmc_feature_detector import VMCFeatureDetector
+        processor = VMCImageProcessor(tree, work_dir)
+        detector = VMCFeatureDetector(work_dir, mode=options['detector_mode'])
+        # Preprocess outside the timed loop so only the detector is measured
+        images = [processor.preprocess_image(processor.load_image(path))
+                  for path in _uv2_frames(tree, options['max_frames'])]
+        detect = getattr(detector, method)
+        return _timed(detect, images) + (sum(image.nbytes for image in images),)
+    return bench
+
+def _bench_download(tree, work_dir, options):
+    from vmc_downloader import VenusExpressDownloader
+    server, base_url = serve_directory(tree, latency=options['latency'])
+    try:
+        downloader = VenusExpressDownloader(base_url=base_url, base_output_dir=os.path.join(work_dir, 'download'),
+                                            max_workers=options['download_workers'], requests_per_second=0,
+                                            max_per_host=options['download_workers'])
+        latencies = []
+        download_file = downloader.download_file
+
+        def timed_download(*args):
+            start = time.perf_counter()
+            ok = download_file(*args)
+            latencies.append(time.perf_counter() - start)
+            return ok
+        downloader.download_file = timed_download
+        start = time.perf_counter()
+        _quiet(downloader.download_all)
+        seconds = time.perf_counter() - start
+    finally:
+        server.shutdown()
+    return latencies, seconds, downloader.stats.report()['bytes']
+
+BENCHMARKS = {
+    'imports': _bench_imports,
+    'labels': _bench_labels,
+    'catalog': _bench_catalog,
+    'timing': _bench_timing,
+    'extract': _bench_extract,
+    'preprocess': _bench_preprocess,
+    'edges': _bench_detector('detect_edges'),
+    'blobs': _bench_detector('detect_blobs'),
+    'regions': _bench_detector('detect_regions'),
+    'download': _bench_download,
+}
+
+def _peak_rss_mb():
+    """Peak resident set size of this process (ru_maxrss is KiB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def run_stage(stage, tree, work_dir, options):
+    """Run one benchmark in this process and summarise it"""
+    stage_dir = os.path.join(work_dir, stage)
+    os.makedirs(stage_dir, exist_ok=True)
+    rss_before = _peak_rss_mb()
+    # seconds covers the timed work only, not imports or setup
+    latencies, seconds, nbytes, *details = BENCHMARKS[stage](tree, stage_dir, options)
+    shutil.rmtree(stage_dir, ignore_errors=True)
+
+    latencies = np.array(latencies) * 1000
+    return {
+        **(details[0] if details else {}),
+        'items': len(latencies),
+        'seconds': seconds,
+        'items_per_second': len(latencies) / seconds if seconds else 0.0,
+        'mb_per_second': nbytes / 1e6 / seconds if seconds else 0.0,
+        'latency_ms': {
+            'mean': float(latencies.mean()) if len(latencies) else None,
+            'p50': float(np.percentile(latencies, 50)) if len(latencies) else None,
+            'p90': float(np.percentile(latencies, 90)) if len(latencies) else None,
+            'p99': float(np.percentile(latencies, 99)) if len(latencies) else None,
+            'max': float(latencies.max()) if len(latencies) else None,
+        },
+        'peak_rss_mb': _peak_rss_mb(),
+        'rss_growth_mb': _peak_rss_mb() - rss_before,
+    }
+
+def _stage_task(args):
+    return run_stage(*args)
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def run_benchmarks(stages=STAGES, n_orbits=3, frames_per_orbit=10, image_size=512, repeats=3,
+                   max_frames=8, detector_mode='single', extract_mode='auto', latency=0.0,
+                   download_workers=8, isolate=True, work_dir=None):
+    """
+    Time each pipeline stage on a synthetic orbit tree
+
+    Parameters:
+    stages: benchmarks to run, any of STAGES
+    n_orbits, frames_per_orbit, image_size: size of the generated tree (4 filters per acquisition)
+    repeats: runs of the whole-tree stages (catalog, timing, extract)
+    max_frames: UV2 frames used by the per-image stages (preprocess and detectors)
+    isolate: run every stage in a fresh process so peak RSS belongs to that stage alone
+    work_dir: keep the tree here instead of a temporary directory
+
+    Returns a result dict (config, environment and per-stage numbers) ready for json.dump.
+    """
+    unknown = set(stages) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError(f"unknown stages: {sorted(unknown)}")
+    options = {'repeats': repeats, 'max_frames': max_frames, 'detector_mode': detector_mode,
+               'extract_mode': extract_mode, 'latency': latency, 'download_workers': download_workers}
+    config = dict(options, n_orbits=n_orbits, frames_per_orbit=frames_per_orbit, image_size=image_size,
+                  isolate=isolate)
+
+    temporary = work_dir is None
+    work_dir = work_dir or tempfile.mkdtemp(prefix="vmc_bench_")
+    tree = os.path.join(work_dir, 'raw')
+    try:
+        start = time.perf_counter()
+        make_synthetic_orbit_tree(tree, n_orbits, frames_per_orbit, image_size=image_size)
+        print(f"Synthetic tree: {n_orbits} orbits x {frames_per_orbit} acquisitions x 4 filters "
+              f"({image_size}x{image_size}) in {time.perf_counter() - start:.1f} s")
+
+        results = {}
+        context = multiprocessing.get_context('spawn')
+        for stage in stages:
+            args = (stage, tree, work_dir, options)
+            if isolate:
+                with context.Pool(1) as pool:
+                    results[stage] = pool.apply(_stage_task, (args,))
+            else:
+                results[stage] = run_stage(*args)
+            report = results[stage]
+            print(f"{stage:>10}: {report['items']:5d} items in {report['seconds']:7.2f} s  "
+                  f"({report['items_per_second']:8.1f}/s)  p50 {report['latency_ms']['p50']:8.2f} ms  "
+                  f"p99 {report['latency_ms']['p99']:8.2f} ms  peak RSS {report['peak_rss_mb']:7.1f} MB")
+    finally:
+        if temporary:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'numpy': np.__version__,
+        },
+        'config': config,
+        'stages': results,
+    }
+
+def compare_results(baseline, current, tolerance=0.10, min_ms=50.0):
+    """
+    Print the change of every stage against a baseline run and return the regressions
+
+    A stage regresses when its p50 latency or peak RSS grows by more than
+    `tolerance` (a fraction); import and startup times are also checked one
+    by one. Both arguments are result dicts or JSON paths.
+    """
+    if isinstance(baseline, str):
+        with open(baseline) as f:
+            baseline = json.load(f)
+    if isinstance(current, str):
+        with open(current) as f:
+            current = json.load(f)
+    if baseline.get('config') != current.get('config'):
+        print("Warning: benchmark configurations differ, numbers may not be comparable")
+
+    print("\nComparison with baseline:")
+    print("-" * 50)
+    regressions = []
+    for stage, report in current['stages'].items():
+        old = baseline['stages'].get(stage)
+        if not old or not old['latency_ms']['p50'] or report['latency_ms']['p50'] is None:
+            continue
+        latency_change = report['latency_ms']['p50'] / old['latency_ms']['p50'] - 1
+        rss_change = report['peak_rss_mb'] / old['peak_rss_mb'] - 1
+        flag = ''
+        if latency_change > tolerance or rss_change > tolerance:
+            regressions.append(stage)
+            flag = '  REGRESSION'
+        print(f"{stage:>10}: p50 {latency_change:+7.1%}  peak RSS {rss_change:+7.1%}{flag}")
+
+        # Per-module import times (changes under min_ms are noise)
+        for name, ms in report.get('ms', {}).items():
+            old_ms = old.get('ms', {}).get(name)
+            if old_ms and ms / old_ms - 1 > tolerance and ms - old_ms > min_ms:
+                regressions.append(f"{stage}: {name}")
+                print(f"{'':>10}  {name}: {old_ms:.1f} -> {ms:.1f} ms  REGRESSION")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every VMC pipeline stage on synthetic data")
+    parser.add_argument('--stages', nargs='*', default=list(STAGES), choices=STAGES)
+    parser.add_argument('--orbits', type=int, default=3)
+    parser.add_argument('--frames', type=int, default=10, help="acquisitions per orbit")
+    parser.add_argument('--size', type=int, default=512, help="frame side length in pixels")
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--max-frames', type=int, default=8, help="frames for the per-image stages")
+    parser.add_argument('--detector-mode', choices=['single', 'pyramid'], default='single')
+    parser.add_argument('--extract-mode', default='auto')
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every HTTP request")
+    parser.add_argument('--download-workers', type=int, default=8)
+    parser.add_argument('--no-isolate', action='store_true', help="run all stages in this process")
+    parser.add_argument('--output', help="write the results to this JSON file")
+    parser.add_argument('--baseline', help="compare against an earlier results file")
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.stages, args.orbits, args.frames, args.size, args.repeats, args.max_frames,
+                             args.detector_mode, args.extract_mode, args.latency, args.download_workers,
+                             isolate=not args.no_isolate)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.baseline:
+        regressions = compare_results(args.baseline, results, args.tolerance)
+        sys.exit(1 if regressions else 0)
@@ -1,23 +1,34 @@
 import os
 from collections import defaultdict
+import vmc_metrics
 
-def catalog_images(data_dir):
-    """Analyze the downloaded VMC images by orbit and filter"""
+@vmc_metrics.timed('catalog.scan')
+def catalog_images(data_dir, index=None):
+    """Analyze the downloaded VMC images by orbit and filter
+    
+    If a ProductIndex is given the counts come from the index instead of
+    walking data_dir.
+    """
     orbit_catalog = defaultdict(lambda: defaultdict(int))
     
-    # Walk through directories
-    for root, _, files in os.walk(data_dir):
-        # Only process JPG files
-        jpg_files = [f for f in files if f.endswith('.JPG')]
-        
-        if jpg_files:
-            orbit = os.path.basename(root)
+    if index is not None:
+        for orbit, filter_type, count in index.counts_by_orbit_filter():
+            orbit_catalog[orbit][filter_type] += count
+    else:
+        # Walk through directories
+        for root, _, files in os.walk(data_dir):
+            # Only process JPG files
+            jpg_files = [f for f in files if f.endswith('.JPG')]
+            
+            if jpg_files:
+                orbit = os.path.basename(root)
+                vmc_metrics.count('catalog.images', len(jpg_files))
             
-            # Count filter types in this orbit
-            for jpg in jpg_files:
-                # Extract filter type (last 3 chars before .JPG)
-                filter_type = jpg[-7:-4]  # e.g., UV2, N12, N22, VI2
-                orbit_catalog[orbit][filter_type] += 1
+                # Count filter types in this orbit
+                for jpg in jpg_files:
+                    # Extract filter type (last 3 chars before .JPG)
+                    filter_type = jpg[-7:-4]  # e.g., UV2, N12, N22, VI2
+                    orbit_catalog[orbit][filter_type] += 1
     
     # Print analysis
     print("\nImage Catalog by Orbit:")
@@ -0,0 +1,219 @@
+"""Command line entry point for the VMC tools
+
+Every subcommand imports what it needs inside its handler, so metadata-only
+commands (catalog, timing, list-downloaded, index) never load matplotlib,
+skimage, cv2 or requests and start in a fraction of a second.
+
+    python vmc_cli.py catalog /data/vmc/raw --index
+    python vmc_cli.py process /data/vmc/filtered/uv2 /data/vmc/processed/uv2 --workers 8
+"""
+import os
+import sys
+import argparse
+
+DEFAULT_BASE_URL = "https://archives.esac.esa.int/psa/ftp/VENUS-EXPRESS/VMC/VEX-V-VMC-3-RDR-EXT1-V3.0/BROWSE/"
+
+def _index(args):
+    """Product index for args.data_dir if --index was given"""
+    if not getattr(args, 'index', False):
+        return None
+    from vmc_product_index import open_index
+    return open_index(args.data_dir)
+
+def cmd_catalog(args):
+    from vmc_catalog import catalog_images
+    catalog_images(args.data_dir, index=_index(args))
+
+def cmd_timing(args):
+    from vmc_timing import analyze_orbit_timing
+    analyze_orbit_timing(args.data_dir, index=_index(args))
+
+def cmd_list_downloaded(args):
+    from vmc_downloader import list_downloaded_files
+    list_downloaded_files(args.data_dir, index=_index(args))
+
+def cmd_index(args):
+    from vmc_product_index import open_index
+    index = open_index(args.data_dir, refresh=False)
+    index.refresh(full=args.full)
+    index.close()
+
+def cmd_download(args):
+    from vmc_downloader import VenusExpressDownloader
+    downloader = VenusExpressDownloader(base_url=args.base_url, base_output_dir=args.output_dir,
+                                        max_workers=args.workers, requests_per_second=args.rps)
+    directories = [f"{orbit}/" for orbit in args.orbits] if args.orbits else None
+    downloader.download_all(directories, max_pairs=args.max_pairs)
+
+def cmd_extract(args):
+    from vmc_uv2_extract import extract_filter_images
+    extract_filter_images(args.raw_dir, args.base_dir, args.filters, mode=args.mode, orbits=args.orbits)
+
+def cmd_process(args):
+    from vmc_processor import VMCImageProcessor
+    processor = VMCImageProcessor(args.filtered_dir, args.processed_dir, output_format=args.output_format)
+    processor.process_all_images(workers=args.workers, verbose=args.verbose, batched=args.batched,
+                                 orbits=args.orbits)
+
+def cmd_detect(args):
+    from vmc_feature_detector import VMCFeatureDetector
+    detector = VMCFeatureDetector(args.processed_dir, mode=args.mode, segmentation=args.segmentation)
+    detector.analyze_batch(orbits=args.orbits, store_path=args.store, workers=args.workers,
+                           orbit_thresholds=args.orbit_thresholds)
+
+def cmd_cubes(args):
+    from vmc_multispectral import build_cubes, frame_table_from_index, frame_table_from_labels
+    if args.index:
+        from vmc_product_index import open_index
+        table = frame_table_from_index(open_index(args.raw_dir))
+    else:
+        table = frame_table_from_labels(args.raw_dir)
+    build_cubes(table, args.output_dir, tolerance=args.tolerance, require_all=args.require_all,
+                orbits=args.orbits, workers=args.workers, register=not args.no_register)
+
+def cmd_tracks(args):
+    from vmc_feature_tracks import build_tracks
+    frame_times = None
+    if args.labels:
+        from vmc_wind_tracking import frame_times_from_index, frame_times_from_labels
+        if args.index:
+            from vmc_product_index import open_index
+            frame_times = frame_times_from_index(open_index(args.labels))
+        else:
+            frame_times = frame_times_from_labels(args.labels)
+    build_tracks(args.store, kind=args.kind, frame_times=frame_times, orbit=args.orbit,
+                 max_distance=args.max_distance, max_gap=args.max_gap)
+
+def cmd_stats(args):
+    from vmc_statistics import collect_statistics
+    collect_statistics(args.processed_dir, args.output_dir, orbits=args.orbits, workers=args.workers,
+                       skip_existing=not args.force, median_bins=args.median_bins)
+
+def cmd_quicklook(args):
+    from vmc_quicklook import update_quicklooks
+    update_quicklooks(args.base_dir, args.cache_dir, pattern=args.pattern, orbits=args.orbits,
+                      size=args.size, columns=args.columns)
+
+def cmd_pipeline(args):
+    from vmc_pipeline import main
+    main(args.pipeline_args)
+
+def cmd_import_times(args):
+    from vmc_benchmark import benchmark_imports
+    benchmark_imports(repeats=args.repeats)
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='vmc', description="Venus Express VMC data tools")
+    parser.add_argument('--metrics', help="write step timings and counters to this Prometheus text file")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    for name, handler, help_text in (('catalog', cmd_catalog, "count images by orbit and filter"),
+                                     ('timing', cmd_timing, "observation timing per orbit"),
+                                     ('list-downloaded', cmd_list_downloaded, "count downloaded JPG/LBL files")):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument('data_dir')
+        command.add_argument('--index', action='store_true', help="use (and refresh) the product index")
+        command.set_defaults(handler=handler)
+
+    command = commands.add_parser('index', help="build or refresh the product index of a data directory")
+    command.add_argument('data_dir')
+    command.add_argument('--full', action='store_true', help="re-parse every label")
+    command.set_defaults(handler=cmd_index)
+
+    command = commands.add_parser('download', help="download orbits from the archive")
+    command.add_argument('output_dir')
+    command.add_argument('--base-url', default=DEFAULT_BASE_URL)
+    command.add_argument('--orbits', nargs='*')
+    command.add_argument('--max-pairs', type=int)
+    command.add_argument('--workers', type=int, default=8)
+    command.add_argument('--rps', type=float, default=4.0, help="requests per second (0 = unlimited)")
+    command.set_defaults(handler=cmd_download)
+
+    command = commands.add_parser('extract', help="link filter images into filtered/<filter>/<orbit>")
+    command.add_argument('raw_dir')
+    command.add_argument('base_dir')
+    command.add_argument('--filters', nargs='*', default=['UV2'])
+    command.add_argument('--mode', default='auto', choices=['auto', 'hardlink', 'reflink', 'symlink', 'copy'])
+    command.add_argument('--orbits', nargs='*')
+    command.set_defaults(handler=cmd_extract)
+
+    command = commands.add_parser('process', help="preprocess filtered UV2 images")
+    command.add_argument('filtered_dir')
+    command.add_argument('processed_dir')
+    command.add_argument('--workers', type=int, default=os.cpu_count())
+    command.add_argument('--output-format', choices=['jpg', 'npy'], default='jpg')
+    command.add_argument('--batched', action='store_true')
+    command.add_argument('--orbits', nargs='*')
+    command.add_argument('--verbose', action='store_true')
+    command.set_defaults(handler=cmd_process)
+
+    command = commands.add_parser('detect', help="headless feature extraction into the feature store")
+    command.add_argument('processed_dir')
+    command.add_argument('--orbits', nargs='*')
+    command.add_argument('--store')
+    command.add_argument('--workers', type=int)
+    command.add_argument('--mode', choices=['single', 'pyramid'], default='single')
+    command.add_argument('--segmentation', choices=['exact', 'fast'], default='exact')
+    command.add_argument('--orbit-thresholds', action='store_true',
+                         help="one set of region thresholds per orbit instead of per frame")
+    command.set_defaults(handler=cmd_detect)
+
+    command = commands.add_parser('cubes', help="co-registered UV2/VI2/N12/N22 cubes per orbit")
+    command.add_argument('raw_dir')
+    command.add_argument('output_dir')
+    command.add_argument('--index', action='store_true', help="take START_TIMEs from the product index")
+    command.add_argument('--tolerance', type=float, default=30.0, help="max START_TIME difference in seconds")
+    command.add_argument('--require-all', action='store_true', help="only cubes with all four filters")
+    command.add_argument('--no-register', action='store_true', help="skip sub-pixel co-registration")
+    command.add_argument('--orbits', nargs='*')
+    command.add_argument('--workers', type=int)
+    command.set_defaults(handler=cmd_cubes)
+
+    command = commands.add_parser('tracks', help="link stored blobs or region components into tracks")
+    command.add_argument('store', help="feature store written by detect")
+    command.add_argument('--labels', help="directory of UV2 labels to take START_TIMEs from")
+    command.add_argument('--index', action='store_true', help="read START_TIMEs from the product index of --labels")
+    command.add_argument('--kind', choices=['blobs', 'components'], default='blobs')
+    command.add_argument('--orbit')
+    command.add_argument('--max-distance', type=float, default=20.0, help="pixels")
+    command.add_argument('--max-gap', type=float, default=3600.0, help="seconds")
+    command.set_defaults(handler=cmd_tracks)
+
+    command = commands.add_parser('stats', help="per-orbit and mission image statistics and anomaly frames")
+    command.add_argument('processed_dir')
+    command.add_argument('output_dir')
+    command.add_argument('--orbits', nargs='*')
+    command.add_argument('--workers', type=int)
+    command.add_argument('--median-bins', type=int, default=16, help="per-pixel histogram bins (0 = no median map)")
+    command.add_argument('--force', action='store_true', help="recompute orbits that are up to date")
+    command.set_defaults(handler=cmd_stats)
+
+    command = commands.add_parser('quicklook', help="refresh cached thumbnails and per-orbit contact sheets")
+    command.add_argument('base_dir')
+    command.add_argument('cache_dir')
+    command.add_argument('--pattern', default='*')
+    command.add_argument('--orbits', nargs='*')
+    command.add_argument('--size', type=int, default=256)
+    command.add_argument('--columns', type=int, default=10)
+    command.set_defaults(handler=cmd_quicklook)
+
+    command = commands.add_parser('pipeline', help="download -> extract -> process -> detect (see vmc_pipeline.py -h)")
+    command.add_argument('pipeline_args', nargs=argparse.REMAINDER)
+    command.set_defaults(handler=cmd_pipeline)
+
+    command = commands.add_parser('import-times', help="measure module import and CLI startup times")
+    command.add_argument('--repeats', type=int, default=5)
+    command.set_defaults(handler=cmd_import_times)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    if args.metrics:
+        import vmc_metrics
+        with vmc_metrics.recording(args.metrics):
+            args.handler(args)
+    else:
+        args.handler(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,221 @@
+import os
+import json
+import queue
+import hashlib
+import threading
+import numpy as np
+from pathlib import Path
+
+from vmc_feature_detector import VMCFeatureDetector
+
+SPLITS = ('train', 'val', 'test')
+
+def orbit_split(orbit, fractions=(0.7, 0.15, 0.15), seed=0):
+    """Deterministic split for an orbit from a hash of (seed, orbit)"""
+    digest = hashlib.sha256(f"{seed}:{orbit}".encode()).digest()
+    u = int.from_bytes(digest[:8], 'big') / 2 ** 64
+    edges = np.cumsum(fractions) / sum(fractions)
+    return SPLITS[min(int(np.searchsorted(edges, u, side='right')), len(SPLITS) - 1)]
+
+def build_dataset(processed_dir, output_path, index=None, orbits=None, fractions=(0.7, 0.15, 0.15),
+                  seed=0, dtype='float32'):
+    """
+    Pack processed UV2 frames into one memory-mapped array plus a metadata index
+
+    Parameters:
+    processed_dir: directory of processed frames (npy or JPG)
+    output_path: path prefix; writes <prefix>.npy (N, H, W) and <prefix>.npz (metadata)
+    index: optional ProductIndex to copy START_TIME / EXPOSURE_DURATION / PRODUCT_ID from
+    orbits: optional subset of orbits
+    fractions: train/val/test fractions; the split is assigned per orbit so
+        frames of one orbit never leak across splits
+    dtype: 'float32' or 'uint16' (scaled 0-65535)
+
+    Frames are written grouped by split so each split is one contiguous
+    block of the array. Returns a dict with frame counts per split.
+    """
+    detector = VMCFeatureDetector(processed_dir)
+    frames = detector.find_images(orbits)
+    if not frames:
+        print("No processed frames found!")
+        return {}
+
+    # Group by split, keep time order inside each orbit
+    order = {split: i for i, split in enumerate(SPLITS)}
+    splits = {orbit: orbit_split(orbit, fractions, seed) for orbit in {f[0] for f in frames}}
+    frames.sort(key=lambda f: (order[splits[f[0]]], f[0], f[1]))
+
+    shape = np.asarray(detector.load_image(frames[0][0], frames[0][1])).shape
+    output_path = Path(output_path)
+    os.makedirs(output_path.parent, exist_ok=True)
+    tmp_path = output_path.with_name(output_path.name + '.npy.tmp')
+    data = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype, shape=(len(frames),) + shape)
+
+    metadata = {}
+    if index is not None:
+        for product in index.products(filter_type='UV2'):
+            metadata[(product['orbit'], product['name'])] = product
+
+    kept, skipped = [], []
+    for orbit, number, path in frames:
+        image = np.asarray(detector.load_image(orbit, number), dtype=np.float32)
+        if image.shape != shape:
+            skipped.append(str(path))
+            continue
+        if dtype == 'uint16':
+            data[len(kept)] = np.round(np.clip(image, 0, 1) * 65535)
+        else:
+            data[len(kept)] = image
+        kept.append((orbit, number, path))
+    data.flush()
+    del data
+
+    # Drop unused rows left by skipped frames
+    if skipped:
+        full = np.load(tmp_path, mmap_mode='r')
+        trimmed_path = output_path.with_name(output_path.name + '.trim.npy')
+        trimmed = np.lib.format.open_memmap(trimmed_path, mode='w+', dtype=dtype, shape=(len(kept),) + shape)
+        trimmed[:] = full[:len(kept)]
+        trimmed.flush()
+        del trimmed, full
+        os.replace(trimmed_path, tmp_path)
+    os.replace(tmp_path, output_path.with_suffix('.npy'))
+
+    names = [f"V{orbit}_{number:04d}_UV2" for orbit, number, _ in kept]
+    products = [metadata.get((orbit, name), {}) for (orbit, _, _), name in zip(kept, names)]
+    start_times = [product.get('start_time') for product in products]
+    np.savez(
+        output_path.with_suffix('.npz'),
+        orbit=np.array([f[0] for f in kept]),
+        image_number=np.array([f[1] for f in kept], dtype=np.int32),
+        split=np.array([splits[f[0]] for f in kept]),
+        path=np.array([str(f[2]) for f in kept]),
+        product_id=np.array([product.get('product_id') or name for product, name in zip(products, names)]),
+        start_time=np.array([np.datetime64(t) if t else np.datetime64('NaT') for t in start_times],
+                            dtype='datetime64[us]'),
+        exposure_duration=np.array([np.nan if product.get('exposure_duration') is None else product['exposure_duration']
+                                    for product in products]),
+        info=np.array(json.dumps({'fractions': list(fractions), 'seed': seed, 'dtype': dtype})),
+    )
+
+    counts = {split: sum(splits[f[0]] == split for f in kept) for split in SPLITS}
+    print(f"\nDataset written to {output_path.with_suffix('.npy')}: {len(kept)} frames of {shape}")
+    for split, count in counts.items():
+        print(f"  {split}: {count} frames")
+    if skipped:
+        print(f"  Skipped {len(skipped)} frames with a different shape")
+    return counts
+
+class StreamingLoader:
+    """Shuffling batch loader over a dataset written by build_dataset
+
+    shuffle='block' visits contiguous batch-sized blocks of the split in a
+    random order and yields memmap views (no copy). shuffle='full' samples
+    frames individually and gathers them into reused buffers. shuffle=None
+    reads in order. A background thread prepares up to `prefetch` batches
+    ahead, faulting their pages in from disk.
+    """
+    def __init__(self, dataset_path, split='train', batch_size=32, shuffle='block', seed=0,
+                 prefetch=2, drop_last=False):
+        dataset_path = Path(dataset_path)
+        self.data = np.load(dataset_path.with_suffix('.npy'), mmap_mode='r')
+        with np.load(dataset_path.with_suffix('.npz')) as meta:
+            self.metadata = {key: meta[key] for key in meta.files if key != 'info'}
+        selected = np.flatnonzero(self.metadata['split'] == split)
+        self.start = int(selected[0]) if len(selected) else 0
+        self.stop = int(selected[-1]) + 1 if len(selected) else 0
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.seed = seed
+        self.prefetch = prefetch
+        self.drop_last = drop_last
+        self.epoch = 0
+
+    def __len__(self):
+        n = self.stop - self.start
+        return n // self.batch_size if self.drop_last else -(-n // self.batch_size)
+
+    def _batches(self, rng):
+        """Yield index arrays (or slices) for one epoch"""
+        starts = np.arange(self.start, self.stop, self.batch_size)
+        if self.drop_last:
+            starts = starts[starts + self.batch_size <= self.stop]
+
+        if self.shuffle == 'full':
+            order = rng.permutation(np.arange(self.start, self.stop))
+            for i in range(len(starts)):
+                yield np.sort(order[i * self.batch_size:(i + 1) * self.batch_size])
+            return
+
+        if self.shuffle == 'block':
+            starts = rng.permutation(starts)
+        for start in starts:
+            yield slice(int(start), int(min(start + self.batch_size, self.stop)))
+
+    def _load(self, selection, buffers):
+        """Materialize one batch: a view for slices, a reused buffer for index arrays"""
+        if isinstance(selection, slice):
+            batch = self.data[selection]
+            # Touch one value per page so the data is read ahead of use
+            batch.reshape(len(batch), -1)[:, ::1024].max()
+            index = np.arange(selection.start, selection.stop)
+        else:
+            buffer = buffers.pop(0)[:len(selection)]
+            np.take(self.data, selection, axis=0, out=buffer)
+            batch = buffer
+            buffers.append(buffer.base if buffer.base is not None else buffer)
+            index = selection
+        return batch, {key: values[index] for key, values in self.metadata.items()}
+
+    def __iter__(self):
+        """Yield (images, metadata) batches for one epoch; the next epoch reshuffles"""
+        rng = np.random.default_rng([self.seed, self.epoch])
+        self.epoch += 1
+
+        # Rotating gather buffers: one per queued batch plus the one in use
+        buffers = []
+        if self.shuffle == 'full':
+            buffers = [np.empty((self.batch_size,) + self.data.shape[1:], dtype=self.data.dtype)
+                       for _ in range(self.prefetch + 2)]
+
+        batches = queue.Queue(maxsize=max(1, self.prefetch))
+        done = object()
+        stop = threading.Event()
+
+        def producer():
+            try:
+                for selection in self._batches(rng):
+                    if stop.is_set():
+                        return
+                    batches.put(self._load(selection, buffers))
+            except Exception as e:
+                batches.put(e)
+            batches.put(done)
+
+        thread = threading.Thread(target=producer, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = batches.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            # Unblock the producer if the consumer stopped early
+            while thread.is_alive():
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    thread.join(timeout=0.01)
+
+if __name__ == "__main__":
+    from vmc_product_index import open_index
+
+    raw_dir = "/Users/n_welikala/cvprojects/venus/data/vmc/raw"
+    processed_dir = "/Users/n_welikala/cvprojects/venus/data/vmc/processed/uv2"
+    dataset_path = "/Users/n_welikala/cvprojects/venus/data/vmc/datasets/uv2"
+
+    build_dataset(processed_dir, dataset_path, index=open_index(raw_dir))
@@ -0,0 +1,64 @@
+import io
+import shutil
+import tempfile
+import argparse
+from contextlib import redirect_stdout
+
+from vmc_downloader import VenusExpressDownloader
+from vmc_synthetic import make_synthetic_browse_tree, serve_directory
+
+def run_download(base_url, output_dir, concurrent, max_workers, requests_per_second, max_per_host):
+    """Download the whole served tree once and return the throughput report"""
+    downloader = VenusExpressDownloader(base_url=base_url, base_output_dir=output_dir,
+                                        max_workers=max_workers,
+                                        requests_per_second=requests_per_second,
+                                        max_per_host=max_per_host)
+    # Silence the per-file log lines
+    with redirect_stdout(io.StringIO()):
+        if concurrent:
+            downloader.download_all()
+        else:
+            downloader.stats.reset()
+            for directory in downloader.get_orbit_directories():
+                downloader.download_orbit_data(directory)
+    return downloader.stats.report()
+
+def benchmark_downloads(n_orbits=5, pairs_per_orbit=20, jpg_bytes=60000, latency=0.02,
+                        max_workers=8, requests_per_second=0, max_per_host=8):
+    """Compare sequential and concurrent downloads against a local HTTP stand-in"""
+    work_dir = tempfile.mkdtemp(prefix="vmc_dl_bench_")
+    try:
+        remote = make_synthetic_browse_tree(f"{work_dir}/remote", n_orbits, pairs_per_orbit, jpg_bytes)
+        server, base_url = serve_directory(remote, latency=latency)
+        try:
+            results = {}
+            for label, concurrent in (('sequential', False), ('concurrent', True)):
+                results[label] = run_download(base_url, f"{work_dir}/{label}", concurrent,
+                                              max_workers, requests_per_second, max_per_host)
+        finally:
+            server.shutdown()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    print("\nDownload Benchmark:")
+    print("-" * 50)
+    for label, report in results.items():
+        print(f"{label:>10}: {report['files']} files in {report['seconds']:.2f} s "
+              f"({report['files_per_second']:.1f} files/s, {report['mb_per_second']:.2f} MB/s)")
+    speedup = results['sequential']['seconds'] / results['concurrent']['seconds']
+    print(f"Speedup: {speedup:.1f}x")
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the VMC downloader against a local server")
+    parser.add_argument('--orbits', type=int, default=5)
+    parser.add_argument('--pairs', type=int, default=20)
+    parser.add_argument('--jpg-bytes', type=int, default=60000)
+    parser.add_argument('--latency', type=float, default=0.02, help="seconds added to every request")
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--rps', type=float, default=0, help="requests per second budget (0 = unlimited)")
+    parser.add_argument('--per-host', type=int, default=8)
+    args = parser.parse_args()
+
+    benchmark_downloads(args.orbits, args.pairs, args.jpg_bytes, args.latency,
+                        args.workers, args.rps, args.per_host)
@@ -6,27 +6,172 @@
 
 # venus_downloader.py
 import os
-import requests
-from urllib.parse import urljoin
+from urllib.parse import urljoin, urlparse
 import re
 import time
-from typing import List, Tuple
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+from vmc_manifest import TransferManifest
+from vmc_listing_cache import ListingCache
+import vmc_metrics
+from vmc_lazy import lazy_import
+
+# requests is only loaded once a downloader is created (list_downloaded_files does not need it)
+requests = lazy_import('requests')
+HTTPAdapter = lazy_import('requests.adapters', 'HTTPAdapter')
+
+
+class RateLimiter:
+    """Token bucket shared by every thread that talks to the server"""
+    def __init__(self, requests_per_second: float, burst: int = 1):
+        self.rate = requests_per_second
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def acquire(self):
+        """Block until one request may be sent"""
+        if not self.rate:
+            return  # Unlimited
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class TransferStats:
+    """Thread-safe throughput counters for a download run"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self.lock:
+            self.start = time.monotonic()
+            self.files = 0
+            self.skipped = 0
+            self.errors = 0
+            self.bytes = 0
+    
+    def add(self, files: int = 0, skipped: int = 0, errors: int = 0, nbytes: int = 0):
+        with self.lock:
+            self.files += files
+            self.skipped += skipped
+            self.errors += errors
+            self.bytes += nbytes
+        vmc_metrics.count('download.files', files)
+        vmc_metrics.count('download.skipped', skipped)
+        vmc_metrics.count('download.errors', errors)
+        vmc_metrics.count('download.bytes_in', nbytes)
+    
+    def report(self) -> Dict[str, float]:
+        """Return a snapshot of the counters and derived rates"""
+        with self.lock:
+            elapsed = max(time.monotonic() - self.start, 1e-9)
+            return {
+                'files': self.files,
+                'skipped': self.skipped,
+                'errors': self.errors,
+                'bytes': self.bytes,
+                'seconds': elapsed,
+                'files_per_second': self.files / elapsed,
+                'mb_per_second': self.bytes / elapsed / 1e6,
+            }
 
 class VenusExpressDownloader:
     def __init__(self, base_url: str = "https://archives.esac.esa.int/psa/ftp/VENUS-EXPRESS/VMC/VEX-V-VMC-3-RDR-EXT1-V3.0/BROWSE/",
-                 base_output_dir: str = "/Users/n_welikala/cvprojects/venus/data/vmc/raw"):
+                 base_output_dir: str = "/Users/n_welikala/cvprojects/venus/data/vmc/raw",
+                 max_workers: int = 8, requests_per_second: float = 4.0, max_per_host: int = 4,
+                 manifest_path: Optional[str] = None, verify: bool = False,
+                 listing_cache_path: Optional[str] = None, listing_ttl: float = 24 * 3600):
         self.base_url = base_url
         self.base_output_dir = base_output_dir
+        self.manifest_path = manifest_path
+        self.verify = verify
+        self._manifest = None
+        self.listing_cache_path = listing_cache_path
+        self.listing_ttl = listing_ttl
+        self._listing_cache = None
+        self.max_workers = max_workers
+        self.max_per_host = max_per_host
+        
+        # One connection pool shared by all worker threads
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max(1, max_per_host), pool_maxsize=max(1, max_workers))
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        
+        # Global request budget replaces the old per-pair sleep
+        self.rate_limiter = RateLimiter(requests_per_second, burst=max(1, max_per_host))
+        self.host_slots = {}
+        self.host_lock = threading.Lock()
+        self.stats = TransferStats()
+    
+    @contextmanager
+    def _host_slot(self, url: str):
+        """Cap concurrent connections per host and apply the request budget"""
+        host = urlparse(url).netloc
+        with self.host_lock:
+            slot = self.host_slots.get(host)
+            if slot is None:
+                slot = threading.BoundedSemaphore(max(1, self.max_per_host))
+                self.host_slots[host] = slot
+        # Time spent queuing for a connection slot and the request budget
+        with vmc_metrics.timer('download.wait'):
+            slot.acquire()
+            self.rate_limiter.acquire()
+        try:
+            yield
+        finally:
+            slot.release()
+    
+    def _get(self, url: str, **kwargs) -> 'requests.Response':
+        """Rate-limited GET for small (non-streamed) responses"""
+        with self._host_slot(url):
+            return self.session.get(url, **kwargs)
+    
+    @property
+    def listing_cache(self) -> ListingCache:
+        """Directory-listing cache, opened on first use"""
+        if self._listing_cache is None:
+            path = self.listing_cache_path or os.path.join(self.base_output_dir, '.listing_cache.sqlite')
+            self._listing_cache = ListingCache(path, ttl=self.listing_ttl)
+        return self._listing_cache
+    
+    @vmc_metrics.timed('download.listing')
+    def _get_listing(self, url: str) -> str:
+        """Return a listing page from the cache, revalidating it once the TTL expires"""
+        entry = self.listing_cache.get(url)
+        if self.listing_cache.is_fresh(entry):
+            return entry['body']
+        
+        response = self._get(url, headers=self.listing_cache.conditional_headers(entry))
+        if response.status_code == 304 and entry:
+            self.listing_cache.touch(url)
+            return entry['body']
+        
+        response.raise_for_status()
+        self.listing_cache.put(url, response.text, response.headers.get('ETag'),
+                               response.headers.get('Last-Modified'))
+        return response.text
     
     def get_orbit_directories(self) -> List[str]:
         """Get list of orbit directories (e.g., 0550/, 0551/, etc.)"""
         try:
-            response = self.session.get(self.base_url)
-            response.raise_for_status()
+            listing = self._get_listing(self.base_url)
             
             dir_pattern = r'href="(\d{4}/)"'
-            directories = re.findall(dir_pattern, response.text)
+            directories = re.findall(dir_pattern, listing)
             
             return sorted(directories)
             
@@ -38,19 +183,19 @@ class VenusExpressDownloader:
         """Get pairs of JPG and LBL files in a directory"""
         url = urljoin(self.base_url, directory)
         try:
-            response = self.session.get(url)
-            response.raise_for_status()
+            listing = self._get_listing(url)
             
             jpg_pattern = r'href="([^"]+\.JPG)"'
             lbl_pattern = r'href="([^"]+\.LBL)"'
             
-            jpg_files = re.findall(jpg_pattern, response.text)
-            lbl_files = re.findall(lbl_pattern, response.text)
+            jpg_files = re.findall(jpg_pattern, listing)
+            lbl_files = re.findall(lbl_pattern, listing)
             
+            # Pair by base name with a dict lookup instead of scanning lbl_files per JPG
+            lbl_by_base = {os.path.splitext(lbl)[0]: lbl for lbl in lbl_files}
             pairs = []
             for jpg in jpg_files:
-                base_name = os.path.splitext(jpg)[0]
-                matching_lbl = next((lbl for lbl in lbl_files if os.path.splitext(lbl)[0] == base_name), None)
+                matching_lbl = lbl_by_base.get(os.path.splitext(jpg)[0])
                 if matching_lbl:
                     pairs.append((jpg, matching_lbl))
             
@@ -60,27 +205,147 @@ class VenusExpressDownloader:
             print(f"Error fetching files in directory {directory}: {e}")
             return []
     
+    @property
+    def manifest(self) -> TransferManifest:
+        """Transfer manifest, opened on first use"""
+        if self._manifest is None:
+            path = self.manifest_path or os.path.join(self.base_output_dir, '.transfer_manifest.sqlite')
+            self._manifest = TransferManifest(path)
+        return self._manifest
+    
+    def _is_complete(self, entry: Optional[dict], output_path: str) -> bool:
+        """Trust the manifest when the final file is present with the recorded size"""
+        if not entry or not entry['complete'] or not os.path.exists(output_path):
+            return False
+        return os.path.getsize(output_path) == (entry['expected_size'] or entry['bytes_written'])
+    
+    @vmc_metrics.timed('download.file')
     def download_file(self, directory: str, filename: str, output_dir: str) -> bool:
-        """Download a single file"""
+        """Download a single file, resuming partial transfers
+        
+        Data is written to ``<name>.part`` and renamed into place only once the
+        byte count matches the server's size. Completed files recorded in the
+        manifest are skipped without contacting the server unless
+        ``self.verify`` is set, in which case a conditional GET checks them.
+        """
         url = urljoin(self.base_url + directory, filename)
         output_path = os.path.join(output_dir, filename)
+        part_path = output_path + '.part'
         
-        if os.path.exists(output_path):
+        entry = self.manifest.get(url)
+        complete = self._is_complete(entry, output_path)
+        if complete and not self.verify:
             print(f"Skipping existing file: {filename}")
+            self.stats.add(skipped=1)
             return True
         
+        if not complete and os.path.exists(output_path) and not os.path.exists(part_path):
+            # Unverified file from an older run: treat it as a partial transfer
+            os.replace(output_path, part_path)
+        
+        headers = {}
+        offset = 0
+        if complete:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        elif os.path.exists(part_path):
+            offset = os.path.getsize(part_path)
+            if offset:
+                headers['Range'] = f"bytes={offset}-"
+                validator = entry and (entry['etag'] or entry['last_modified'])
+                if validator:
+                    headers['If-Range'] = validator
+        
         try:
-            response = self.session.get(url, stream=True)
-            response.raise_for_status()
-            
-            with open(output_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            # Hold the host slot until the body is fully read
+            nbytes = 0
+            restart = verified = False
+            with self._host_slot(url):
+                with self.session.get(url, stream=True, headers=headers) as response:
+                    if response.status_code == 304:
+                        print(f"Up to date: {filename}")
+                        self.stats.add(skipped=1)
+                        return True
                     
+                    if response.status_code == 416 and offset:
+                        # Range starts at or past the end of the file. The partial is only complete
+                        # if the server's size equals it and the file has not changed since.
+                        total = response.headers.get('Content-Range', '').rsplit('/', 1)[-1]
+                        if validator:
+                            etag, last_modified = entry['etag'], entry['last_modified']
+                            unchanged = (etag and response.headers.get('ETag') == etag) or \
+                                (last_modified and response.headers.get('Last-Modified') == last_modified)
+                        else:
+                            # File from a run before the manifest: nothing to compare but the size
+                            etag = response.headers.get('ETag')
+                            last_modified = response.headers.get('Last-Modified')
+                            if not total.isdigit():
+                                head = self.session.head(url)
+                                total = head.headers.get('Content-Length', '') if head.ok else ''
+                                etag = head.headers.get('ETag', etag)
+                                last_modified = head.headers.get('Last-Modified', last_modified)
+                            unchanged = True
+                        if not (total.isdigit() and int(total) == offset and unchanged):
+                            restart = True
+                        else:
+                            verified = True
+                            expected_size = offset
+                            self.manifest.start(url, output_path, expected_size, etag, last_modified, offset)
+                    else:
+                        response.raise_for_status()
+                        
+                        etag = response.headers.get('ETag')
+                        last_modified = response.headers.get('Last-Modified')
+                        if response.status_code == 206:
+                            content_range = response.headers.get('Content-Range', '')
+                            total = content_range.rsplit('/', 1)[-1]
+                            expected_size = int(total) if total.isdigit() else None
+                            mode = 'ab'
+                        else:
+                            # Full body: server ignored Range or the file changed
+                            length = response.headers.get('Content-Length')
+                            expected_size = int(length) if length and length.isdigit() else None
+                            offset = 0
+                            mode = 'wb'
+                        
+                        self.manifest.start(url, output_path, expected_size, etag, last_modified, offset)
+                        try:
+                            with open(part_path, mode) as f:
+                                for chunk in response.iter_content(chunk_size=65536):
+                                    f.write(chunk)
+                                    nbytes += len(chunk)
+                        finally:
+                            self.manifest.progress(url, offset + nbytes)
+            
+            if restart:
+                # Oversized or stale partial: discard it and fetch the whole file
+                print(f"Discarding unverifiable partial download of {filename}")
+                os.remove(part_path)
+                self.manifest.invalidate(url)
+                return self.download_file(directory, filename, output_dir)
+            
+            size = os.path.getsize(part_path)
+            if expected_size is not None and size != expected_size:
+                self.stats.add(errors=1)
+                print(f"Incomplete download of {filename}: {size}/{expected_size} bytes")
+                return False
+            
+            # Atomic move into place, then mark complete
+            os.replace(part_path, output_path)
+            self.manifest.complete(url, size)
+            
+            if verified:
+                self.stats.add(skipped=1)
+                print(f"Verified existing file: {filename}")
+                return True
+            self.stats.add(files=1, nbytes=nbytes)
             print(f"Downloaded: {filename}")
             return True
             
-        except requests.RequestException as e:
+        except (requests.RequestException, OSError) as e:
+            self.stats.add(errors=1)
             print(f"Error downloading {filename}: {e}")
             return False
     
@@ -95,32 +360,83 @@ class VenusExpressDownloader:
         
         success_count = 0
         for jpg, lbl in pairs:
+            # Pacing is handled by the shared rate limiter
             if self.download_file(directory, jpg, output_dir):
                 if self.download_file(directory, lbl, output_dir):
                     success_count += 1
-            
-            time.sleep(0.5)  # Be nice to the server
         
         return success_count
+    
+    def _download_pair(self, directory: str, jpg: str, lbl: str, output_dir: str) -> bool:
+        """Download one JPG/LBL pair (used by the concurrent engine)"""
+        jpg_ok = self.download_file(directory, jpg, output_dir)
+        lbl_ok = self.download_file(directory, lbl, output_dir)
+        return jpg_ok and lbl_ok
+    
+    def download_all(self, directories: Optional[List[str]] = None, max_pairs: int = None,
+                     max_workers: int = None) -> Dict[str, int]:
+        """Download many orbits concurrently across orbits and files
+        
+        Directory listings and file transfers share one thread pool, so
+        orbit N+1 is being listed while files of orbit N are still in flight.
+        Returns the number of complete pairs per orbit directory.
+        """
+        if directories is None:
+            directories = self.get_orbit_directories()
+        workers = max_workers or self.max_workers
+        self.stats.reset()
+        
+        counts = {directory: 0 for directory in directories}
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            listings = {pool.submit(self.get_files_in_directory, d): d for d in directories}
+            transfers = {}
+            for future in as_completed(listings):
+                directory = listings[future]
+                pairs = future.result()
+                if max_pairs:
+                    pairs = pairs[:max_pairs]
+                output_dir = os.path.join(self.base_output_dir, directory.strip('/'))
+                os.makedirs(output_dir, exist_ok=True)
+                for jpg, lbl in pairs:
+                    transfers[pool.submit(self._download_pair, directory, jpg, lbl, output_dir)] = directory
+            
+            for future in as_completed(transfers):
+                if future.result():
+                    counts[transfers[future]] += 1
+        
+        report = self.stats.report()
+        print(f"\nDownloaded {report['files']} files ({report['bytes'] / 1e6:.1f} MB) "
+              f"in {report['seconds']:.1f} s: {report['files_per_second']:.1f} files/s, "
+              f"{report['mb_per_second']:.2f} MB/s, {report['skipped']} skipped, {report['errors']} errors")
+        return counts
 
-def list_downloaded_files(base_dir):
-    """List all downloaded files and count them"""
+def list_downloaded_files(base_dir, index=None):
+    """List all downloaded files and count them
+    
+    If a ProductIndex is given the counts come from the index instead of
+    walking base_dir.
+    """
     total_jpg = 0
     total_lbl = 0
     
+    if index is not None:
+        orbit_counts = index.file_counts_by_orbit()
+    else:
+        orbit_counts = []
+        for root, dirs, files in os.walk(base_dir):
+            jpg_count = len([f for f in files if f.endswith('.JPG')])
+            lbl_count = len([f for f in files if f.endswith('.LBL')])
+            if jpg_count or lbl_count:
+                orbit_counts.append((os.path.basename(root), jpg_count, lbl_count))
+    
     print("\nDownloaded files by orbit:")
-    for root, dirs, files in os.walk(base_dir):
-        jpg_files = [f for f in files if f.endswith('.JPG')]
-        lbl_files = [f for f in files if f.endswith('.LBL')]
-        
-        if jpg_files or lbl_files:
-            orbit = os.path.basename(root)
-            print(f"\nOrbit {orbit}:")
-            print(f"  JPG files: {len(jpg_files)}")
-            print(f"  LBL files: {len(lbl_files)}")
-            
-            total_jpg += len(jpg_files)
-            total_lbl += len(lbl_files)
+    for orbit, jpg_count, lbl_count in orbit_counts:
+        print(f"\nOrbit {orbit}:")
+        print(f"  JPG files: {jpg_count}")
+        print(f"  LBL files: {lbl_count}")
+        
+        total_jpg += jpg_count
+        total_lbl += lbl_count
     
     print(f"\nTotal files downloaded:")
     print(f"Total JPG files: {total_jpg}")
@@ -1,72 +1,351 @@
+import re
+import time
 import numpy as np
 from pathlib import Path
-import matplotlib.pyplot as plt
-from skimage import feature, filters, segmentation, color, morphology
-from skimage.feature import blob_dog
-import cv2
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from vmc_lazy import lazy_import
+from vmc_array_store import load_array
+from vmc_feature_store import FeatureStore
+import vmc_metrics
+
+# Heavy imports are deferred until a frame is actually analyzed or plotted
+plt = lazy_import('matplotlib.pyplot')
+feature = lazy_import('skimage.feature')
+filters = lazy_import('skimage.filters')
+color = lazy_import('skimage.color')
+morphology = lazy_import('skimage.morphology')
+blob_dog = lazy_import('skimage.feature', 'blob_dog')
+cKDTree = lazy_import('scipy.spatial', 'cKDTree')
+cv2 = lazy_import('cv2')
+ndimage = lazy_import('scipy.ndimage')
+
+FRAME_PATTERN = re.compile(r'proc_V(\d{4})_(\d{4})_UV2\.(npy|JPG)$')
+
+class ImagePyramid:
+    """Gaussian pyramid of one frame, built lazily and shared by the detectors"""
+    def __init__(self, image, max_levels=4):
+        self.levels = [np.ascontiguousarray(image, dtype=np.float32)]
+        self.max_levels = max_levels
+    
+    def level(self, k):
+        """Image at pyramid level k (level k has 1/2**k the resolution)"""
+        while len(self.levels) <= k:
+            self.levels.append(cv2.pyrDown(self.levels[-1]))
+        return self.levels[k]
+
+def _circle_overlap(d, r1, r2):
+    """Fraction of the smaller circle covered by the other one"""
+    if d >= r1 + r2:
+        return 0.0
+    if d <= abs(r1 - r2):
+        return 1.0
+    a1 = r1 ** 2 * np.arccos((d ** 2 + r1 ** 2 - r2 ** 2) / (2 * d * r1))
+    a2 = r2 ** 2 * np.arccos((d ** 2 + r2 ** 2 - r1 ** 2) / (2 * d * r2))
+    a3 = 0.5 * np.sqrt((-d + r1 + r2) * (d + r1 - r2) * (d - r1 + r2) * (d + r1 + r2))
+    return (a1 + a2 - a3) / (np.pi * min(r1, r2) ** 2)
+
+# Columns of the per-component arrays returned by region_components
+COMPONENT_COLUMNS = ('label', 'area', 'cy', 'cx', 'mean_brightness', 'y0', 'x0', 'height', 'width')
+
+def region_components(image, regions, min_area=50):
+    """
+    Connected components of every segmentation class as one compact float32 array
+
+    Returns an (N, 9) array with the COMPONENT_COLUMNS: class label, pixel
+    area, centroid, mean brightness of the image under the component and
+    its bounding box. Components smaller than min_area pixels are dropped.
+    """
+    image = np.asarray(image, dtype=np.float32)
+    rows = []
+    for label in np.unique(regions):
+        mask = (regions == label).astype(np.uint8)
+        n, components, stats, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+        sums = np.bincount(components.ravel(), weights=image.ravel(), minlength=n)
+        # Component 0 is everything outside the mask
+        keep = np.flatnonzero(stats[1:, cv2.CC_STAT_AREA] >= min_area) + 1
+        if not len(keep):
+            continue
+        area = stats[keep, cv2.CC_STAT_AREA]
+        rows.append(np.column_stack([
+            np.full(len(keep), label), area, centroids[keep, 1], centroids[keep, 0], sums[keep] / area,
+            stats[keep, cv2.CC_STAT_TOP], stats[keep, cv2.CC_STAT_LEFT],
+            stats[keep, cv2.CC_STAT_HEIGHT], stats[keep, cv2.CC_STAT_WIDTH],
+        ]))
+    if not rows:
+        return np.empty((0, len(COMPONENT_COLUMNS)), dtype=np.float32)
+    return np.vstack(rows).astype(np.float32)
+
+def prune_blobs(blobs, overlap=0.5):
+    """Drop the smaller of any two (y, x, sigma) blobs overlapping by more than `overlap`"""
+    if len(blobs) < 2:
+        return blobs
+    radii = blobs[:, 2] * np.sqrt(2)
+    tree = cKDTree(blobs[:, :2])
+    keep = np.ones(len(blobs), dtype=bool)
+    for i, j in sorted(tree.query_pairs(2 * radii.max())):
+        if not (keep[i] and keep[j]):
+            continue
+        d = np.hypot(*(blobs[i, :2] - blobs[j, :2]))
+        if _circle_overlap(d, radii[i], radii[j]) > overlap:
+            keep[i if radii[i] < radii[j] else j] = False
+    return blobs[keep]
 
 class VMCFeatureDetector:
-    def __init__(self, processed_dir):
+    def __init__(self, processed_dir, mode='single', max_edge_sigma=3.0, segmentation='exact',
+                 quantize='uint8', region_thresholds=None):
+        """
+        Parameters:
+        processed_dir: directory of per-orbit processed frames
+        mode: 'single' (full-resolution detectors) or 'pyramid' (large scales on
+            downsampled levels, small scales at full resolution)
+        max_edge_sigma: largest Canny sigma run at full resolution in pyramid mode;
+            larger sigmas run on a downsampled level
+        segmentation: 'exact' (float median over disk(3), multi-Otsu per frame) or
+            'fast' (quantized histogram median and multi-Otsu on a 256-bin histogram)
+        quantize: 'uint8' or 'uint16' input for the fast segmentation
+        region_thresholds: orbit -> three 0-1 thresholds reused instead of
+            running multi-Otsu on every frame (see orbit_thresholds)
+        """
         self.processed_dir = Path(processed_dir)
+        self.mode = mode
+        self.max_edge_sigma = max_edge_sigma
+        self.segmentation = segmentation
+        self.quantize = quantize
+        self.region_thresholds = dict(region_thresholds or {})
+    
+    def build_pyramid(self, image):
+        """Pyramid to share between the detectors, or None in single-scale mode"""
+        return ImagePyramid(image) if self.mode == 'pyramid' else None
     
     def load_image(self, orbit, image_number):
-        """Load a processed image and convert to grayscale"""
-        image_path = self.processed_dir / orbit / f"proc_V{orbit}_{image_number:04d}_UV2.JPG"
-        # Read image and convert to grayscale if it's RGB
-        image = plt.imread(image_path)
-        if len(image.shape) == 3:  # If image is RGB
-            image = color.rgb2gray(image)
-        return image
-    
-    def detect_edges(self, image):
+        """Load a processed image and convert to grayscale
+        
+        Lossless .npy outputs are preferred when present; float32 arrays are
+        memory-mapped without a copy or colour conversion.
+        """
+        with vmc_metrics.timer('detect.load'):
+            array_path = self.processed_dir / orbit / f"proc_V{orbit}_{image_number:04d}_UV2.npy"
+            if array_path.exists():
+                return load_array(array_path)
+            
+            image_path = self.processed_dir / orbit / f"proc_V{orbit}_{image_number:04d}_UV2.JPG"
+            # Read image and convert to grayscale if it's RGB
+            image = plt.imread(image_path)
+            if len(image.shape) == 3:  # If image is RGB
+                image = color.rgb2gray(image)
+            return image
+    
+    def detect_edges(self, image, pyramid=None):
         """Detect cloud edges using Canny edge detection"""
         # Compute automatic sigma based on image statistics
         sigma = np.std(image) * 2
+        if pyramid is not None and sigma > self.max_edge_sigma:
+            return self._detect_edges_pyramid(pyramid, sigma)
         
         # Apply Canny edge detection
-        edges = feature.canny(
-            image,
-            sigma=sigma,
-            low_threshold=0.1,
-            high_threshold=0.3
-        )
+        with vmc_metrics.timer('detect.canny'):
+            edges = feature.canny(
+                image,
+                sigma=sigma,
+                low_threshold=0.1,
+                high_threshold=0.3
+            )
         return edges
     
-    def detect_blobs(self, image):
+    def _detect_edges_pyramid(self, pyramid, sigma, low_threshold=0.1, high_threshold=0.3):
+        """Canny with a large sigma, smoothing on the coarsest level where sigma / 2**k <= max_edge_sigma
+        
+        The bulk of the Gaussian runs on level k (after the blur pyrDown already
+        applied), the result is upsampled and Canny with sigma 2**k / 2 finishes
+        the smoothing (which also removes interpolation artefacts), so
+        gradients, non-maximum suppression and hysteresis still run at full
+        resolution and edges stay one pixel wide.
+        """
+        level = min(int(np.ceil(np.log2(sigma / self.max_edge_sigma))), pyramid.max_levels - 1)
+        scale = 2 ** level
+        # pyrDown's 5-tap kernel has sigma 1 at the resolution it is applied to
+        pyramid_blur = np.sqrt(sum(4 ** i for i in range(level))) / scale
+        final_sigma = max(1.0, scale / 2)
+        level_sigma = np.sqrt(max((sigma ** 2 - final_sigma ** 2) / scale ** 2 - pyramid_blur ** 2, 0))
+        with vmc_metrics.timer('detect.canny', level=level):
+            smoothed = ndimage.gaussian_filter(pyramid.level(level), level_sigma, mode='nearest')
+            height, width = pyramid.levels[0].shape
+            # pyrDown keeps pixel i of level k at full-resolution pixel i * 2**k (cv2.resize
+            # would assume half-pixel centres and shift the edges by (2**k - 1) / 2 pixels)
+            inverse = np.array([[1 / scale, 0, 0], [0, 1 / scale, 0]])
+            smoothed = cv2.warpAffine(smoothed, inverse, (width, height),
+                                      flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REPLICATE)
+            return feature.canny(smoothed, sigma=final_sigma, low_threshold=low_threshold,
+                                 high_threshold=high_threshold)
+    
+    def detect_blobs(self, image, pyramid=None):
         """Detect blob-like cloud features"""
-        blobs = blob_dog(
-            image,
-            min_sigma=3,
-            max_sigma=30,
-            threshold=.1
-        )
+        if pyramid is not None:
+            return self._detect_blobs_pyramid(pyramid, min_sigma=3, max_sigma=30, threshold=.1)
+        
+        with vmc_metrics.timer('detect.blob_dog'):
+            blobs = blob_dog(
+                image,
+                min_sigma=3,
+                max_sigma=30,
+                threshold=.1
+            )
         return blobs
     
-    def detect_regions(self, image):
-        """Segment image into regions using multiple thresholds"""
-        # Apply median filter to reduce noise
-        smoothed = filters.median(image, morphology.disk(3))
+    def _detect_blobs_pyramid(self, pyramid, min_sigma, max_sigma, threshold):
+        """blob_dog over one octave of sigma per pyramid level
+        
+        Level k covers sigma in [min_sigma, 2 * min_sigma) * 2**k, so only the
+        smallest scales are searched at full resolution. Coordinates and sigmas
+        are mapped back to full resolution and overlapping detections from
+        neighbouring levels are pruned.
+        """
+        found = []
+        level = 0
+        while level < pyramid.max_levels and min_sigma * 2 ** level <= max_sigma:
+            scale = 2 ** level
+            last = level + 1 == pyramid.max_levels or min_sigma * 2 ** (level + 1) > max_sigma
+            high = max_sigma / scale if last else 2 * min_sigma * (1 - 1e-6)
+            with vmc_metrics.timer('detect.blob_dog', level=level):
+                blobs = blob_dog(pyramid.level(level), min_sigma=min_sigma, max_sigma=max(high, min_sigma),
+                                 threshold=threshold)
+            if len(blobs):
+                blobs = blobs.astype(float)
+                blobs *= scale
+                found.append(blobs)
+            level += 1
+        
+        if not found:
+            return np.empty((0, 3))
+        with vmc_metrics.timer('detect.prune_blobs'):
+            return prune_blobs(np.vstack(found))
+    
+    def detect_regions(self, image, pyramid=None, thresholds=None):
+        """Segment image into regions using multiple thresholds
+        
+        thresholds: optional three 0-1 thresholds to use instead of multi-Otsu
+        """
+        if self.segmentation == 'fast':
+            return self._detect_regions_fast(image, thresholds)
+        
+        with vmc_metrics.timer('detect.median'):
+            if pyramid is not None:
+                # Median and thresholds on the half-resolution level, upsampled back
+                half = filters.median(pyramid.level(1), morphology.disk(2))
+                smoothed = cv2.resize(half, (image.shape[1], image.shape[0]), interpolation=cv2.INTER_LINEAR)
+            else:
+                # Apply median filter to reduce noise
+                smoothed = filters.median(image, morphology.disk(3))
         
         # Create multiple thresholds for different intensity levels
-        thresholds = filters.threshold_multiotsu(smoothed, classes=4)
+        if thresholds is None:
+            with vmc_metrics.timer('detect.multiotsu'):
+                thresholds = filters.threshold_multiotsu(smoothed, classes=4)
         
         # Create segmentation using these thresholds
         regions = np.digitize(smoothed, bins=thresholds)
         
         # Optional: clean up small regions
-        cleaned = morphology.remove_small_objects(regions, min_size=50)
+        with vmc_metrics.timer('detect.remove_small_objects'):
+            cleaned = morphology.remove_small_objects(regions, min_size=50)
         
         return cleaned
     
-    def analyze_image(self, orbit, image_number):
-        """Perform comprehensive feature analysis on an image"""
+    def _quantized_median(self, image):
+        """Median-filtered quantized frame (cv2.medianBlur is a histogram-based median)"""
+        levels = np.iinfo(self.quantize).max
+        quantized = np.round(np.clip(image, 0, 1) * levels).astype(self.quantize)
+        # 7x7 square window for uint8 in place of disk(3); OpenCV supports at most 5x5 for uint16
+        return cv2.medianBlur(quantized, 7 if self.quantize == 'uint8' else 5)
+    
+    def _histogram(self, smoothed):
+        """256-bin histogram of a quantized frame and the bin centres in 0-1"""
+        levels = np.iinfo(self.quantize).max
+        hist = np.bincount(smoothed.ravel(), minlength=levels + 1)
+        if levels > 255:
+            # Multi-Otsu cost grows with the cube of the bin count
+            factor = (levels + 1) // 256
+            hist = hist.reshape(256, factor).sum(axis=1)
+            return hist, (np.arange(256) * factor + (factor - 1) / 2) / levels
+        return hist, np.arange(levels + 1) / levels
+    
+    def _detect_regions_fast(self, image, thresholds=None):
+        """detect_regions on a quantized frame: histogram median, LUT classification"""
+        with vmc_metrics.timer('detect.median'):
+            smoothed = self._quantized_median(image)
+        
+        if thresholds is None:
+            with vmc_metrics.timer('detect.multiotsu'):
+                hist, centers = self._histogram(smoothed)
+                thresholds = filters.threshold_multiotsu(hist=(hist, centers), classes=4)
+        
+        # Classify every quantization level once, then look up each pixel
+        levels = np.iinfo(self.quantize).max
+        lut = np.digitize(np.arange(levels + 1) / levels, bins=thresholds).astype(np.uint8)
+        regions = lut[smoothed]
+        
+        # Same as remove_small_objects on a label image: classes under 50 pixels become 0
+        counts = np.bincount(regions.ravel(), minlength=len(thresholds) + 1)
+        small = counts < 50
+        small[0] = False
+        if small.any():
+            regions[small[regions]] = 0
+        return regions
+    
+    def orbit_thresholds(self, orbit, max_frames=16):
+        """
+        Multi-Otsu thresholds (0-1) from the pooled histogram of up to max_frames frames of an orbit
+        
+        The result is stored in region_thresholds and used for every frame of
+        the orbit by extract_features.
+        """
+        frames = self.find_images([orbit])
+        if not frames:
+            return None
+        sample = [frames[i] for i in np.linspace(0, len(frames) - 1, min(max_frames, len(frames))).astype(int)]
+        hist = None
+        for _, number, _ in sample:
+            frame_hist, centers = self._histogram(self._quantized_median(self.load_image(orbit, number)))
+            hist = frame_hist if hist is None else hist + frame_hist
+        thresholds = filters.threshold_multiotsu(hist=(hist, centers), classes=4)
+        self.region_thresholds[orbit] = thresholds
+        return thresholds
+    
+    def analyze_image(self, orbit, image_number, plot=True, display_size=None):
+        """Perform comprehensive feature analysis on an image
+        
+        display_size: plot downsampled to about this many pixels per side
+        """
         # Load image
         image = self.load_image(orbit, image_number)
         
         # Perform different types of feature detection
-        edges = self.detect_edges(image)
-        blobs = self.detect_blobs(image)
-        regions = self.detect_regions(image)
+        pyramid = self.build_pyramid(image)
+        edges = self.detect_edges(image, pyramid)
+        blobs = self.detect_blobs(image, pyramid)
+        regions = self.detect_regions(image, pyramid)
+        
+        results = {
+            'edges': edges,
+            'blobs': blobs,
+            'regions': regions
+        }
+        if plot:
+            self.plot_analysis(image, results, display_size)
+        return results
+    
+    def plot_analysis(self, image, results, display_size=None):
+        """Show the 2x2 figure of an analyze_image result
+        
+        display_size: draw every n-th pixel so the panels are about this size,
+            which makes the figure render much faster for review
+        """
+        edges, blobs, regions = results['edges'], results['blobs'], results['regions']
+        if display_size:
+            step = max(1, max(image.shape) // display_size)
+            image, edges, regions = image[::step, ::step], edges[::step, ::step], regions[::step, ::step]
+            blobs = np.asarray(blobs, dtype=float).reshape(-1, 3) / step
         
         # Visualize results
         fig, axes = plt.subplots(2, 2, figsize=(15, 15))
@@ -97,12 +376,137 @@ class VMCFeatureDetector:
         
         plt.tight_layout()
         plt.show()
+    
+    def extract_features(self, orbit, image_number):
+        """Run all detectors on one image and return compact results (no full-size arrays)"""
+        start = time.perf_counter()
+        with vmc_metrics.timer('detect.image'):
+            image = self.load_image(orbit, image_number)
+            with vmc_metrics.timer('detect.pyramid'):
+                pyramid = self.build_pyramid(image)
+            with vmc_metrics.timer('detect.edges'):
+                edges = self.detect_edges(image, pyramid)
+            with vmc_metrics.timer('detect.blobs'):
+                blobs = self.detect_blobs(image, pyramid)
+            with vmc_metrics.timer('detect.regions'):
+                regions = self.detect_regions(image, pyramid, self.region_thresholds.get(orbit))
+            with vmc_metrics.timer('detect.components'):
+                components = region_components(image, regions)
+        
+        # Pixel count and mean brightness per segmentation class
+        labels, pixels = np.unique(regions, return_counts=True)
+        sums = np.bincount(regions.ravel(), weights=np.asarray(image, dtype=float).ravel())
+        region_stats = [(label, count, sums[label] / count) for label, count in zip(labels, pixels)]
         
         return {
-            'edges': edges,
-            'blobs': blobs,
-            'regions': regions
+            'orbit': orbit,
+            'image_number': image_number,
+            'height': image.shape[0],
+            'width': image.shape[1],
+            'edge_density': float(edges.mean()),
+            'blobs': np.asarray(blobs, dtype=np.float32).reshape(-1, 3),
+            'region_stats': region_stats,
+            'components': components,
+            'seconds': time.perf_counter() - start,
         }
+    
+    def find_images(self, orbits=None):
+        """List (orbit, image_number, path) of processed frames, optionally for some orbits
+        
+        orbits may hold strings ('0550') or integers (e.g. range(550, 600)).
+        """
+        if orbits is None:
+            orbit_dirs = sorted(p for p in self.processed_dir.iterdir() if p.is_dir())
+        else:
+            orbit_dirs = [self.processed_dir / (f"{o:04d}" if isinstance(o, int) else o) for o in orbits]
+        
+        frames = {}
+        for orbit_dir in orbit_dirs:
+            if not orbit_dir.is_dir():
+                continue
+            for path in orbit_dir.iterdir():
+                match = FRAME_PATTERN.match(path.name)
+                if match:
+                    # Prefer the lossless array when both formats exist
+                    key = (orbit_dir.name, int(match.group(2)))
+                    if key not in frames or path.suffix == '.npy':
+                        frames[key] = path
+        return [(orbit, number, path) for (orbit, number), path in sorted(frames.items())]
+    
+    def analyze_batch(self, orbits=None, store_path=None, workers=None, chunksize=8, skip_existing=True,
+                      orbit_thresholds=False):
+        """
+        Headless feature extraction over many orbits in a process pool
+        
+        Parameters:
+        orbits: orbits to analyze (None = every orbit under processed_dir)
+        store_path: SQLite feature store (default: <processed_dir>/features.sqlite)
+        workers: number of worker processes (None = all cores, 1 = in process)
+        chunksize: images per task
+        skip_existing: skip images that already have results in the store
+        orbit_thresholds: segment every frame of an orbit with thresholds from a
+            sample of its frames instead of per-frame multi-Otsu
+        
+        No figures are created; use plot_analysis on individual results if needed.
+        Returns a dict with analyzed/skipped counts and a list of (orbit, image_number, error).
+        """
+        store = FeatureStore(store_path or str(self.processed_dir / 'features.sqlite'))
+        frames = self.find_images(orbits)
+        report = {'analyzed': 0, 'skipped': 0, 'failed': []}
+        if skip_existing:
+            done = store.done()
+            report['skipped'] = sum((orbit, number) in done for orbit, number, _ in frames)
+            frames = [f for f in frames if (f[0], f[1]) not in done]
+        if orbit_thresholds:
+            # Computed before dispatch so the pickled detector carries them to the workers
+            for orbit in sorted({orbit for orbit, _, _ in frames} - set(self.region_thresholds)):
+                self.orbit_thresholds(orbit)
+        
+        chunks = [frames[i:i + chunksize] for i in range(0, len(frames), chunksize)]
+        start = time.perf_counter()
+        try:
+            if workers == 1:
+                self._store_results((_detect_chunk(self, chunk) for chunk in chunks), store, report)
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    futures = [pool.submit(vmc_metrics.worker_call, _detect_chunk, self, chunk) for chunk in chunks]
+                    results = (vmc_metrics.unwrap(f.result()) for f in as_completed(futures))
+                    self._store_results(results, store, report)
+        finally:
+            store.close()
+        
+        elapsed = time.perf_counter() - start
+        print(f"\nAnalyzed {report['analyzed']} images in {elapsed:.1f} s "
+              f"({report['analyzed'] / max(elapsed, 1e-9):.1f} images/s), "
+              f"{report['skipped']} already done, {len(report['failed'])} failed")
+        return report
+    
+    def _store_results(self, results, store, report):
+        """Write per-chunk results to the store as they arrive"""
+        for chunk_results in results:
+            for result in chunk_results:
+                with vmc_metrics.timer('detect.store'):
+                    store.write(result)
+                if result.get('error'):
+                    report['failed'].append((result['orbit'], result['image_number'], result['error']))
+                    vmc_metrics.count('detect.errors')
+                else:
+                    report['analyzed'] += 1
+                    vmc_metrics.count('detect.images')
+                    vmc_metrics.count('detect.blobs_found', len(result['blobs']))
+
+def _detect_chunk(detector, chunk):
+    """Worker: extract features for a chunk of frames, capturing per-image errors"""
+    results = []
+    for orbit, image_number, path in chunk:
+        try:
+            result = detector.extract_features(orbit, image_number)
+            result['path'] = str(path)
+        except Exception as e:
+            result = {'orbit': orbit, 'image_number': image_number, 'path': str(path),
+                      'error': f"{type(e).__name__}: {e}"}
+        results.append(result)
+    return results
 
 if __name__ == "__main__":
     processed_dir = "/Users/n_welikala/cvprojects/venus/data/vmc/processed/uv2"
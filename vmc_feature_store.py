@@ -0,0 +1,257 @@
+import os
+import sqlite3
+import numpy as np
+from datetime import timezone
+
+# Column definitions of the per-feature tables; the explicit id keeps track ids valid across VACUUM
+FEATURE_TABLES = {
+    'blobs': """
+        id INTEGER PRIMARY KEY,
+        orbit TEXT NOT NULL,
+        image_number INTEGER NOT NULL,
+        y REAL NOT NULL,
+        x REAL NOT NULL,
+        r REAL NOT NULL""",
+    'components': """
+        id INTEGER PRIMARY KEY,
+        orbit TEXT NOT NULL,
+        image_number INTEGER NOT NULL,
+        label INTEGER NOT NULL,
+        area INTEGER NOT NULL,
+        cy REAL NOT NULL,
+        cx REAL NOT NULL,
+        mean_brightness REAL,
+        y0 INTEGER,
+        x0 INTEGER,
+        height INTEGER,
+        width INTEGER""",
+}
+
+class FeatureStore:
+    """SQLite store of compact per-image feature detection results
+
+    images:  one row per (orbit, image_number) with edge density and counts
+    blobs:   one row per detected blob (y, x, r in pixels)
+    regions: one row per segmentation class with pixel count and mean brightness
+    components: one row per connected component of a segmentation class
+    frame_times: START_TIME of each frame (seconds since the Unix epoch)
+    tracks: track id of every linked blob or component (by its id)
+    """
+    def __init__(self, store_path):
+        self.store_path = store_path
+        os.makedirs(os.path.dirname(os.path.abspath(store_path)), exist_ok=True)
+        self.conn = sqlite3.connect(store_path)
+        self.conn.executescript(f"""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS images (
+                orbit TEXT NOT NULL,
+                image_number INTEGER NOT NULL,
+                path TEXT,
+                height INTEGER,
+                width INTEGER,
+                edge_density REAL,
+                n_blobs INTEGER,
+                n_regions INTEGER,
+                seconds REAL,
+                error TEXT,
+                PRIMARY KEY (orbit, image_number)
+            );
+            CREATE TABLE IF NOT EXISTS blobs ({FEATURE_TABLES['blobs']}
+            );
+            CREATE INDEX IF NOT EXISTS blobs_image ON blobs (orbit, image_number);
+            CREATE TABLE IF NOT EXISTS regions (
+                orbit TEXT NOT NULL,
+                image_number INTEGER NOT NULL,
+                label INTEGER NOT NULL,
+                pixels INTEGER NOT NULL,
+                mean_brightness REAL
+            );
+            CREATE INDEX IF NOT EXISTS regions_image ON regions (orbit, image_number);
+            CREATE TABLE IF NOT EXISTS components ({FEATURE_TABLES['components']}
+            );
+            CREATE INDEX IF NOT EXISTS components_image ON components (orbit, image_number);
+            CREATE TABLE IF NOT EXISTS frame_times (
+                orbit TEXT NOT NULL,
+                image_number INTEGER NOT NULL,
+                start_time REAL NOT NULL,
+                PRIMARY KEY (orbit, image_number)
+            );
+            CREATE TABLE IF NOT EXISTS tracks (
+                kind TEXT NOT NULL,
+                feature_id INTEGER NOT NULL,
+                track_id INTEGER NOT NULL,
+                PRIMARY KEY (kind, feature_id)
+            );
+            CREATE INDEX IF NOT EXISTS tracks_track ON tracks (kind, track_id);
+        """)
+        for table in FEATURE_TABLES:
+            self._add_id_column(table)
+
+    def _add_id_column(self, table):
+        """Give a feature table from an older store an explicit id (its old rowids) so track ids stay valid"""
+        columns = [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+        if 'id' in columns:
+            return
+        names = ', '.join(columns)
+        self.conn.executescript(f"""
+            BEGIN;
+            ALTER TABLE {table} RENAME TO {table}_old;
+            CREATE TABLE {table} ({FEATURE_TABLES[table]}
+            );
+            INSERT INTO {table} (id, {names}) SELECT rowid, {names} FROM {table}_old;
+            DROP TABLE {table}_old;
+            CREATE INDEX IF NOT EXISTS {table}_image ON {table} (orbit, image_number);
+            COMMIT;
+        """)
+
+    def has(self, orbit, image_number):
+        """True if the image already has a successful result"""
+        row = self.conn.execute("SELECT 1 FROM images WHERE orbit = ? AND image_number = ? AND error IS NULL",
+                                (orbit, image_number)).fetchone()
+        return row is not None
+
+    def done(self):
+        """Set of (orbit, image_number) with successful results"""
+        return set(self.conn.execute("SELECT orbit, image_number FROM images WHERE error IS NULL"))
+
+    def write(self, result):
+        """Store one result dict produced by VMCFeatureDetector.extract_features"""
+        orbit, number = result['orbit'], result['image_number']
+        with self.conn:
+            for kind in FEATURE_TABLES:
+                self.conn.execute(f"""
+                    DELETE FROM tracks WHERE kind = ? AND feature_id IN
+                    (SELECT id FROM {kind} WHERE orbit = ? AND image_number = ?)
+                """, (kind, orbit, number))
+            self.conn.execute("DELETE FROM blobs WHERE orbit = ? AND image_number = ?", (orbit, number))
+            self.conn.execute("DELETE FROM regions WHERE orbit = ? AND image_number = ?", (orbit, number))
+            self.conn.execute("DELETE FROM components WHERE orbit = ? AND image_number = ?", (orbit, number))
+            blobs = result.get('blobs')
+            regions = result.get('region_stats')
+            self.conn.execute("""
+                INSERT OR REPLACE INTO images
+                (orbit, image_number, path, height, width, edge_density, n_blobs, n_regions, seconds, error)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (orbit, number, result.get('path'), result.get('height'), result.get('width'),
+                  result.get('edge_density'), None if blobs is None else len(blobs),
+                  None if regions is None else len(regions), result.get('seconds'), result.get('error')))
+            if blobs is not None and len(blobs):
+                self.conn.executemany("INSERT INTO blobs (orbit, image_number, y, x, r) VALUES (?, ?, ?, ?, ?)",
+                                      [(orbit, number, float(y), float(x), float(r)) for y, x, r in blobs])
+            if regions:
+                self.conn.executemany("INSERT INTO regions VALUES (?, ?, ?, ?, ?)",
+                                      [(orbit, number, int(label), int(pixels), float(mean))
+                                       for label, pixels, mean in regions])
+            components = result.get('components')
+            if components is not None and len(components):
+                self.conn.executemany("INSERT INTO components (orbit, image_number, label, area, cy, cx, "
+                                      "mean_brightness, y0, x0, height, width) "
+                                      "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                      [(orbit, number, int(label), int(area), float(cy), float(cx), float(mean),
+                                        int(y0), int(x0), int(h), int(w))
+                                       for label, area, cy, cx, mean, y0, x0, h, w in components])
+
+    def blobs(self, orbit, image_number=None):
+        """(N, 3) array of (y, x, r) for one image or a whole orbit"""
+        if image_number is None:
+            rows = self.conn.execute("SELECT y, x, r FROM blobs WHERE orbit = ?", (orbit,)).fetchall()
+        else:
+            rows = self.conn.execute("SELECT y, x, r FROM blobs WHERE orbit = ? AND image_number = ?",
+                                     (orbit, image_number)).fetchall()
+        return np.array(rows, dtype=float).reshape(-1, 3)
+
+    def components(self, orbit, image_number=None):
+        """(N, 9) array of (label, area, cy, cx, mean_brightness, y0, x0, height, width)"""
+        columns = "label, area, cy, cx, mean_brightness, y0, x0, height, width"
+        if image_number is None:
+            rows = self.conn.execute(f"SELECT {columns} FROM components WHERE orbit = ?", (orbit,)).fetchall()
+        else:
+            rows = self.conn.execute(f"SELECT {columns} FROM components WHERE orbit = ? AND image_number = ?",
+                                     (orbit, image_number)).fetchall()
+        return np.array(rows, dtype=float).reshape(-1, 9)
+
+    def write_frame_times(self, frame_times):
+        """Store START_TIMEs (naive UTC datetimes) from an orbit -> [(image_number, datetime)] map"""
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO frame_times VALUES (?, ?, ?)",
+                                  [(orbit, int(number), start_time.replace(tzinfo=timezone.utc).timestamp())
+                                   for orbit, frames in frame_times.items() for number, start_time in frames])
+
+    def detections(self, kind='blobs', orbit=None):
+        """
+        Every blob or component with its frame time, ordered by orbit and time
+
+        Returns a dict of arrays: id, orbit, image_number, time (NaN
+        without a START_TIME), y, x, size (blob radius or equivalent radius of
+        the component) and label (segmentation class; 0 for blobs).
+        """
+        if kind == 'blobs':
+            columns = "f.id, f.orbit, f.image_number, t.start_time, f.y, f.x, f.r, 0"
+        else:
+            columns = "f.id, f.orbit, f.image_number, t.start_time, f.cy, f.cx, f.area, f.label"
+        query = f"""
+            SELECT {columns} FROM {'blobs' if kind == 'blobs' else 'components'} f
+            LEFT JOIN frame_times t ON t.orbit = f.orbit AND t.image_number = f.image_number
+            {'WHERE f.orbit = ?' if orbit is not None else ''}
+            ORDER BY f.orbit, t.start_time, f.image_number
+        """
+        rows = self.conn.execute(query, () if orbit is None else (orbit,)).fetchall()
+        ids, orbits, numbers, times, ys, xs, sizes, labels = zip(*rows) if rows else ([],) * 8
+        sizes = np.array(sizes, dtype=np.float64)
+        if kind != 'blobs':
+            sizes = np.sqrt(sizes / np.pi)
+        return {
+            'id': np.array(ids, dtype=np.int64),
+            'orbit': np.array(orbits, dtype='U8'),
+            'image_number': np.array(numbers, dtype=np.int32),
+            'time': np.array([np.nan if t is None else t for t in times], dtype=np.float64),
+            'y': np.array(ys, dtype=np.float64),
+            'x': np.array(xs, dtype=np.float64),
+            'size': sizes,
+            'label': np.array(labels, dtype=np.int32),
+        }
+
+    def next_track_id(self, kind='blobs', orbit=None):
+        """First free track id when relinking one orbit (0 when relinking everything)"""
+        if orbit is None:
+            return 0
+        table = 'blobs' if kind == 'blobs' else 'components'
+        row = self.conn.execute(f"""
+            SELECT COALESCE(MAX(track_id) + 1, 0) FROM tracks WHERE kind = ? AND feature_id NOT IN
+            (SELECT id FROM {table} WHERE orbit = ?)
+        """, (kind, orbit)).fetchone()
+        return row[0]
+
+    def write_tracks(self, kind, feature_ids, track_ids, orbit=None):
+        """Replace the track assignment of one feature kind (only of one orbit's features if orbit is given)"""
+        table = 'blobs' if kind == 'blobs' else 'components'
+        with self.conn:
+            if orbit is None:
+                self.conn.execute("DELETE FROM tracks WHERE kind = ?", (kind,))
+            else:
+                self.conn.execute(f"""
+                    DELETE FROM tracks WHERE kind = ? AND feature_id IN
+                    (SELECT id FROM {table} WHERE orbit = ?)
+                """, (kind, orbit))
+            self.conn.executemany("INSERT INTO tracks VALUES (?, ?, ?)",
+                                  zip([kind] * len(feature_ids), map(int, feature_ids), map(int, track_ids)))
+
+    def track_ids(self, kind='blobs'):
+        """Map feature id -> track id"""
+        return dict(self.conn.execute("SELECT feature_id, track_id FROM tracks WHERE kind = ?", (kind,)))
+
+    def images(self, orbit=None):
+        """Per-image summary rows as dicts"""
+        self.conn.row_factory = sqlite3.Row
+        try:
+            if orbit is None:
+                rows = self.conn.execute("SELECT * FROM images ORDER BY orbit, image_number").fetchall()
+            else:
+                rows = self.conn.execute("SELECT * FROM images WHERE orbit = ? ORDER BY image_number",
+                                         (orbit,)).fetchall()
+        finally:
+            self.conn.row_factory = None
+        return [dict(row) for row in rows]
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,205 @@
+import time
+import numpy as np
+
+from vmc_lazy import lazy_import
+from vmc_feature_store import FeatureStore
+
+cKDTree = lazy_import('scipy.spatial', 'cKDTree')
+
+TRACK_DTYPE = np.dtype([('track_id', 'i8'), ('orbit', 'U8'), ('length', 'i4'), ('t0', 'f8'), ('t1', 'f8'),
+                        ('y0', 'f4'), ('x0', 'f4'), ('y1', 'f4'), ('x1', 'f4'), ('speed', 'f4')])
+
+class FeatureIndex:
+    """Spatio-temporal index over the detections of a FeatureStore
+
+    Detections are sorted by orbit, START_TIME, frame and segmentation class,
+    so every frame (and every class within a frame) is one contiguous slice.
+    A cKDTree over (y, x) is built lazily per (frame, class) and kept for the
+    most recent max_trees slices, which is all that linking consecutive
+    frames needs.
+    """
+    def __init__(self, detections, max_trees=64):
+        order = np.lexsort((detections['label'], detections['image_number'],
+                            np.nan_to_num(detections['time'], nan=np.inf), detections['orbit']))
+        self.detections = {key: values[order] for key, values in detections.items()}
+        self.points = np.column_stack([self.detections['y'], self.detections['x']])
+        self.max_trees = max_trees
+        self.trees = {}
+
+        orbits, numbers = self.detections['orbit'], self.detections['image_number']
+        change = np.flatnonzero((orbits[1:] != orbits[:-1]) | (numbers[1:] != numbers[:-1])) + 1
+        self.starts = np.concatenate([[0], change]).astype(np.intp) if len(orbits) else np.empty(0, np.intp)
+        self.stops = np.append(self.starts[1:], len(orbits)).astype(np.intp)
+        self.frame_orbit = orbits[self.starts]
+        self.frame_number = numbers[self.starts]
+        self.frame_time = self.detections['time'][self.starts]
+        self.frame_lookup = {(o, int(n)): i for i, (o, n) in enumerate(zip(self.frame_orbit, self.frame_number))}
+
+    def __len__(self):
+        return len(self.points)
+
+    @property
+    def n_frames(self):
+        return len(self.starts)
+
+    def frame(self, orbit, image_number):
+        """Frame position of (orbit, image_number), or None if it has no detections"""
+        return self.frame_lookup.get((orbit, int(image_number)))
+
+    def next_frame(self, i):
+        """Next frame of the same orbit in time order, or None"""
+        if i + 1 < self.n_frames and self.frame_orbit[i + 1] == self.frame_orbit[i]:
+            return i + 1
+        return None
+
+    def frames_between(self, orbit, t0, t1):
+        """Frame positions of an orbit with t0 <= START_TIME <= t1"""
+        positions = np.flatnonzero(self.frame_orbit == orbit)
+        times = self.frame_time[positions]
+        return positions[np.searchsorted(times, t0, 'left'):np.searchsorted(times, t1, 'right')]
+
+    def slice(self, i, label=None):
+        """Detection positions of frame i (optionally only one segmentation class)"""
+        start, stop = self.starts[i], self.stops[i]
+        if label is not None:
+            labels = self.detections['label'][start:stop]
+            start, stop = start + np.searchsorted(labels, label, 'left'), start + np.searchsorted(labels, label, 'right')
+        return start, stop
+
+    def tree(self, i, label=None):
+        """(cKDTree over the frame's (y, x), offset of its first detection)"""
+        key = (i, label)
+        if key not in self.trees:
+            if len(self.trees) >= self.max_trees:
+                self.trees.pop(next(iter(self.trees)))
+            start, stop = self.slice(i, label)
+            self.trees[key] = (cKDTree(self.points[start:stop]), start)
+        return self.trees[key]
+
+    def radius(self, i, points, r, label=None):
+        """For each (y, x) in points, the detection positions of frame i within r pixels"""
+        tree, start = self.tree(i, label)
+        return [np.asarray(found, dtype=np.intp) + start
+                for found in tree.query_ball_point(np.asarray(points, dtype=float).reshape(-1, 2), r)]
+
+    def nearest(self, i, points, max_distance=np.inf, label=None):
+        """(distance, detection position) of the nearest detection of frame i; -1 beyond max_distance"""
+        tree, start = self.tree(i, label)
+        if tree.n == 0:
+            points = np.asarray(points).reshape(-1, 2)
+            return np.full(len(points), np.inf), np.full(len(points), -1, dtype=np.intp)
+        distance, found = tree.query(np.asarray(points, dtype=float).reshape(-1, 2),
+                                     distance_upper_bound=max_distance)
+        found = np.where(np.isfinite(distance), found + start, -1)
+        return distance, found
+
+def link_tracks(index, max_distance=20.0, max_gap=3600.0, predict=True, first_id=0):
+    """
+    Link detections of consecutive frames into tracks
+
+    Parameters:
+    index: FeatureIndex
+    max_distance: largest displacement in pixels between linked detections
+    max_gap: frames further apart than this many seconds are not linked
+    predict: search around the position extrapolated from the track's last velocity
+    first_id: track id given to the first new track
+
+    Detections of consecutive frames of an orbit (same segmentation class)
+    are linked when each is the other's nearest neighbour within
+    max_distance. Every frame pair costs two KD-tree builds and queries, so a
+    mission links in O(N log N). Returns a track id for every detection (in
+    index order).
+    """
+    track = np.full(len(index), -1, dtype=np.int64)
+    velocity = np.zeros((len(index), 2))
+    next_id = first_id
+    for i in range(index.n_frames):
+        start, stop = index.slice(i)
+        unassigned = track[start:stop] < 0
+        track[start:stop][unassigned] = np.arange(next_id, next_id + unassigned.sum())
+        next_id += int(unassigned.sum())
+
+        j = index.next_frame(i)
+        if j is None:
+            continue
+        dt = index.frame_time[j] - index.frame_time[i]
+        if dt > max_gap:
+            continue
+        for label in np.unique(index.detections['label'][start:stop]):
+            a0, a1 = index.slice(i, label)
+            b0, b1 = index.slice(j, label)
+            if a0 == a1 or b0 == b1:
+                continue
+            source = index.points[a0:a1]
+            if predict and np.isfinite(dt):
+                source = source + velocity[a0:a1] * dt
+            # Forward: nearest detection in frame j; backward: nearest predicted source of each
+            _, forward = index.nearest(j, source, max_distance, label)
+            distance, backward = cKDTree(source).query(index.points[b0:b1], distance_upper_bound=max_distance)
+            linked = np.flatnonzero(forward >= 0)
+            targets = forward[linked]
+            mutual = np.isfinite(distance[targets - b0]) & (backward[targets - b0] == linked)
+            linked, targets = linked[mutual] + a0, targets[mutual]
+            track[targets] = track[linked]
+            if np.isfinite(dt) and dt > 0:
+                velocity[targets] = (index.points[targets] - index.points[linked]) / dt
+    return track
+
+def track_summary(index, track, min_length=3):
+    """Per-track length, start/end time and position, and mean speed (pixels per second)"""
+    order = np.argsort(track, kind='stable')
+    ids, first, length = np.unique(track[order], return_index=True, return_counts=True)
+    keep = length >= min_length
+    ids, first, length = ids[keep], first[keep], length[keep]
+    start, end = order[first], order[first + length - 1]
+    times = index.detections['time']
+    summary = np.empty(len(ids), dtype=TRACK_DTYPE)
+    summary['track_id'] = ids
+    summary['orbit'] = index.detections['orbit'][start]
+    summary['length'] = length
+    summary['t0'], summary['t1'] = times[start], times[end]
+    summary['y0'], summary['x0'] = index.points[start].T
+    summary['y1'], summary['x1'] = index.points[end].T
+    with np.errstate(invalid='ignore', divide='ignore'):
+        summary['speed'] = np.hypot(*(index.points[end] - index.points[start]).T) / (times[end] - times[start])
+    return summary
+
+def build_tracks(store_path, kind='blobs', frame_times=None, orbit=None, min_length=3, **options):
+    """
+    Index the detections of a feature store, link them into tracks and store the track ids
+
+    Parameters:
+    store_path: SQLite feature store written by VMCFeatureDetector.analyze_batch
+    kind: 'blobs' or 'components' (region centroids)
+    frame_times: orbit -> [(image_number, datetime)] to record first
+        (see vmc_wind_tracking.frame_times_from_index / frame_times_from_labels)
+    orbit: relink only this orbit; the tracks of other orbits are kept
+    options: link_tracks parameters (max_distance, max_gap, predict)
+
+    Returns (FeatureIndex, track ids, summary of tracks with at least min_length detections).
+    """
+    store = FeatureStore(store_path)
+    try:
+        if frame_times:
+            store.write_frame_times(frame_times)
+        start = time.perf_counter()
+        index = FeatureIndex(store.detections(kind, orbit))
+        track = link_tracks(index, first_id=store.next_track_id(kind, orbit), **options)
+        store.write_tracks(kind, index.detections['id'], track, orbit)
+    finally:
+        store.close()
+
+    summary = track_summary(index, track, min_length)
+    print(f"Linked {len(index)} {kind} in {index.n_frames} frames into {len(np.unique(track))} tracks "
+          f"({len(summary)} with at least {min_length} detections) in {time.perf_counter() - start:.1f} s")
+    return index, track, summary
+
+if __name__ == "__main__":
+    from vmc_wind_tracking import frame_times_from_labels
+
+    label_dir = "/Users/n_welikala/cvprojects/venus/data/vmc/filtered/uv2"
+    store_path = "/Users/n_welikala/cvprojects/venus/data/vmc/processed/uv2/features.sqlite"
+
+    index, track, summary = build_tracks(store_path, frame_times=frame_times_from_labels(label_dir))
+    for row in np.sort(summary, order='length')[::-1][:10]:
+        print(f"track {row['track_id']} ({row['orbit']}): {row['length']} frames, {row['speed']:.3f} px/s")
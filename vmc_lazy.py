@@ -0,0 +1,47 @@
+import importlib
+import threading
+
+_lock = threading.RLock()
+
+class LazyImport:
+    """Stand-in for a module (or one of its attributes) that is imported on first use
+
+    `plt = LazyImport('matplotlib.pyplot')` costs nothing at import time; the
+    first `plt.imshow(...)` imports matplotlib. `blob_dog =
+    LazyImport('skimage.feature', 'blob_dog')` works the same for names
+    imported with `from ... import ...` and can be called directly.
+    """
+    def __init__(self, module_name, attribute=None):
+        self.__dict__['_module_name'] = module_name
+        self.__dict__['_attribute'] = attribute
+        self.__dict__['_target'] = None
+
+    def _load(self):
+        target = self.__dict__['_target']
+        if target is None:
+            with _lock:
+                target = self.__dict__['_target']
+                if target is None:
+                    target = importlib.import_module(self._module_name)
+                    if self._attribute:
+                        target = getattr(target, self._attribute)
+                    self.__dict__['_target'] = target
+        return target
+
+    def __getattr__(self, name):
+        return getattr(self._load(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._load(), name, value)
+
+    def __call__(self, *args, **kwargs):
+        return self._load()(*args, **kwargs)
+
+    def __repr__(self):
+        name = self._module_name + (f".{self._attribute}" if self._attribute else '')
+        state = 'loaded' if self.__dict__['_target'] is not None else 'not loaded'
+        return f"<LazyImport {name} ({state})>"
+
+def lazy_import(module_name, attribute=None):
+    """Deferred `import module_name` (or `from module_name import attribute`)"""
+    return LazyImport(module_name, attribute)
@@ -0,0 +1,70 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+class ListingCache:
+    """Local cache of remote directory-listing pages keyed by URL
+
+    Stores the page body together with its ETag/Last-Modified so a stale
+    entry can be revalidated with a conditional GET instead of refetched.
+    """
+    def __init__(self, cache_path: str, ttl: float = 24 * 3600):
+        self.cache_path = cache_path
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(cache_path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS listings (
+                url TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched REAL NOT NULL
+            )
+        """)
+
+    def get(self, url: str) -> Optional[Dict]:
+        """Return the cached entry for a URL, or None"""
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM listings WHERE url = ?", (url,)).fetchone()
+        return dict(row) if row else None
+
+    def is_fresh(self, entry: Optional[Dict]) -> bool:
+        """True if the entry is younger than the TTL"""
+        return entry is not None and time.time() - entry['fetched'] < self.ttl
+
+    def conditional_headers(self, entry: Optional[Dict]) -> Dict[str, str]:
+        """Headers that let the server answer 304 Not Modified"""
+        headers = {}
+        if entry:
+            if entry['etag']:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified']:
+                headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def put(self, url: str, body: str, etag: Optional[str], last_modified: Optional[str]):
+        """Store a freshly fetched page"""
+        with self.lock:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO listings (url, body, etag, last_modified, fetched)
+                VALUES (?, ?, ?, ?, ?)
+            """, (url, body, etag, last_modified, time.time()))
+
+    def touch(self, url: str):
+        """Restart the TTL after a 304 revalidation"""
+        with self.lock:
+            self.conn.execute("UPDATE listings SET fetched = ? WHERE url = ?", (time.time(), url))
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM listings")
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
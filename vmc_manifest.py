@@ -0,0 +1,83 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Optional
+
+class TransferManifest:
+    """Persistent record of every remote file the downloader has touched
+
+    One row per URL with the expected size, validators (ETag and
+    Last-Modified), bytes written so far and whether the transfer finished.
+    Backed by SQLite so it survives crashes and can be shared by threads.
+    """
+    def __init__(self, manifest_path: str):
+        self.manifest_path = manifest_path
+        os.makedirs(os.path.dirname(os.path.abspath(manifest_path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(manifest_path, check_same_thread=False, isolation_level=None)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS transfers (
+                url TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                expected_size INTEGER,
+                etag TEXT,
+                last_modified TEXT,
+                bytes_written INTEGER NOT NULL DEFAULT 0,
+                complete INTEGER NOT NULL DEFAULT 0,
+                updated REAL NOT NULL
+            )
+        """)
+
+    def get(self, url: str) -> Optional[Dict]:
+        """Return the manifest entry for a URL, or None if never seen"""
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM transfers WHERE url = ?", (url,)).fetchone()
+        return dict(row) if row else None
+
+    def start(self, url: str, path: str, expected_size: Optional[int], etag: Optional[str],
+              last_modified: Optional[str], bytes_written: int = 0):
+        """Record (or restart) an in-progress transfer"""
+        with self.lock:
+            self.conn.execute("""
+                INSERT INTO transfers (url, path, expected_size, etag, last_modified, bytes_written, complete, updated)
+                VALUES (?, ?, ?, ?, ?, ?, 0, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    path = excluded.path, expected_size = excluded.expected_size,
+                    etag = excluded.etag, last_modified = excluded.last_modified,
+                    bytes_written = excluded.bytes_written, complete = 0, updated = excluded.updated
+            """, (url, path, expected_size, etag, last_modified, bytes_written, time.time()))
+
+    def progress(self, url: str, bytes_written: int):
+        """Store how many bytes of a partial transfer are on disk"""
+        with self.lock:
+            self.conn.execute("UPDATE transfers SET bytes_written = ?, updated = ? WHERE url = ?",
+                              (bytes_written, time.time(), url))
+
+    def complete(self, url: str, size: int):
+        """Mark a transfer as finished and moved into place"""
+        with self.lock:
+            self.conn.execute("""
+                UPDATE transfers SET bytes_written = ?, expected_size = COALESCE(expected_size, ?),
+                    complete = 1, updated = ? WHERE url = ?
+            """, (size, size, time.time(), url))
+
+    def invalidate(self, url: str):
+        """Forget a transfer so the next run downloads it again"""
+        with self.lock:
+            self.conn.execute("DELETE FROM transfers WHERE url = ?", (url,))
+
+    def summary(self) -> Dict[str, int]:
+        """Count complete and incomplete transfers"""
+        with self.lock:
+            complete, partial = self.conn.execute(
+                "SELECT COALESCE(SUM(complete), 0), COALESCE(SUM(1 - complete), 0) FROM transfers"
+            ).fetchone()
+        return {'complete': complete, 'incomplete': partial}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
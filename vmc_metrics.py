@@ -0,0 +1,333 @@
+import os
+import sys
+import json
+import time
+import functools
+import threading
+from contextlib import contextmanager
+
+class _NullTimer:
+    """Shared do-nothing context manager returned while metrics are disabled"""
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    def __init__(self, metrics, key):
+        self.metrics = metrics
+        self.key = key
+
+    def __enter__(self):
+        local = self.metrics.local
+        self.depth = getattr(local, 'depth', 0)
+        local.depth = self.depth + 1
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        self.metrics.local.depth = self.depth
+        # Only outermost spans count as busy time, so nested steps are not double counted
+        self.metrics._record(self.key, seconds, busy=self.depth == 0)
+        return False
+
+class Metrics:
+    """Process-wide registry of step timers, counters and per-worker busy time
+
+    Timers are keyed by a dotted step name ('process.gaussian') plus optional
+    labels. While disabled, timer() returns a shared no-op context manager and
+    count() returns immediately, so instrumented code pays one attribute check.
+    """
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.profiling = False
+        self.profilers = []       # cProfile.Profile of each profiled thread in this process
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.timers = {}      # key -> [calls, total seconds, max seconds]
+            self.counters = {}    # key -> value
+            self.busy = {}        # worker -> busy seconds
+            self.profiles = []    # raw profile stats returned by worker processes
+            self.started = time.time()
+            self.pid = os.getpid()
+
+    def _worker(self):
+        return f"{os.getpid()}/{threading.current_thread().name}"
+
+    def _record(self, key, seconds, busy):
+        with self.lock:
+            entry = self.timers.get(key)
+            if entry is None:
+                self.timers[key] = [1, seconds, seconds]
+            else:
+                entry[0] += 1
+                entry[1] += seconds
+                entry[2] = max(entry[2], seconds)
+            if busy:
+                worker = self._worker()
+                self.busy[worker] = self.busy.get(worker, 0.0) + seconds
+
+    def timer(self, name, **labels):
+        """Context manager timing one step"""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, (name, tuple(sorted(labels.items()))))
+
+    def count(self, name, value=1, **labels):
+        """Add value to a counter (files, bytes_in, bytes_out, ...)"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def snapshot(self):
+        """Picklable copy of everything recorded so far"""
+        with self.lock:
+            return {
+                'timers': [[name, list(labels), *values] for (name, labels), values in self.timers.items()],
+                'counters': [[name, list(labels), value] for (name, labels), value in self.counters.items()],
+                'busy': dict(self.busy),
+                'started': self.started,
+            }
+
+    def merge(self, snapshot):
+        """Fold a snapshot from another worker process into this registry"""
+        if not snapshot:
+            return
+        with self.lock:
+            for name, labels, calls, total, longest in snapshot['timers']:
+                key = (name, tuple(tuple(item) for item in labels))
+                entry = self.timers.setdefault(key, [0, 0.0, 0.0])
+                entry[0] += calls
+                entry[1] += total
+                entry[2] = max(entry[2], longest)
+            for name, labels, value in snapshot['counters']:
+                key = (name, tuple(tuple(item) for item in labels))
+                self.counters[key] = self.counters.get(key, 0) + value
+            for worker, seconds in snapshot['busy'].items():
+                self.busy[worker] = self.busy.get(worker, 0.0) + seconds
+            if snapshot.get('profile'):
+                self.profiles.append(snapshot['profile'])
+
+    def utilization(self):
+        """Busy fraction of every worker since metrics were enabled"""
+        elapsed = max(time.time() - self.started, 1e-9)
+        with self.lock:
+            return {worker: busy / elapsed for worker, busy in self.busy.items()}
+
+METRICS = Metrics()
+
+# Bound methods, so a disabled timer costs one call and one attribute check
+timer = METRICS.timer
+count = METRICS.count
+
+def timed(name, **labels):
+    """Decorator form of timer()"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with METRICS.timer(name, **labels):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def is_enabled():
+    return METRICS.enabled
+
+def _start_profiler():
+    """Profile the calling thread with its own cProfile.Profile"""
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Python 3.12+ allows one active profiler, which already sees every thread
+        return None
+    with METRICS.lock:
+        METRICS.profilers.append(profiler)
+    return profiler
+
+def _profile_new_thread(frame, event, arg):
+    """threading.setprofile hook: runs once in every new thread and hands it to cProfile"""
+    sys.setprofile(None)
+    _start_profiler()
+
+class _RawStats:
+    """pstats.Stats input for profile data returned by a worker process"""
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+def enable(profile=False):
+    """
+    Start recording metrics in this process and in worker processes it starts
+
+    Parameters:
+    profile: also run cProfile in this thread, every thread started afterwards
+        (pipeline stages, download pools) and inside worker_call in worker
+        processes; finish() merges them into one file
+    """
+    METRICS.reset()
+    METRICS.enabled = True
+    # Spawned worker processes read these on import
+    os.environ['VMC_METRICS'] = '1'
+    if profile:
+        METRICS.profiling = True
+        os.environ['VMC_PROFILE'] = '1'
+        threading.setprofile(_profile_new_thread)
+        _start_profiler()
+
+def _stop_profiling():
+    threading.setprofile(None)
+    with METRICS.lock:
+        profilers, METRICS.profilers = METRICS.profilers, []
+    for profiler in profilers:
+        profiler.disable()
+    METRICS.profiling = False
+    os.environ.pop('VMC_PROFILE', None)
+    return profilers
+
+def disable():
+    METRICS.enabled = False
+    os.environ.pop('VMC_METRICS', None)
+    if METRICS.profiling:
+        _stop_profiling()
+
+def worker_call(fn, *args):
+    """
+    Run fn(*args) in a pool worker and return (result, metrics snapshot)
+
+    Use with unwrap() in the parent, e.g.
+    `pool.submit(worker_call, _process_chunk, processor, chunk)`.
+    """
+    if not METRICS.enabled:
+        return fn(*args), None
+    if METRICS.pid != os.getpid():
+        # Forked worker: drop what was inherited from the parent
+        METRICS.reset()
+    profiler = None
+    if METRICS.profiling:
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            profiler = None
+    try:
+        result = fn(*args)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+    snapshot = METRICS.snapshot()
+    if profiler is not None:
+        profiler.create_stats()
+        snapshot['profile'] = profiler.stats
+    METRICS.reset()
+    return result, snapshot
+
+def unwrap(value):
+    """Merge the snapshot returned by worker_call and return the result"""
+    result, snapshot = value
+    METRICS.merge(snapshot)
+    return result
+
+def _label_text(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{value}"' for key, value in items) + '}'
+
+def write_prometheus(path):
+    """Write all metrics in the Prometheus text exposition format"""
+    snapshot = METRICS.snapshot()
+    lines = [
+        "# HELP vmc_step_seconds_total Time spent in each instrumented step",
+        "# TYPE vmc_step_seconds_total counter",
+    ]
+    for name, labels, calls, total, longest in sorted(snapshot['timers']):
+        lines.append(f"vmc_step_seconds_total{_label_text(labels, [('step', name)])} {total:.6f}")
+    lines += ["# HELP vmc_step_calls_total Calls of each instrumented step",
+              "# TYPE vmc_step_calls_total counter"]
+    for name, labels, calls, total, longest in sorted(snapshot['timers']):
+        lines.append(f"vmc_step_calls_total{_label_text(labels, [('step', name)])} {calls}")
+    lines += ["# HELP vmc_step_seconds_max Longest single call of each step",
+              "# TYPE vmc_step_seconds_max gauge"]
+    for name, labels, calls, total, longest in sorted(snapshot['timers']):
+        lines.append(f"vmc_step_seconds_max{_label_text(labels, [('step', name)])} {longest:.6f}")
+    lines += ["# HELP vmc_events_total Counted events and bytes", "# TYPE vmc_events_total counter"]
+    for name, labels, value in sorted(snapshot['counters']):
+        lines.append(f"vmc_events_total{_label_text(labels, [('name', name)])} {value}")
+    lines += ["# HELP vmc_worker_utilization Busy fraction of each worker thread or process",
+              "# TYPE vmc_worker_utilization gauge"]
+    for worker, fraction in sorted(METRICS.utilization().items()):
+        lines.append(f'vmc_worker_utilization{{worker="{worker}"}} {fraction:.4f}')
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, path)
+
+def write_log(path, **fields):
+    """Append one JSON line with every metric (plus any extra fields) to a structured log"""
+    record = dict(fields, time=time.time(), **METRICS.snapshot(), utilization=METRICS.utilization())
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+
+def print_report(top=20):
+    """Print the slowest steps and the counters"""
+    snapshot = METRICS.snapshot()
+    print("\nStep Timings:")
+    print("-" * 50)
+    for name, labels, calls, total, longest in sorted(snapshot['timers'], key=lambda t: -t[3])[:top]:
+        print(f"{name + _label_text(labels):<40} {total:9.3f} s  {calls:7d} calls  "
+              f"{total / calls * 1000:9.2f} ms avg  {longest * 1000:9.2f} ms max")
+    if snapshot['counters']:
+        print("\nCounters:")
+        for name, labels, value in sorted(snapshot['counters']):
+            print(f"{name + _label_text(labels):<40} {value}")
+    utilization = METRICS.utilization()
+    if utilization:
+        print(f"\nWorkers: {len(utilization)}, mean utilization {sum(utilization.values()) / len(utilization):.0%}")
+
+def finish(prometheus_path=None, log_path=None, profile_path=None, report=True):
+    """Stop recording and write the requested outputs"""
+    if METRICS.profiling:
+        sources = _stop_profiling() + [_RawStats(stats) for stats in METRICS.profiles]
+        if profile_path and sources:
+            # One file with the calling thread, every profiled thread and every worker process
+            import pstats
+            merged = pstats.Stats(sources[0])
+            for source in sources[1:]:
+                merged.add(source)
+            merged.dump_stats(profile_path)
+    if report:
+        print_report()
+    if prometheus_path:
+        write_prometheus(prometheus_path)
+    if log_path:
+        write_log(log_path)
+    disable()
+
+@contextmanager
+def recording(prometheus_path=None, log_path=None, profile_path=None, report=True):
+    """Enable metrics for a block and write them out at the end"""
+    enable(profile=profile_path is not None)
+    try:
+        yield METRICS
+    finally:
+        finish(prometheus_path, log_path, profile_path, report)
+
+if os.environ.get('VMC_METRICS') == '1':
+    METRICS.enabled = True
+    METRICS.profiling = os.environ.get('VMC_PROFILE') == '1'
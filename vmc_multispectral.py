@@ -0,0 +1,357 @@
+import os
+import re
+import time
+import numpy as np
+from pathlib import Path
+from scipy import fft
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from vmc_uv2_extract import FILTERS
+import vmc_metrics
+
+NAME_PATTERN = re.compile(r'V(\d{4})_(\d{4})_(UV2|VI2|N12|N22)$')
+
+def _sorted_table(orbits, names, paths, times):
+    """Columns of one filter sorted by START_TIME"""
+    times = np.array(times, dtype='datetime64[us]')
+    order = np.argsort(times, kind='stable')
+    return {
+        'time': times[order],
+        'orbit': np.array(orbits, dtype='U4')[order],
+        'name': np.array(names, dtype=str)[order],
+        'path': np.array(paths, dtype=str)[order],
+    }
+
+def frame_table_from_index(index, filters=FILTERS):
+    """Map filter -> time-sorted columns (time, orbit, name, path) of its JPG frames in a ProductIndex"""
+    table = {}
+    for filter_type in filters:
+        rows = [row for row in index.products(filter_type=filter_type) if row['start_time'] and row['jpg_path']]
+        table[filter_type] = _sorted_table([row['orbit'] for row in rows], [row['name'] for row in rows],
+                                           [row['jpg_path'] for row in rows], [row['start_time'] for row in rows])
+    return table
+
+def frame_table_from_labels(raw_dir, filters=FILTERS, workers=None):
+    """Map filter -> time-sorted columns by batch-parsing the labels under raw_dir"""
+    from vmc_pds3 import parse_labels
+
+    paths = sorted(Path(raw_dir).glob("*/V*.LBL"))
+    columns = parse_labels(paths, keys=['START_TIME'], workers=workers)
+    rows = {filter_type: ([], [], [], []) for filter_type in filters}
+    for path, start_time in zip(columns['path'], columns['START_TIME']):
+        match = NAME_PATTERN.match(Path(path).stem)
+        jpg_path = str(Path(path).with_suffix('.JPG'))
+        if match and match.group(3) in rows and not np.isnat(start_time) and os.path.exists(jpg_path):
+            orbits, names, jpg_paths, times = rows[match.group(3)]
+            orbits.append(match.group(1))
+            names.append(Path(path).stem)
+            jpg_paths.append(jpg_path)
+            times.append(start_time)
+    return {filter_type: _sorted_table(*columns) for filter_type, columns in rows.items()}
+
+def match_frames(table, reference='UV2', tolerance=30.0, require_all=False):
+    """
+    Group near-simultaneous frames of all filters around each reference frame
+
+    Parameters:
+    table: filter -> time-sorted columns, from frame_table_from_index/labels
+    reference: filter whose frames define the groups
+    tolerance: largest accepted |START_TIME difference| in seconds
+    require_all: drop groups where any filter is missing
+
+    For every other filter the nearest frame is found with one searchsorted
+    over the sorted times, so matching is O(N log N) for the whole mission.
+    A frame is used by at most one group (the closest reference frame) and
+    never across orbits. Returns a dict of arrays: time and orbit per group,
+    path and name of shape (groups, filters) ('' if missing), offset in
+    seconds from the reference frame and the filters order.
+    """
+    filters = [reference] + [f for f in table if f != reference]
+    ref = table[reference]
+    n = len(ref['time'])
+    index = np.full((n, len(filters)), -1, dtype=np.int64)
+    index[:, 0] = np.arange(n)
+    offset = np.zeros((n, len(filters)))
+
+    for j, filter_type in enumerate(filters[1:], start=1):
+        times = table[filter_type]['time']
+        if not len(times) or not n:
+            continue
+        # Nearest neighbour among the two frames around each insertion point
+        position = np.searchsorted(times, ref['time'])
+        left = np.clip(position - 1, 0, len(times) - 1)
+        right = np.clip(position, 0, len(times) - 1)
+        left_gap = np.abs(ref['time'] - times[left])
+        right_gap = np.abs(times[right] - ref['time'])
+        nearest = np.where(right_gap < left_gap, right, left)
+        dt = (times[nearest] - ref['time']) / np.timedelta64(1, 's')
+        ok = (np.abs(dt) <= tolerance) & (table[filter_type]['orbit'][nearest] == ref['orbit'])
+
+        # If two reference frames picked the same frame, keep the closer one
+        candidates = np.flatnonzero(ok)
+        order = np.lexsort((np.abs(dt[candidates]), nearest[candidates]))
+        _, first = np.unique(nearest[candidates][order], return_index=True)
+        keep = candidates[order][first]
+        index[keep, j] = nearest[keep]
+        offset[keep, j] = dt[keep]
+
+    if require_all:
+        complete = (index >= 0).all(axis=1)
+        index, offset = index[complete], offset[complete]
+        rows = np.flatnonzero(complete)
+    else:
+        rows = np.arange(n)
+
+    def gather(column):
+        values = np.full(index.shape, '', dtype=object)
+        for j, filter_type in enumerate(filters):
+            present = index[:, j] >= 0
+            values[present, j] = table[filter_type][column][index[present, j]]
+        return values.astype(str)
+
+    return {
+        'time': ref['time'][rows],
+        'orbit': ref['orbit'][rows],
+        'path': gather('path'),
+        'name': gather('name'),
+        'offset': offset,
+        'filters': np.array(filters),
+    }
+
+def subpixel_shifts(reference, frames, fft_workers=1):
+    """
+    (dy, dx, peak) of every frame relative to its reference by full-frame phase correlation
+
+    Parameters:
+    reference, frames: (P, H, W) stacks; frame p is compared with reference p
+
+    A Hann window suppresses edge effects and the whitened cross-power
+    spectrum makes the peak insensitive to the brightness differences
+    between filters. All P correlations run in one batched FFT; the peak
+    is refined to sub-pixel precision with a parabola along each axis.
+    """
+    reference = np.asarray(reference, dtype=np.float32)
+    frames = np.asarray(frames, dtype=np.float32)
+    height, width = frames.shape[-2:]
+    window = np.outer(np.hanning(height), np.hanning(width)).astype(np.float32)
+
+    def prepare(stack):
+        stack = stack - stack.mean(axis=(-2, -1), keepdims=True)
+        return fft.rfft2(stack * window, workers=fft_workers)
+
+    cross = prepare(frames) * np.conj(prepare(reference))
+    cross /= np.maximum(np.abs(cross), 1e-12)
+    corr = fft.irfft2(cross, s=(height, width), workers=fft_workers)
+
+    flat = corr.reshape(len(corr), -1)
+    peak_index = flat.argmax(axis=1)
+    py, px = np.divmod(peak_index, width)
+    rows = np.arange(len(corr))
+    peak = corr[rows, py, px]
+
+    def refine(minus, plus):
+        denom = minus - 2 * peak + plus
+        return np.where(np.abs(denom) > 1e-12, 0.5 * (minus - plus) / denom, 0.0)
+
+    dy = py + refine(corr[rows, (py - 1) % height, px], corr[rows, (py + 1) % height, px])
+    dx = px + refine(corr[rows, py, (px - 1) % width], corr[rows, py, (px + 1) % width])
+    dy = np.where(dy > height / 2, dy - height, dy)
+    dx = np.where(dx > width / 2, dx - width, dx)
+    return dy, dx, peak
+
+def apply_shifts(frames, dy, dx, fft_workers=1):
+    """Shift each (H, W) frame of a (P, H, W) stack by (-dy, -dx) via the Fourier shift theorem"""
+    frames = np.asarray(frames, dtype=np.float32)
+    height, width = frames.shape[-2:]
+    ky = fft.fftfreq(height)[None, :, None]
+    kx = fft.rfftfreq(width)[None, None, :]
+    dy = np.asarray(dy, dtype=np.float64)[:, None, None]
+    dx = np.asarray(dx, dtype=np.float64)[:, None, None]
+    phase = np.exp(2j * np.pi * (ky * dy + kx * dx)).astype(np.complex64)
+    shifted = fft.irfft2(fft.rfft2(frames, workers=fft_workers) * phase, s=(height, width), workers=fft_workers)
+    return shifted.astype(np.float32)
+
+def _load_band(path, shape=None):
+    from PIL import Image
+    image = np.asarray(Image.open(path).convert('L'), dtype=np.float32)
+    if shape is not None and image.shape != shape:
+        raise ValueError(f"{os.path.basename(path)} is {image.shape}, expected {shape}")
+    return image
+
+def build_orbit_cubes(groups, output_dir, preprocess=True, register=True, batch_cubes=8, fft_workers=1):
+    """
+    Write the (filters, H, W) float32 cubes of one orbit's frame groups
+
+    Parameters:
+    groups: match_frames output restricted to one orbit
+    output_dir: where cubes_<orbit>.npy and cubes_<orbit>.npz are written
+    preprocess: contrast-stretch and normalize every band as VMCImageProcessor does
+        (otherwise bands are scaled 0-1 from 8 bits)
+    register: align every band onto the reference band with sub-pixel FFT shifts
+    batch_cubes: cubes whose bands are correlated in one FFT call
+
+    The cube array is (N, filters, H, W) with one cube per contiguous slab,
+    so reading a timestamp is one sequential read of the memory map.
+    Missing bands are NaN. Returns the number of cubes written.
+    """
+    orbit = str(groups['orbit'][0])
+    paths = groups['path']
+    n, n_filters = paths.shape
+    shape = _load_band(paths[0, 0]).shape
+    processor = None
+    if preprocess:
+        from vmc_processor import VMCImageProcessor
+        processor = VMCImageProcessor(output_dir, output_dir)
+
+    output_dir = Path(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    tmp_path = output_dir / f"cubes_{orbit}.npy.tmp"
+    cubes = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=(n, n_filters) + shape)
+    shifts = np.zeros((n, n_filters, 2), dtype=np.float32)
+    peaks = np.full((n, n_filters), np.nan, dtype=np.float32)
+    present = paths != ''
+    errors = []
+
+    for start in range(0, n, batch_cubes):
+        stop = min(start + batch_cubes, n)
+        block = np.full((stop - start, n_filters) + shape, np.nan, dtype=np.float32)
+        with vmc_metrics.timer('cubes.load'):
+            for i in range(start, stop):
+                for j in range(n_filters):
+                    if not present[i, j]:
+                        continue
+                    try:
+                        block[i - start, j] = _load_band(paths[i, j], shape)
+                    except Exception as e:
+                        present[i, j] = False
+                        errors.append((paths[i, j], f"{type(e).__name__}: {e}"))
+
+        # All present bands of the block as one (P, H, W) stack
+        rows, bands = np.nonzero(present[start:stop])
+        frames = block[rows, bands]
+        if not len(frames):
+            cubes[start:stop] = block
+            continue
+        with vmc_metrics.timer('cubes.normalize'):
+            if processor is not None:
+                frames = processor.preprocess_stack(frames, out=frames)
+            else:
+                frames /= 255.0
+
+        if register:
+            with vmc_metrics.timer('cubes.register'):
+                # Reference band of the same cube for every frame
+                reference_rows = np.searchsorted(rows, rows, side='left')
+                has_reference = present[start:stop][rows, 0]
+                reference = frames[reference_rows]
+                dy, dx, peak = subpixel_shifts(reference, frames, fft_workers)
+                dy = np.where(has_reference & (bands > 0), dy, 0.0)
+                dx = np.where(has_reference & (bands > 0), dx, 0.0)
+                moving = (dy != 0) | (dx != 0)
+                if moving.any():
+                    frames[moving] = apply_shifts(frames[moving], dy[moving], dx[moving], fft_workers)
+                shifts[start + rows, bands] = np.stack([dy, dx], axis=1)
+                peaks[start + rows, bands] = np.where(has_reference, peak, np.nan)
+
+        block[rows, bands] = frames
+        cubes[start:stop] = block
+        vmc_metrics.count('cubes.written', stop - start)
+
+    cubes.flush()
+    del cubes
+    os.replace(tmp_path, output_dir / f"cubes_{orbit}.npy")
+    np.savez(
+        output_dir / f"cubes_{orbit}.npz",
+        time=groups['time'],
+        filters=groups['filters'],
+        name=groups['name'],
+        offset=groups['offset'],
+        present=present,
+        shift=shifts,
+        peak=peaks,
+    )
+    for path, error in errors:
+        print(f"  Failed to load {path}: {error}")
+    return n
+
+def open_cubes(output_dir, orbit):
+    """Memory-map the cubes of one orbit; returns (cubes, metadata dict)"""
+    output_dir = Path(output_dir)
+    cubes = np.load(output_dir / f"cubes_{orbit}.npy", mmap_mode='r')
+    with np.load(output_dir / f"cubes_{orbit}.npz") as meta:
+        metadata = {key: meta[key] for key in meta.files}
+    return cubes, metadata
+
+def _cube_task(args):
+    """Worker: build the cubes of one orbit, capturing the orbit's error"""
+    groups, output_dir, options = args
+    orbit = str(groups['orbit'][0])
+    start = time.perf_counter()
+    try:
+        n = build_orbit_cubes(groups, output_dir, **options)
+    except Exception as e:
+        tmp_path = Path(output_dir) / f"cubes_{orbit}.npy.tmp"
+        if tmp_path.exists():
+            tmp_path.unlink()
+        return orbit, 0, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+    return orbit, n, time.perf_counter() - start, None
+
+def build_cubes(table, output_dir, reference='UV2', tolerance=30.0, require_all=False, orbits=None,
+                workers=None, **options):
+    """
+    Group frames across filters and write per-orbit multispectral cubes in a process pool
+
+    Parameters:
+    table: filter -> time-sorted columns, from frame_table_from_index/labels
+    output_dir: directory for cubes_<orbit>.npy/.npz
+    reference, tolerance, require_all: passed to match_frames
+    orbits: optional subset of orbits
+    workers: number of processes (one orbit per task, 1 = in process)
+    options: passed to build_orbit_cubes (preprocess, register, batch_cubes, fft_workers)
+    """
+    start = time.perf_counter()
+    groups = match_frames(table, reference, tolerance, require_all)
+    print(f"Matched {len(groups['time'])} {reference} frames in {time.perf_counter() - start:.2f} s "
+          f"({(groups['path'] != '').all(axis=1).sum()} with all {len(groups['filters'])} filters)")
+
+    tasks = []
+    for orbit in np.unique(groups['orbit']):
+        if orbits is not None and orbit not in orbits:
+            continue
+        selected = groups['orbit'] == orbit
+        orbit_groups = {key: value[selected] if key != 'filters' else value for key, value in groups.items()}
+        tasks.append((orbit_groups, str(output_dir), options))
+
+    total = 0
+    failed = []
+    def collect(results):
+        nonlocal total
+        for orbit, n, seconds, error in results:
+            if error is not None:
+                failed.append((orbit, error))
+                print(f"Orbit {orbit}: failed after {seconds:.1f} s")
+                continue
+            total += n
+            print(f"Orbit {orbit}: {n} cubes in {seconds:.1f} s")
+
+    if workers == 1:
+        collect(_cube_task(task) for task in tasks)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(vmc_metrics.worker_call, _cube_task, task) for task in tasks]
+            collect(vmc_metrics.unwrap(future.result()) for future in as_completed(futures))
+
+    print(f"\nWrote {total} cubes for {len(tasks)} orbits in {time.perf_counter() - start:.1f} s, "
+          f"{len(failed)} orbits failed")
+    for orbit, error in failed:
+        print(f"  Failed: orbit {orbit}: {error}")
+    return total
+
+if __name__ == "__main__":
+    from vmc_product_index import open_index
+
+    raw_dir = "/Users/n_welikala/cvprojects/venus/data/vmc/raw"
+    output_dir = "/Users/n_welikala/cvprojects/venus/data/vmc/cubes"
+
+    table = frame_table_from_index(open_index(raw_dir))
+    build_cubes(table, output_dir)
@@ -0,0 +1,239 @@
+import os
+import re
+from datetime import datetime, date
+
+# KEY = VALUE on one line (pointers start with ^, namespaced keys use :)
+ASSIGNMENT = re.compile(r'^\s*(\^?[A-Za-z][A-Za-z0-9_:]*)\s*=\s*(.*?)\s*$')
+COMMENT = re.compile(r'/\*.*?\*/', re.S)
+UNIT = re.compile(r'^(.*?)\s*<([^>]*)>$', re.S)
+INTEGER = re.compile(r'^[+-]?\d+$')
+RADIX = re.compile(r'^(\d+)#([0-9A-Fa-f+-]+)#$')
+FLOAT = re.compile(r'^[+-]?(\d+\.?\d*|\.\d+)([Ee][+-]?\d+)?$')
+DATETIME = re.compile(r'^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2})(?::(\d{2})(?:\.(\d+))?)?Z?$')
+DOY_DATETIME = re.compile(r'^(\d{4})-(\d{3})T(\d{2}):(\d{2})(?::(\d{2})(?:\.(\d+))?)?Z?$')
+DATE = re.compile(r'^(\d{4})-(\d{2})-(\d{2})$')
+QUOTED = re.compile(r'"[^"]*"')
+
+def _parse_datetime(text):
+    """Convert a PDS time string (calendar or day-of-year form) to datetime"""
+    match = DATETIME.match(text)
+    if match:
+        year, month, day, hour, minute, second, fraction = match.groups()
+        micro = int((fraction or '0')[:6].ljust(6, '0'))
+        return datetime(int(year), int(month), int(day), int(hour), int(minute), int(second or 0), micro)
+    match = DOY_DATETIME.match(text)
+    if match:
+        year, doy, hour, minute, second, fraction = match.groups()
+        base = datetime.strptime(f"{year}-{doy}", "%Y-%j")
+        micro = int((fraction or '0')[:6].ljust(6, '0'))
+        return base.replace(hour=int(hour), minute=int(minute), second=int(second or 0), microsecond=micro)
+    match = DATE.match(text)
+    if match:
+        return date(*map(int, match.groups()))
+    return None
+
+def _split_items(text):
+    """Split the inside of a (...) or {...} value on top-level commas"""
+    items, depth, quote, start = [], 0, False, 0
+    for i, ch in enumerate(text):
+        if ch == '"':
+            quote = not quote
+        elif quote:
+            continue
+        elif ch in '({':
+            depth += 1
+        elif ch in ')}':
+            depth -= 1
+        elif ch == ',' and depth == 0:
+            items.append(text[start:i])
+            start = i + 1
+    items.append(text[start:])
+    return [item.strip() for item in items if item.strip()]
+
+def parse_value(text, keep_units=False):
+    """Convert the text of a PDS3 value to a Python value
+
+    Quoted text becomes str (or datetime when it is a PDS time), numbers
+    int/float, times datetime/date and
+    (...) / {...} sequences tuples. Units such as <km> are dropped unless
+    keep_units is set, in which case a (value, unit) tuple is returned.
+    """
+    text = text.strip()
+    if not text:
+        return None
+
+    if text[0] == '"' and text[-1] == '"' and len(text) >= 2:
+        inner = ' '.join(text[1:-1].split())
+        if inner[:4].isdigit():
+            time_value = _parse_datetime(inner)
+            if isinstance(time_value, datetime):
+                return time_value
+        return inner
+    if text[0] == "'" and text[-1] == "'" and len(text) >= 2:
+        return text[1:-1]
+    if text[0] in '({' and text[-1] in ')}':
+        return tuple(parse_value(item, keep_units) for item in _split_items(text[1:-1]))
+
+    match = UNIT.match(text)
+    if match:
+        value = parse_value(match.group(1))
+        return (value, match.group(2).strip()) if keep_units else value
+
+    if INTEGER.match(text):
+        return int(text)
+    if FLOAT.match(text):
+        return float(text)
+    match = RADIX.match(text)
+    if match:
+        return int(match.group(2), int(match.group(1)))
+    if text[0].isdigit():
+        time_value = _parse_datetime(text)
+        if time_value is not None:
+            return time_value
+    return text
+
+def _is_complete(text):
+    """True once quotes, parentheses and braces in a value are balanced"""
+    if text.count('"') % 2:
+        return False
+    # Brackets inside quoted strings are text, not structure
+    text = QUOTED.sub('', text)
+    return text.count('(') <= text.count(')') and text.count('{') <= text.count('}')
+
+def _store(container, key, value):
+    """Add a key, turning repeated keys into lists"""
+    if key in container:
+        existing = container[key]
+        if isinstance(existing, list):
+            existing.append(value)
+        else:
+            container[key] = [existing, value]
+    else:
+        container[key] = value
+
+def parse_label_text(text, keep_units=False):
+    """Parse PDS3 label text into a dict in one pass
+
+    OBJECT and GROUP blocks become nested dicts stored under their name.
+    Repeated keywords or objects of the same name become lists.
+    """
+    text = COMMENT.sub('', text)
+    root = {}
+    stack = [root]
+    pending_key, pending_value = None, ''
+
+    for line in text.splitlines():
+        if pending_key is not None:
+            # Continuation of a multi-line quoted string or sequence
+            pending_value += '\n' + line
+            if not _is_complete(pending_value):
+                continue
+            _store(stack[-1], pending_key, parse_value(pending_value, keep_units))
+            pending_key, pending_value = None, ''
+            continue
+
+        stripped = line.strip()
+        if not stripped:
+            continue
+        if stripped == 'END':
+            break
+
+        match = ASSIGNMENT.match(line)
+        if not match:
+            continue
+        key, value = match.groups()
+
+        if key in ('OBJECT', 'GROUP'):
+            block = {}
+            _store(stack[-1], value.strip('"'), block)
+            stack.append(block)
+        elif key in ('END_OBJECT', 'END_GROUP'):
+            if len(stack) > 1:
+                stack.pop()
+        elif _is_complete(value):
+            _store(stack[-1], key, parse_value(value, keep_units))
+        else:
+            pending_key, pending_value = key, value
+
+    return root
+
+def parse_label(lbl_path, keep_units=False):
+    """Read and parse a PDS3 LBL file"""
+    with open(lbl_path, 'r', errors='replace') as f:
+        return parse_label_text(f.read(), keep_units)
+
+def flatten_label(label, prefix=''):
+    """Flatten nested OBJECT/GROUP dicts to dotted keys (IMAGE.LINES)"""
+    flat = {}
+    for key, value in label.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten_label(value, name + '.'))
+        elif isinstance(value, list) and value and isinstance(value[0], dict):
+            for i, block in enumerate(value):
+                flat.update(flatten_label(block, f"{name}[{i}]."))
+        else:
+            flat[name] = value
+    return flat
+
+def _parse_flat(lbl_path):
+    """Worker: parse one label into flat keys (errors become an empty row)"""
+    try:
+        return flatten_label(parse_label(lbl_path))
+    except (OSError, ValueError) as e:
+        return {'ERROR': str(e)}
+
+def _to_column(values):
+    """Turn a list of Python values into the tightest NumPy column"""
+    import numpy as np
+
+    present = [v for v in values if v is not None]
+    if present and all(isinstance(v, datetime) for v in present):
+        return np.array([np.datetime64(v, 'us') if v is not None else np.datetime64('NaT')
+                         for v in values], dtype='datetime64[us]')
+    if present and all(isinstance(v, int) and not isinstance(v, bool) for v in present) \
+            and len(present) == len(values):
+        return np.array(values, dtype=np.int64)
+    if present and all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in present):
+        return np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    column = np.empty(len(values), dtype=object)
+    column[:] = values
+    return column
+
+def parse_labels(lbl_paths, keys=None, workers=None, chunksize=64):
+    """
+    Parse many labels across worker processes into a columnar table
+
+    Parameters:
+    lbl_paths: list of LBL file paths
+    keys: flat keys to keep (e.g. ['START_TIME', 'IMAGE.LINES']); None keeps all
+    workers: number of processes (1 parses in this process)
+    chunksize: labels handed to a worker at a time
+
+    Returns a dict of column name -> NumPy array, including a 'path' column.
+    Times are datetime64[us], numbers int64/float64 (NaN where missing).
+    """
+    import numpy as np
+
+    lbl_paths = [os.fspath(path) for path in lbl_paths]
+    if workers == 1 or len(lbl_paths) < 2 * chunksize:
+        rows = [_parse_flat(path) for path in lbl_paths]
+    else:
+        # Imported here: multiprocessing adds ~20 ms to every label-only script
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            rows = list(pool.map(_parse_flat, lbl_paths, chunksize=chunksize))
+
+    if keys is None:
+        keys = []
+        seen = set()
+        for row in rows:
+            for key in row:
+                if key not in seen:
+                    seen.add(key)
+                    keys.append(key)
+
+    table = {'path': np.array(lbl_paths, dtype=object)}
+    for key in keys:
+        table[key] = _to_column([row.get(key) for row in rows])
+    return table
@@ -0,0 +1,295 @@
+import os
+import io
+import sys
+import time
+import queue
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+import vmc_metrics
+
+DEFAULT_BASE_URL = "https://archives.esac.esa.int/psa/ftp/VENUS-EXPRESS/VMC/VEX-V-VMC-3-RDR-EXT1-V3.0/BROWSE/"
+
+@dataclass
+class Stage:
+    """One pipeline step applied to a single orbit"""
+    name: str
+    run: Callable[[str], object]
+    workers: int = 1
+    queue_size: int = 4
+
+class _ThreadMutableStdout(io.TextIOBase):
+    """stdout wrapper that can be silenced per thread (redirect_stdout is process-wide)"""
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+    
+    def write(self, text):
+        if getattr(self.local, 'muted', False):
+            return len(text)
+        return self.stream.write(text)
+    
+    def flush(self):
+        self.stream.flush()
+
+@contextmanager
+def _muted():
+    """Silence print() in the current thread only"""
+    stdout = sys.stdout
+    if not isinstance(stdout, _ThreadMutableStdout):
+        yield
+        return
+    stdout.local.muted = True
+    try:
+        yield
+    finally:
+        stdout.local.muted = False
+
+class Checkpoint:
+    """SQLite record of which (orbit, stage) steps have finished or failed"""
+    def __init__(self, checkpoint_path: str):
+        os.makedirs(os.path.dirname(os.path.abspath(checkpoint_path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(checkpoint_path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                orbit TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT,
+                seconds REAL,
+                updated REAL NOT NULL,
+                PRIMARY KEY (orbit, stage)
+            )
+        """)
+
+    def done_stages(self, orbit: str) -> set:
+        with self.lock:
+            rows = self.conn.execute("SELECT stage FROM checkpoints WHERE orbit = ? AND status = 'done'",
+                                     (orbit,)).fetchall()
+        return {row[0] for row in rows}
+
+    def mark(self, orbit: str, stage: str, status: str, error: Optional[str] = None, seconds: float = None):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?)",
+                              (orbit, stage, status, error, seconds, time.time()))
+
+    def reset(self, stage: Optional[str] = None):
+        """Forget progress (for one stage, or all) so it runs again"""
+        with self.lock:
+            if stage:
+                self.conn.execute("DELETE FROM checkpoints WHERE stage = ?", (stage,))
+            else:
+                self.conn.execute("DELETE FROM checkpoints")
+
+class PipelineRunner:
+    """Moves orbits through a chain of stages with overlapping execution
+
+    Each stage has its own pool of worker threads and a bounded input queue,
+    so orbit N can be processed while orbit N+1 is still downloading and a
+    slow stage applies back-pressure to the ones before it. Every finished
+    (orbit, stage) is checkpointed; on restart an orbit enters the chain at
+    its first unfinished stage. A failing stage stops that orbit only.
+    """
+    def __init__(self, stages: List[Stage], checkpoint: Checkpoint):
+        self.stages = stages
+        self.checkpoint = checkpoint
+        self.queues = [queue.Queue(maxsize=stage.queue_size) for stage in stages]
+        self.lock = threading.Lock()
+        self.report = {stage.name: {'done': 0, 'failed': 0, 'seconds': 0.0} for stage in stages}
+
+    def _worker(self, i: int):
+        stage = self.stages[i]
+        while True:
+            orbit = self.queues[i].get()
+            if orbit is None:
+                break
+
+            start = time.perf_counter()
+            try:
+                with vmc_metrics.timer('pipeline.stage', stage=stage.name):
+                    stage.run(orbit)
+            except Exception as e:
+                seconds = time.perf_counter() - start
+                self.checkpoint.mark(orbit, stage.name, 'failed', f"{type(e).__name__}: {e}", seconds)
+                with self.lock:
+                    self.report[stage.name]['failed'] += 1
+                print(f"[{stage.name}] orbit {orbit} failed: {e}")
+                continue
+
+            seconds = time.perf_counter() - start
+            self.checkpoint.mark(orbit, stage.name, 'done', seconds=seconds)
+            with self.lock:
+                self.report[stage.name]['done'] += 1
+                self.report[stage.name]['seconds'] += seconds
+            print(f"[{stage.name}] orbit {orbit} done in {seconds:.1f} s")
+            self._forward(orbit, i + 1)
+
+    def _forward(self, orbit: str, i: int):
+        """Send an orbit to the next stage it still needs"""
+        done = self.checkpoint.done_stages(orbit)
+        while i < len(self.stages) and self.stages[i].name in done:
+            i += 1
+        if i < len(self.stages):
+            self.queues[i].put(orbit)
+
+    def run(self, orbits: List[str]) -> Dict[str, Dict]:
+        """Run all orbits through the pipeline and return per-stage counts"""
+        start = time.perf_counter()
+        pools = []
+        for i, stage in enumerate(self.stages):
+            threads = [threading.Thread(target=self._worker, args=(i,), daemon=True)
+                       for _ in range(max(1, stage.workers))]
+            for thread in threads:
+                thread.start()
+            pools.append(threads)
+
+        # Feed orbits from the main thread (blocks when the first queues are full)
+        for orbit in orbits:
+            self._forward(orbit, 0)
+
+        # Shut stages down in order: once stage i drains nothing new reaches i+1
+        for i, threads in enumerate(pools):
+            for _ in threads:
+                self.queues[i].put(None)
+            for thread in threads:
+                thread.join()
+
+        elapsed = time.perf_counter() - start
+        print(f"\nPipeline finished in {elapsed:.1f} s")
+        for name, counts in self.report.items():
+            print(f"  {name}: {counts['done']} done, {counts['failed']} failed, "
+                  f"{counts['seconds']:.1f} s of work")
+        return self.report
+
+def build_stages(base_dir: str, base_url: str = DEFAULT_BASE_URL, max_pairs: int = None,
+                 workers: Dict[str, int] = None, process_workers: int = 1, detect_workers: int = 1,
+                 output_format: str = 'npy', quiet: bool = True, statistics: bool = False) -> List[Stage]:
+    """
+    The standard download -> extract -> process -> detect chain for one data directory
+
+    Parameters:
+    base_dir: VMC data directory (raw/, filtered/uv2/, processed/uv2/ live under it)
+    max_pairs: limit JPG/LBL pairs per orbit (None = all)
+    workers: threads per stage, e.g. {'download': 2, 'process': 1}
+    process_workers, detect_workers: processes used inside one orbit's process/detect step
+    quiet: suppress the per-file log lines of the underlying tools
+    statistics: add a 'statistics' stage after 'process' (statistics/uv2/stats_<orbit>.npz)
+    """
+    from vmc_downloader import VenusExpressDownloader
+    from vmc_uv2_extract import extract_uv2_images
+
+    raw_dir = os.path.join(base_dir, 'raw')
+    filtered_dir = os.path.join(base_dir, 'filtered', 'uv2')
+    processed_dir = os.path.join(base_dir, 'processed', 'uv2')
+    workers = workers or {}
+    downloader = VenusExpressDownloader(base_url=base_url, base_output_dir=raw_dir)
+
+    def quietly(fn, *args, **kwargs):
+        if not quiet:
+            return fn(*args, **kwargs)
+        with _muted():
+            return fn(*args, **kwargs)
+
+    def download(orbit):
+        pairs = quietly(downloader.download_orbit_data, f"{orbit}/", max_pairs)
+        if pairs == 0:
+            raise RuntimeError("no files downloaded")
+
+    def extract(orbit):
+        quietly(extract_uv2_images, raw_dir, base_dir, orbits=[orbit])
+
+    def process(orbit):
+        from vmc_processor import VMCImageProcessor
+        processor = VMCImageProcessor(filtered_dir, processed_dir, output_format=output_format)
+        report = quietly(processor.process_all_images, workers=process_workers, orbits=[orbit])
+        if report['failed']:
+            # Fail the stage so the checkpoint is not marked done and a resume retries the images
+            raise RuntimeError(f"{len(report['failed'])} images failed")
+
+    def statistics_stage(orbit):
+        from vmc_statistics import orbit_statistics
+        stats_dir = os.path.join(base_dir, 'statistics', 'uv2')
+        os.makedirs(stats_dir, exist_ok=True)
+        orbit_statistics(processed_dir, orbit).save(os.path.join(stats_dir, f"stats_{orbit}.npz"))
+
+    def detect(orbit):
+        from vmc_feature_detector import VMCFeatureDetector
+        detector = VMCFeatureDetector(processed_dir)
+        report = quietly(detector.analyze_batch, orbits=[orbit], workers=detect_workers)
+        if report['failed']:
+            raise RuntimeError(f"{len(report['failed'])} images failed")
+
+    stages = [
+        Stage('download', download, workers.get('download', 2)),
+        Stage('extract', extract, workers.get('extract', 1)),
+        Stage('process', process, workers.get('process', 1)),
+        Stage('detect', detect, workers.get('detect', 1)),
+    ]
+    if statistics:
+        stages.insert(3, Stage('statistics', statistics_stage, workers.get('statistics', 1)))
+    return stages
+
+def parse_stage_workers(text: str) -> Dict[str, int]:
+    """Parse 'download=4,process=2' into a dict"""
+    workers = {}
+    for item in filter(None, (text or '').split(',')):
+        name, _, count = item.partition('=')
+        workers[name.strip()] = int(count)
+    return workers
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the VMC download -> extract -> process -> detect pipeline")
+    parser.add_argument('base_dir', help="VMC data directory (raw/, filtered/, processed/ are created under it)")
+    parser.add_argument('--base-url', default=DEFAULT_BASE_URL)
+    parser.add_argument('--orbits', nargs='*', help="orbit names (default: every orbit on the server)")
+    parser.add_argument('--limit', type=int, help="only the first N orbits")
+    parser.add_argument('--max-pairs', type=int, help="JPG/LBL pairs per orbit")
+    parser.add_argument('--stage-workers', default='', help="threads per stage, e.g. download=4,process=2")
+    parser.add_argument('--process-workers', type=int, default=1, help="processes per orbit in the process stage")
+    parser.add_argument('--detect-workers', type=int, default=1, help="processes per orbit in the detect stage")
+    parser.add_argument('--output-format', choices=['jpg', 'npy'], default='npy')
+    parser.add_argument('--statistics', action='store_true', help="add the per-orbit image statistics stage")
+    parser.add_argument('--checkpoint', help="checkpoint database (default: <base_dir>/pipeline.sqlite)")
+    parser.add_argument('--rerun', help="forget checkpoints of this stage ('all' for every stage)")
+    parser.add_argument('--verbose', action='store_true', help="show per-file output of each stage")
+    parser.add_argument('--metrics', help="write step timings and counters to this Prometheus text file")
+    parser.add_argument('--metrics-log', help="append the metrics as one JSON line to this log")
+    parser.add_argument('--profile', help="save cProfile stats of all stage threads and workers to this file")
+    args = parser.parse_args(argv)
+
+    stages = build_stages(args.base_dir, args.base_url, args.max_pairs, parse_stage_workers(args.stage_workers),
+                          args.process_workers, args.detect_workers, args.output_format, quiet=not args.verbose,
+                          statistics=args.statistics)
+    checkpoint = Checkpoint(args.checkpoint or os.path.join(args.base_dir, 'pipeline.sqlite'))
+    if args.rerun:
+        checkpoint.reset(None if args.rerun == 'all' else args.rerun)
+
+    orbits = args.orbits
+    if not orbits:
+        from vmc_downloader import VenusExpressDownloader
+        downloader = VenusExpressDownloader(base_url=args.base_url,
+                                            base_output_dir=os.path.join(args.base_dir, 'raw'))
+        orbits = [directory.strip('/') for directory in downloader.get_orbit_directories()]
+    if args.limit:
+        orbits = orbits[:args.limit]
+
+    # Lets each stage thread silence its own output
+    stdout = sys.stdout
+    sys.stdout = _ThreadMutableStdout(stdout)
+    if args.metrics or args.metrics_log or args.profile:
+        vmc_metrics.enable(profile=bool(args.profile))
+    try:
+        PipelineRunner(stages, checkpoint).run(orbits)
+    finally:
+        sys.stdout = stdout
+        if vmc_metrics.is_enabled():
+            vmc_metrics.finish(args.metrics, args.metrics_log, args.profile)
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,68 @@
 import os
 import numpy as np
-from PIL import Image
-import matplotlib.pyplot as plt
-from skimage import exposure, filters  # Changed from restoration to filters
 from pathlib import Path
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from vmc_lazy import lazy_import
+from vmc_result_cache import ResultCache, hash_params
+from vmc_array_store import save_array, load_array
+import vmc_metrics
+
+# Heavy imports are deferred until an image is actually processed or shown
+Image = lazy_import('PIL.Image')
+plt = lazy_import('matplotlib.pyplot')
+exposure = lazy_import('skimage.exposure')
+filters = lazy_import('skimage.filters')  # Changed from restoration to filters
+ndimage = lazy_import('scipy.ndimage')
+
+# Bump when preprocess_image changes in a way that alters its output
+PROCESSING_VERSION = 1
 
 class VMCImageProcessor:
-    def __init__(self, filtered_dir, processed_dir):
+    def __init__(self, filtered_dir, processed_dir, low_percentile=2, high_percentile=98, sigma=0.5,
+                 output_format='jpg', output_dtype='float32'):
+        """
+        Parameters:
+        filtered_dir: directory of per-orbit UV2 JPG/LBL files
+        processed_dir: directory for processed outputs
+        output_format: 'jpg' (8-bit matplotlib image) or 'npy' (lossless single-channel array)
+        output_dtype: 'float32' or 'uint16', used by the 'npy' format
+        """
         self.filtered_dir = Path(filtered_dir)
         self.processed_dir = Path(processed_dir)
+        self.low_percentile = low_percentile
+        self.high_percentile = high_percentile
+        self.sigma = sigma
+        self.output_format = output_format
+        self.output_dtype = output_dtype
         os.makedirs(self.processed_dir, exist_ok=True)
     
+    def processing_params(self):
+        """Parameters that determine the processed output"""
+        return {
+            'low_percentile': self.low_percentile,
+            'high_percentile': self.high_percentile,
+            'sigma': self.sigma,
+            'output_format': self.output_format,
+            'output_dtype': self.output_dtype,
+        }
+    
+    def output_name(self, jpg_name):
+        """Name of the processed output for an input JPG name"""
+        if self.output_format == 'npy':
+            return f"proc_{Path(jpg_name).stem}.npy"
+        return f"proc_{jpg_name}"
+    
     def load_image(self, file_path):
         """Load an image and convert to numpy array"""
-        return np.array(Image.open(file_path))
+        with vmc_metrics.timer('process.load'):
+            if vmc_metrics.is_enabled():
+                # Extra stat only while recording
+                vmc_metrics.count('process.bytes_in', os.path.getsize(file_path))
+            if Path(file_path).suffix == '.npy':
+                return load_array(file_path)
+            return np.array(Image.open(file_path))
     
     def preprocess_image(self, image):
         """Apply basic preprocessing steps"""
@@ -21,50 +70,226 @@ class VMCImageProcessor:
         img_float = image.astype(float)
         
         # Apply contrast stretching
-        p2, p98 = np.percentile(img_float, (2, 98))
-        img_contrast = exposure.rescale_intensity(img_float, in_range=(p2, p98))
+        with vmc_metrics.timer('process.percentile'):
+            p2, p98 = np.percentile(img_float, (self.low_percentile, self.high_percentile))
+        with vmc_metrics.timer('process.stretch'):
+            img_contrast = exposure.rescale_intensity(img_float, in_range=(p2, p98))
         
         # Denoise using Gaussian filter
-        img_denoised = filters.gaussian(img_contrast, sigma=0.5)  
+        with vmc_metrics.timer('process.gaussian'):
+            img_denoised = filters.gaussian(img_contrast, sigma=self.sigma)
         
         # Normalize to 0-1 range
-        img_normalized = exposure.rescale_intensity(img_denoised)
+        with vmc_metrics.timer('process.normalize'):
+            img_normalized = exposure.rescale_intensity(img_denoised)
         
         return img_normalized
     
-    def process_all_images(self):
-        """Process all UV2 JPG images in the filtered directory"""
-        # Create output directory structure
-        for orbit_dir in self.filtered_dir.glob("*"):
-            if orbit_dir.is_dir():
+    def preprocess_stack(self, stack, out=None):
+        """Apply preprocess_image to an (N, H, W) stack in float32
+        
+        Per-frame percentiles come from one vectorized call, the stretch and
+        normalization are done in place and the Gaussian runs over the whole
+        stack (sigma 0 along the frame axis). Matches preprocess_image frame by
+        frame to within 1e-5 absolute (float32 vs float64 arithmetic).
+        
+        Parameters:
+        stack: array of shape (N, H, W), any numeric dtype
+        out: optional float32 array of the same shape to write into
+            (may be the input itself if it is already float32)
+        """
+        if out is None:
+            out = np.array(stack, dtype=np.float32)
+        elif out is not stack:
+            out[...] = stack
+        
+        # Contrast stretch: clip each frame to its own percentiles and map to 0-1
+        with vmc_metrics.timer('process.percentile'):
+            low, high = np.percentile(out, (self.low_percentile, self.high_percentile), axis=(1, 2))
+        with vmc_metrics.timer('process.stretch'):
+            low = low.astype(np.float32)[:, None, None]
+            span = (high.astype(np.float32)[:, None, None] - low)
+            np.clip(out, low, low + span, out=out)
+            np.subtract(out, low, out=out, where=span > 0)
+            np.divide(out, span, out=out, where=span > 0)
+            _clip_constant_frames(out, span)
+        
+        # Same kernel as filters.gaussian (mode='nearest', truncate=4), per frame
+        with vmc_metrics.timer('process.gaussian'):
+            ndimage.gaussian_filter(out, sigma=(0, self.sigma, self.sigma), mode='nearest',
+                                    truncate=4.0, output=out)
+        
+        # Normalize each frame to 0-1
+        with vmc_metrics.timer('process.normalize'):
+            low = out.min(axis=(1, 2), keepdims=True)
+            span = out.max(axis=(1, 2), keepdims=True) - low
+            np.subtract(out, low, out=out, where=span > 0)
+            np.divide(out, span, out=out, where=span > 0)
+            _clip_constant_frames(out, span)
+        return out
+    
+    def process_image(self, jpg_file, output_path):
+        """Load, preprocess and save one image"""
+        with vmc_metrics.timer('process.image'):
+            img = self.load_image(jpg_file)
+            processed_img = self.preprocess_image(img)
+            self.save_output(output_path, processed_img)
+    
+    def save_output(self, output_path, processed_img):
+        """Write one processed frame in the configured output format"""
+        with vmc_metrics.timer('process.save'):
+            if self.output_format == 'npy':
+                save_array(output_path, processed_img, self.output_dtype)
+            else:
+                plt.imsave(output_path, processed_img, cmap='gray')
+            if vmc_metrics.is_enabled():
+                vmc_metrics.count('process.bytes_out', os.path.getsize(output_path))
+    
+    def process_batch(self, tasks):
+        """Load a list of (input, output) frames into one stack and preprocess it together
+        
+        Returns [(input, output, error)]; frames that fail to load or do not
+        match the stack shape are processed one by one instead.
+        """
+        results = []
+        frames, batch = [], []
+        for jpg_file, output_path in tasks:
+            try:
+                img = self.load_image(jpg_file)
+            except Exception as e:
+                results.append((jpg_file, output_path, f"{type(e).__name__}: {e}"))
+                continue
+            if img.ndim == 2 and (not frames or img.shape == frames[0].shape):
+                frames.append(img)
+                batch.append((jpg_file, output_path))
+            else:
+                results.extend(_process_chunk(self, [(jpg_file, output_path)]))
+        
+        if frames:
+            with vmc_metrics.timer('process.stack'):
+                stack = self.preprocess_stack(np.stack(frames))
+            for (jpg_file, output_path), processed_img in zip(batch, stack):
+                try:
+                    self.save_output(output_path, processed_img)
+                    results.append((jpg_file, output_path, None))
+                except Exception as e:
+                    results.append((jpg_file, output_path, f"{type(e).__name__}: {e}"))
+        return results
+    
+    def _collect_tasks(self, orbits=None):
+        """List (input, output) paths for every UV2 JPG, creating output directories"""
+        tasks = []
+        for orbit_dir in sorted(self.filtered_dir.glob("*")):
+            if orbit_dir.is_dir() and (orbits is None or orbit_dir.name in orbits):
                 output_orbit_dir = self.processed_dir / orbit_dir.name
                 os.makedirs(output_orbit_dir, exist_ok=True)
                 
-                # Process each JPG in the orbit directory
-                for jpg_file in orbit_dir.glob("*UV2.JPG"):
-                    print(f"Processing {jpg_file.name}")
-                    
-                    # Load and process image
-                    img = self.load_image(jpg_file)
-                    processed_img = self.preprocess_image(img)
-                    
-                    # Save processed image
-                    output_path = output_orbit_dir / f"proc_{jpg_file.name}"
-                    plt.imsave(output_path, processed_img, cmap='gray')
+                for jpg_file in sorted(orbit_dir.glob("*UV2.JPG")):
+                    tasks.append((jpg_file, output_orbit_dir / self.output_name(jpg_file.name)))
+        return tasks
+    
+    def process_all_images(self, workers=1, chunksize=16, ordered=True, verbose=True, use_cache=True,
+                           batched=False, orbits=None):
+        """Process all UV2 JPG images in the filtered directory
+        
+        Parameters:
+        workers: int, number of worker processes (1 runs in this process)
+        chunksize: int, images handed to a worker at a time
+        ordered: bool, report results in input order rather than as they finish
+        verbose: bool, print a line per processed file
+        use_cache: bool, skip outputs already produced from the same input
+            content, parameters and code version
+        batched: bool, preprocess each chunk as one float32 stack (preprocess_stack)
+        orbits: optional list of orbit names to restrict processing to
+        
+        A failing image is recorded and skipped instead of aborting the run.
+        Returns a dict with the processed/skipped counts and a list of (path, error).
+        """
+        start = time.perf_counter()
+        tasks = self._collect_tasks(orbits)
+        report = {'processed': 0, 'skipped': 0, 'failed': []}
+        
+        cache = None
+        keys = {}
+        if use_cache:
+            cache = ResultCache(self.processed_dir / '.process_cache.sqlite')
+            params_hash = hash_params(self.processing_params(), PROCESSING_VERSION)
+            pending = []
+            for jpg_file, output_path in tasks:
+                key = cache.key_for(jpg_file, params_hash)
+                if cache.is_current(output_path, key):
+                    report['skipped'] += 1
+                    vmc_metrics.count('process.skipped')
+                else:
+                    keys[output_path] = key
+                    pending.append((jpg_file, output_path))
+            tasks = pending
+        
+        chunks = [tasks[i:i + chunksize] for i in range(0, len(tasks), chunksize)]
+        
+        if workers == 1:
+            results = (_process_chunk(self, chunk, batched) for chunk in chunks)
+            self._collect_results(results, report, verbose, cache, keys)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                # worker_call/unwrap carry each worker's metrics back to this process
+                n = len(chunks)
+                if ordered:
+                    results = map(vmc_metrics.unwrap, pool.map(vmc_metrics.worker_call, [_process_chunk] * n,
+                                                               [self] * n, chunks, [batched] * n))
+                else:
+                    futures = [pool.submit(vmc_metrics.worker_call, _process_chunk, self, chunk, batched)
+                               for chunk in chunks]
+                    results = (vmc_metrics.unwrap(future.result()) for future in as_completed(futures))
+                self._collect_results(results, report, verbose, cache, keys)
+        
+        if cache is not None:
+            cache.close()
+        
+        elapsed = time.perf_counter() - start
+        print(f"\nProcessed {report['processed']} images in {elapsed:.1f} s "
+              f"({report['processed'] / max(elapsed, 1e-9):.1f} images/s), "
+              f"{report['skipped']} up to date, {len(report['failed'])} failed")
+        for path, error in report['failed']:
+            print(f"  Failed: {path}: {error}")
+        return report
     
-    def show_comparison(self, orbit, image_number):
-        """Show original vs processed image comparison"""
+    def _collect_results(self, results, report, verbose, cache=None, keys=None):
+        """Fold per-chunk results into the run report and record finished outputs"""
+        for chunk_results in results:
+            for jpg_file, output_path, error in chunk_results:
+                if error is None:
+                    report['processed'] += 1
+                    vmc_metrics.count('process.images')
+                    if cache is not None:
+                        cache.put(output_path, keys[output_path])
+                    if verbose:
+                        print(f"Processed {jpg_file.name}")
+                else:
+                    report['failed'].append((str(jpg_file), error))
+                    vmc_metrics.count('process.errors')
+    
+    def show_comparison(self, orbit, image_number, quicklook=None):
+        """Show original vs processed image comparison
+        
+        quicklook: optional QuicklookCache; shows cached thumbnails instead of
+            decoding both frames at full resolution
+        """
         # Construct file paths
         orig_path = self.filtered_dir / orbit / f"V{orbit}_{image_number:04d}_UV2.JPG"
-        proc_path = self.processed_dir / orbit / f"proc_V{orbit}_{image_number:04d}_UV2.JPG"
+        proc_path = self.processed_dir / orbit / self.output_name(f"V{orbit}_{image_number:04d}_UV2.JPG")
         
         if not orig_path.exists() or not proc_path.exists():
             print("Image files not found!")
             return
         
         # Load images
-        orig_img = self.load_image(orig_path)
-        proc_img = self.load_image(proc_path)
+        if quicklook is not None:
+            orig_img = quicklook.thumbnail(orig_path)
+            proc_img = quicklook.thumbnail(proc_path)
+        else:
+            orig_img = self.load_image(orig_path)
+            proc_img = self.load_image(proc_path)
         
         # Display comparison
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 6))
@@ -80,9 +305,29 @@ class VMCImageProcessor:
         plt.tight_layout()
         plt.show()
 
+def _clip_constant_frames(stack, span):
+    """Frames with no intensity range are only clipped to 0-1, as rescale_intensity does"""
+    constant = span.ravel() <= 0
+    if constant.any():
+        stack[constant] = np.clip(stack[constant], 0, 1)
+
+def _process_chunk(processor, chunk, batched=False):
+    """Worker: process a chunk of (input, output) paths, capturing per-file errors"""
+    if batched:
+        return processor.process_batch(chunk)
+    
+    results = []
+    for jpg_file, output_path in chunk:
+        try:
+            processor.process_image(jpg_file, output_path)
+            results.append((jpg_file, output_path, None))
+        except Exception as e:
+            results.append((jpg_file, output_path, f"{type(e).__name__}: {e}"))
+    return results
+
 if __name__ == "__main__":
     filtered_dir = "/Users/n_welikala/cvprojects/venus/data/vmc/filtered/uv2"
     processed_dir = "/Users/n_welikala/cvprojects/venus/data/vmc/processed/uv2"
     
     processor = VMCImageProcessor(filtered_dir, processed_dir)
-    processor.process_all_images()
+    processor.process_all_images(workers=os.cpu_count(), verbose=False)
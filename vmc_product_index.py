@@ -0,0 +1,204 @@
+import os
+import sqlite3
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from vmc_pds3 import parse_label
+
+LABEL_KEYS = {
+    'product_id': 'PRODUCT_ID',
+    'start_time': 'START_TIME',
+    'exposure_duration': 'EXPOSURE_DURATION',
+}
+
+def parse_label_fields(lbl_path):
+    """Read the handful of LBL keywords the index stores"""
+    label = parse_label(lbl_path)
+
+    fields = {key: label.get(label_key) for key, label_key in LABEL_KEYS.items()}
+    if isinstance(fields['start_time'], datetime):
+        fields['start_time'] = fields['start_time'].isoformat(timespec='microseconds')
+    if isinstance(fields['exposure_duration'], (int, float)):
+        fields['exposure_duration'] = float(fields['exposure_duration'])
+    else:
+        fields['exposure_duration'] = None
+    return fields
+
+class ProductIndex:
+    """Persistent SQLite catalog of downloaded VMC products
+
+    One row per product (a JPG and/or LBL sharing a base name) holding its
+    orbit, filter, label metadata and the size/mtime of both files. refresh()
+    stats every file (one scandir per directory) but only parses labels
+    that are new or whose size/mtime changed.
+    """
+    def __init__(self, index_path, data_dir):
+        self.index_path = index_path
+        self.data_dir = os.path.abspath(data_dir)
+        self.conn = sqlite3.connect(index_path)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS products (
+                orbit TEXT NOT NULL,
+                name TEXT NOT NULL,
+                filter TEXT NOT NULL,
+                dir TEXT NOT NULL,
+                jpg_path TEXT,
+                jpg_size INTEGER,
+                jpg_mtime REAL,
+                lbl_path TEXT,
+                lbl_size INTEGER,
+                lbl_mtime REAL,
+                product_id TEXT,
+                start_time TEXT,
+                exposure_duration REAL,
+                PRIMARY KEY (dir, name)
+            );
+            CREATE INDEX IF NOT EXISTS products_orbit_filter ON products (orbit, filter);
+            CREATE INDEX IF NOT EXISTS products_filter_time ON products (filter, start_time);
+            CREATE TABLE IF NOT EXISTS directories (
+                dir TEXT PRIMARY KEY,
+                mtime REAL NOT NULL
+            );
+        """)
+
+    def _scan_directory(self, dir_path, full=False):
+        """Sync the rows of one directory with its JPG/LBL files (full: re-parse every label)"""
+        orbit = os.path.basename(dir_path)
+        on_disk = defaultdict(dict)
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                if not entry.is_file():
+                    continue
+                base, ext = os.path.splitext(entry.name)
+                if ext not in ('.JPG', '.LBL'):
+                    continue
+                st = entry.stat()
+                on_disk[base][ext] = (entry.path, st.st_size, st.st_mtime)
+
+        known = {row['name']: row for row in
+                 self.conn.execute("SELECT * FROM products WHERE dir = ?", (dir_path,))}
+
+        parsed = 0
+        for name, files in on_disk.items():
+            jpg = files.get('.JPG', (None, None, None))
+            lbl = files.get('.LBL', (None, None, None))
+            row = known.get(name)
+
+            if not full and row and (row['jpg_size'], row['jpg_mtime'], row['lbl_size'], row['lbl_mtime']) == \
+                    (jpg[1], jpg[2], lbl[1], lbl[2]):
+                continue  # Unchanged
+
+            # Only re-parse the label when it is new or changed
+            if lbl[0] and (full or not (row and (row['lbl_size'], row['lbl_mtime']) == (lbl[1], lbl[2]))):
+                fields = parse_label_fields(lbl[0])
+                parsed += 1
+            elif row:
+                fields = {key: row[key] for key in LABEL_KEYS}
+            else:
+                fields = dict.fromkeys(LABEL_KEYS)
+
+            self.conn.execute("""
+                INSERT OR REPLACE INTO products
+                (orbit, name, filter, dir, jpg_path, jpg_size, jpg_mtime, lbl_path, lbl_size, lbl_mtime,
+                 product_id, start_time, exposure_duration)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (orbit, name, name[-3:], dir_path, jpg[0], jpg[1], jpg[2], lbl[0], lbl[1], lbl[2],
+                  fields['product_id'], fields['start_time'], fields['exposure_duration']))
+
+        removed = [name for name in known if name not in on_disk]
+        self.conn.executemany("DELETE FROM products WHERE dir = ? AND name = ?",
+                              [(dir_path, name) for name in removed])
+        return parsed
+
+    def refresh(self, full=False):
+        """Bring the index up to date with the data directory
+
+        Every directory is listed and its files stat'ed, so files rewritten
+        in place (same directory mtime) are picked up; labels are parsed only
+        when new or changed. Pass full=True to re-parse every label anyway.
+        """
+        start = time.perf_counter()
+        known_dirs = {row['dir']: row['mtime'] for row in self.conn.execute("SELECT * FROM directories")}
+        seen_dirs = set()
+        scanned = parsed = 0
+
+        with self.conn:
+            stack = [self.data_dir]
+            while stack:
+                dir_path = stack.pop()
+                seen_dirs.add(dir_path)
+                mtime = os.stat(dir_path).st_mtime
+                with os.scandir(dir_path) as entries:
+                    stack.extend(entry.path for entry in entries if entry.is_dir())
+
+                parsed += self._scan_directory(dir_path, full)
+                scanned += 1
+                if known_dirs.get(dir_path) != mtime:
+                    self.conn.execute("INSERT OR REPLACE INTO directories (dir, mtime) VALUES (?, ?)",
+                                      (dir_path, mtime))
+
+            # Forget directories that disappeared
+            for dir_path in set(known_dirs) - seen_dirs:
+                self.conn.execute("DELETE FROM products WHERE dir = ?", (dir_path,))
+                self.conn.execute("DELETE FROM directories WHERE dir = ?", (dir_path,))
+
+        return {'directories_scanned': scanned, 'labels_parsed': parsed,
+                'seconds': time.perf_counter() - start}
+
+    def counts_by_orbit_filter(self):
+        """Number of JPG images per (orbit, filter)"""
+        rows = self.conn.execute("""
+            SELECT orbit, filter, COUNT(*) AS n FROM products
+            WHERE jpg_path IS NOT NULL GROUP BY orbit, filter
+        """)
+        return [(row['orbit'], row['filter'], row['n']) for row in rows]
+
+    def file_counts_by_orbit(self):
+        """Number of JPG and LBL files per orbit"""
+        rows = self.conn.execute("""
+            SELECT orbit, COUNT(jpg_path) AS jpg, COUNT(lbl_path) AS lbl
+            FROM products GROUP BY orbit
+        """)
+        return [(row['orbit'], row['jpg'], row['lbl']) for row in rows]
+
+    def start_times(self, filter_type=None):
+        """Map orbit -> [(lbl_name, datetime)] for labels with a START_TIME"""
+        query = "SELECT orbit, name, start_time FROM products WHERE start_time IS NOT NULL"
+        params = ()
+        if filter_type:
+            query += " AND filter = ?"
+            params = (filter_type,)
+
+        orbit_times = defaultdict(list)
+        for row in self.conn.execute(query + " ORDER BY orbit, start_time", params):
+            try:
+                time_value = datetime.strptime(row['start_time'], "%Y-%m-%dT%H:%M:%S.%f")
+            except ValueError:
+                continue
+            orbit_times[row['orbit']].append((row['name'] + '.LBL', time_value))
+        return orbit_times
+
+    def products(self, filter_type=None, orbit=None):
+        """Rows for all products, optionally restricted to a filter and/or orbit"""
+        query = "SELECT * FROM products WHERE 1 = 1"
+        params = []
+        if filter_type:
+            query += " AND filter = ?"
+            params.append(filter_type)
+        if orbit:
+            query += " AND orbit = ?"
+            params.append(orbit)
+        return [dict(row) for row in self.conn.execute(query + " ORDER BY orbit, name", params)]
+
+    def close(self):
+        self.conn.close()
+
+def open_index(data_dir, refresh=True):
+    """Open (and by default refresh) the index stored inside a data directory"""
+    index = ProductIndex(os.path.join(data_dir, '.vmc_index.sqlite'), data_dir)
+    if refresh:
+        index.refresh()
+    return index
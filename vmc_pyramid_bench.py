@@ -0,0 +1,102 @@
+import time
+import argparse
+import numpy as np
+from scipy import ndimage
+from scipy.spatial import cKDTree
+
+from vmc_feature_detector import VMCFeatureDetector
+from vmc_synthetic import make_cloud_image
+
+def blob_recall(reference, candidate, scale_tolerance=2.0):
+    """Fraction of reference (y, x, sigma) blobs matched by a candidate blob
+
+    A match lies within the reference blob radius (sigma * sqrt 2, at least
+    2 px) and has a sigma within a factor of scale_tolerance.
+    """
+    if len(reference) == 0:
+        return 1.0
+    if len(candidate) == 0:
+        return 0.0
+    tree = cKDTree(candidate[:, :2])
+    matched = 0
+    for y, x, sigma in reference:
+        for j in tree.query_ball_point((y, x), max(sigma * np.sqrt(2), 2.0)):
+            ratio = candidate[j, 2] / sigma
+            if 1 / scale_tolerance <= ratio <= scale_tolerance:
+                matched += 1
+                break
+    return matched / len(reference)
+
+def edge_agreement(reference, candidate, tolerance=2):
+    """F1 score of two edge maps, counting edge pixels within tolerance pixels of the other map as matched"""
+    size = 2 * tolerance + 1
+    near_reference = ndimage.binary_dilation(reference, np.ones((size, size), bool))
+    near_candidate = ndimage.binary_dilation(candidate, np.ones((size, size), bool))
+    precision = (candidate & near_reference).sum() / max(candidate.sum(), 1)
+    recall = (reference & near_candidate).sum() / max(reference.sum(), 1)
+    return 2 * precision * recall / max(precision + recall, 1e-12)
+
+def time_detectors(detector, image):
+    """Run all three detectors on one frame and return (seconds per stage, outputs)"""
+    timings = {}
+    start = time.perf_counter()
+    pyramid = detector.build_pyramid(image)
+    timings['pyramid'] = time.perf_counter() - start
+
+    outputs = {}
+    for name, detect in (('edges', detector.detect_edges), ('blobs', detector.detect_blobs),
+                         ('regions', detector.detect_regions)):
+        start = time.perf_counter()
+        outputs[name] = detect(image, pyramid)
+        timings[name] = time.perf_counter() - start
+    timings['total'] = sum(timings.values())
+    return timings, outputs
+
+def benchmark_pyramid(n_frames=3, size=1024, seed=0, scale=1.0):
+    """Compare single-scale and pyramid detection time, blob recall and edge agreement on synthetic frames
+    
+    scale multiplies the frames; values well above 1 (e.g. 0-255 data) push the
+    automatic Canny sigma past max_edge_sigma so edges use the pyramid.
+    """
+    single = VMCFeatureDetector('.', mode='single')
+    pyramid = VMCFeatureDetector('.', mode='pyramid')
+
+    rows = []
+    for i in range(n_frames):
+        image = make_cloud_image((size, size), seed=seed + i) * scale
+        t_single, out_single = time_detectors(single, image)
+        t_pyramid, out_pyramid = time_detectors(pyramid, image)
+        rows.append({
+            'single': t_single,
+            'pyramid': t_pyramid,
+            'recall': blob_recall(out_single['blobs'], out_pyramid['blobs']),
+            'n_single': len(out_single['blobs']),
+            'n_pyramid': len(out_pyramid['blobs']),
+            'region_agreement': float((out_single['regions'] == out_pyramid['regions']).mean()),
+            'edge_agreement': edge_agreement(out_single['edges'], out_pyramid['edges']),
+            'edge_sigma': float(np.std(image) * 2),
+        })
+
+    print("\nPyramid Detection Benchmark:")
+    print("-" * 50)
+    for stage in ('edges', 'blobs', 'regions', 'total'):
+        s = np.mean([row['single'][stage] for row in rows])
+        p = np.mean([row['pyramid'][stage] for row in rows])
+        print(f"{stage:>8}: single {s * 1000:8.1f} ms  pyramid {p * 1000:8.1f} ms  ({s / p:.1f}x)")
+    print(f"Blob recall vs single-scale: {np.mean([row['recall'] for row in rows]):.3f} "
+          f"({np.mean([row['n_single'] for row in rows]):.0f} vs "
+          f"{np.mean([row['n_pyramid'] for row in rows]):.0f} blobs per frame)")
+    print(f"Region label agreement: {np.mean([row['region_agreement'] for row in rows]):.3f}")
+    print(f"Edge agreement (F1 within 2 px): {np.mean([row['edge_agreement'] for row in rows]):.3f} "
+          f"(Canny sigma {np.mean([row['edge_sigma'] for row in rows]):.1f})")
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark pyramid vs single-scale feature detection")
+    parser.add_argument('--frames', type=int, default=3)
+    parser.add_argument('--size', type=int, default=1024)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scale', type=float, default=1.0, help="multiply frames (e.g. 255 for 8-bit data)")
+    args = parser.parse_args()
+
+    benchmark_pyramid(args.frames, args.size, args.seed, args.scale)
@@ -0,0 +1,247 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from pathlib import Path
+
+from vmc_lazy import lazy_import
+from vmc_array_store import load_array
+import vmc_metrics
+
+Image = lazy_import('PIL.Image')
+plt = lazy_import('matplotlib.pyplot')
+
+QUICKLOOK_SUFFIXES = ('.JPG', '.jpg', '.jpeg', '.npy')
+
+def load_reduced(path, size):
+    """
+    Decode an image at roughly size pixels on its longest side, as uint8
+
+    JPEGs use the decoder's DCT scaling (Image.draft), so a 1024x1024 frame is
+    decoded at 1/2, 1/4 or 1/8 resolution instead of in full. .npy frames are
+    memory-mapped and only every n-th row and column is read.
+    """
+    path = Path(path)
+    if path.suffix == '.npy':
+        data = load_array(path, as_float=False)
+        step = max(1, max(data.shape[:2]) // size)
+        data = np.asarray(data[::step, ::step])
+        if data.dtype == np.uint16:
+            data = data / 65535.0
+        if data.dtype.kind == 'f':
+            data = np.round(np.clip(data, 0, 1) * 255)
+        img = Image.fromarray(data.astype(np.uint8))
+    else:
+        img = Image.open(path)
+        img.draft('L', (size, size))
+        img = img.convert('L')
+    img.thumbnail((size, size))
+    return img
+
+class QuicklookCache:
+    """Downscaled thumbnails and per-orbit contact sheets of raw or processed frames
+
+    Thumbnails are small JPEGs under cache_dir, indexed in SQLite by source
+    path together with the source size and mtime, so a thumbnail is rebuilt
+    only when its frame changes. Contact sheets are rebuilt from the cached
+    thumbnails when the set of frames in a directory changes. Least recently
+    used files are evicted once the cache grows past max_bytes.
+    """
+    def __init__(self, cache_dir, size=256, max_bytes=512 * 1024 * 1024, quality=85):
+        self.cache_dir = Path(cache_dir)
+        self.size = size
+        self.max_bytes = max_bytes
+        self.quality = quality
+        self.failed = set()
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.cache_dir / 'quicklook.sqlite'), check_same_thread=False,
+                                    isolation_level=None)
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                file TEXT NOT NULL,
+                signature TEXT NOT NULL,
+                bytes INTEGER NOT NULL,
+                accessed REAL NOT NULL
+            );
+        """)
+
+    def _file_for(self, kind, key):
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return self.cache_dir / kind / digest[:2] / f"{digest}.jpg"
+
+    def _lookup(self, key, signature):
+        """Cached file for key if it was built from signature, else None"""
+        with self.lock:
+            row = self.conn.execute("SELECT file, signature FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] != signature or not os.path.exists(row[0]):
+                return None
+            self.conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (time.time(), key))
+        return row[0]
+
+    def _store(self, key, signature, img, kind):
+        """Write img as the cached file for key"""
+        path = self._file_for(kind, key)
+        os.makedirs(path.parent, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        img.save(tmp_path, format='JPEG', quality=self.quality)
+        os.replace(tmp_path, path)
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO entries (key, file, signature, bytes, accessed) "
+                              "VALUES (?, ?, ?, ?, ?)",
+                              (key, str(path), signature, path.stat().st_size, time.time()))
+        return str(path)
+
+    def _thumbnail_file(self, path):
+        """(cached thumbnail path, True if it had to be generated)"""
+        path = os.path.abspath(path)
+        st = os.stat(path)
+        key = f"thumb:{self.size}:{path}"
+        signature = f"{st.st_size}:{st.st_mtime_ns}"
+        cached = self._lookup(key, signature)
+        if cached is not None:
+            vmc_metrics.count('quicklook.hits')
+            return cached, False
+        with vmc_metrics.timer('quicklook.thumbnail'):
+            cached = self._store(key, signature, load_reduced(path, self.size), 'thumbs')
+        vmc_metrics.count('quicklook.generated')
+        return cached, True
+
+    def thumbnail(self, path):
+        """uint8 thumbnail of an image file, generated on first use"""
+        cached, generated = self._thumbnail_file(path)
+        if generated:
+            self.evict()
+        return np.array(Image.open(cached))
+
+    def frames(self, directory, pattern='*'):
+        """Image files in a directory matching pattern, in name order"""
+        return sorted(p for p in Path(directory).glob(pattern) if p.suffix in QUICKLOOK_SUFFIXES)
+
+    def update(self, directory, pattern='*'):
+        """Generate thumbnails for frames that are new or changed; returns how many were generated"""
+        generated = 0
+        for path in self.frames(directory, pattern):
+            try:
+                generated += self._thumbnail_file(path)[1]
+            except Exception as e:
+                print(f"Error creating thumbnail for {path}: {e}")
+                self.failed.add(str(path))
+        if generated:
+            self.evict()
+        return generated
+
+    def contact_sheet(self, directory, pattern='*', columns=10, tile=None):
+        """
+        Mosaic of every frame in a directory as a uint8 array
+
+        Parameters:
+        directory: orbit directory of raw, filtered or processed frames
+        pattern: glob selecting the frames (e.g. '*_UV2.JPG')
+        columns: tiles per row
+        tile: tile size in pixels (default: the thumbnail size)
+
+        Only new or changed frames are decoded; the sheet itself is rebuilt
+        from cached thumbnails when the frames differ from the cached sheet.
+        Frames that cannot be decoded are left as black tiles.
+        """
+        tile = tile or self.size
+        frames = self.frames(directory, pattern)
+        if not frames:
+            return None
+        stats = [p.stat() for p in frames]
+        key = f"sheet:{self.size}:{tile}:{columns}:{os.path.abspath(directory)}:{pattern}"
+        signature = hashlib.sha1('\n'.join(f"{p.name}:{st.st_size}:{st.st_mtime_ns}"
+                                           for p, st in zip(frames, stats)).encode()).hexdigest()
+        cached = self._lookup(key, signature)
+        if cached is None:
+            with vmc_metrics.timer('quicklook.contact_sheet'):
+                rows = -(-len(frames) // columns)
+                sheet = Image.new('L', (columns * tile, rows * tile))
+                for i, path in enumerate(frames):
+                    try:
+                        thumb = Image.open(self._thumbnail_file(path)[0])
+                    except Exception as e:
+                        if str(path) not in self.failed:
+                            print(f"Error creating thumbnail for {path}: {e}")
+                            self.failed.add(str(path))
+                        continue
+                    if tile != self.size:
+                        thumb.thumbnail((tile, tile))
+                    sheet.paste(thumb, ((i % columns) * tile, (i // columns) * tile))
+                cached = self._store(key, signature, sheet, 'sheets')
+            self.evict()
+        return np.array(Image.open(cached))
+
+    def show_contact_sheet(self, directory, pattern='*', columns=10):
+        """Display the contact sheet of a directory"""
+        sheet = self.contact_sheet(directory, pattern, columns)
+        if sheet is None:
+            print(f"No frames in {directory}")
+            return
+        plt.figure(figsize=(12, 12 * sheet.shape[0] / sheet.shape[1]))
+        plt.imshow(sheet, cmap='gray')
+        plt.title(f"{Path(directory).name} ({len(self.frames(directory, pattern))} frames)")
+        plt.axis('off')
+        plt.show()
+
+    def total_bytes(self):
+        with self.lock:
+            return self.conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM entries").fetchone()[0]
+
+    def evict(self, max_bytes=None):
+        """Delete least recently used entries until the cache fits in max_bytes; returns how many"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with self.lock:
+            total = self.conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM entries").fetchone()[0]
+            if total <= max_bytes:
+                return 0
+            removed = []
+            for key, file, size in self.conn.execute("SELECT key, file, bytes FROM entries ORDER BY accessed"):
+                if total <= max_bytes:
+                    break
+                removed.append((key, file))
+                total -= size
+            self.conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in removed])
+        for _, file in removed:
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
+        vmc_metrics.count('quicklook.evicted', len(removed))
+        return len(removed)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+def update_quicklooks(base_dir, cache_dir, pattern='*', orbits=None, size=256, columns=10):
+    """
+    Refresh thumbnails and contact sheets for every orbit directory under base_dir
+
+    Returns the number of thumbnails generated.
+    """
+    cache = QuicklookCache(cache_dir, size=size)
+    orbit_dirs = sorted(p for p in Path(base_dir).iterdir() if p.is_dir() and (orbits is None or p.name in orbits))
+    start = time.perf_counter()
+    generated = 0
+    try:
+        for orbit_dir in orbit_dirs:
+            generated += cache.update(orbit_dir, pattern)
+            cache.contact_sheet(orbit_dir, pattern, columns)
+    finally:
+        cache.close()
+    print(f"Quicklooks for {len(orbit_dirs)} orbits: {generated} thumbnails generated, "
+          f"{len(cache.failed)} frames failed in {time.perf_counter() - start:.1f} s")
+    return generated
+
+if __name__ == "__main__":
+    processed_dir = "/Users/n_welikala/cvprojects/venus/data/vmc/processed/uv2"
+    cache_dir = "/Users/n_welikala/cvprojects/venus/data/vmc/quicklook"
+
+    update_quicklooks(processed_dir, cache_dir)
+    QuicklookCache(cache_dir).show_contact_sheet(Path(processed_dir) / "0557")
@@ -0,0 +1,84 @@
+import os
+import json
+import sqlite3
+import hashlib
+import threading
+
+def hash_file(path, block_size=1 << 20):
+    """SHA-256 of a file's contents"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_params(params, version):
+    """Stable hash of processing parameters and code version"""
+    text = json.dumps({'params': params, 'version': version}, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode()).hexdigest()
+
+class ResultCache:
+    """Maps each output file to the key of the inputs that produced it
+
+    The key combines a content hash of the input file with a hash of the
+    processing parameters and code version, so an output is reused only if
+    all three are unchanged. Input hashes are memoised by (size, mtime) so
+    unchanged inputs are not re-read on every run.
+    """
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(cache_path, check_same_thread=False, isolation_level=None)
+        self.conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS inputs (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL,
+                sha256 TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS outputs (
+                path TEXT PRIMARY KEY,
+                key TEXT NOT NULL
+            );
+        """)
+
+    def input_hash(self, path):
+        """Content hash of an input, re-read only if its size or mtime changed"""
+        path = os.fspath(path)
+        st = os.stat(path)
+        with self.lock:
+            row = self.conn.execute("SELECT size, mtime, sha256 FROM inputs WHERE path = ?",
+                                    (path,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime:
+            return row[2]
+
+        sha = hash_file(path)
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO inputs (path, size, mtime, sha256) VALUES (?, ?, ?, ?)",
+                              (path, st.st_size, st.st_mtime, sha))
+        return sha
+
+    def key_for(self, input_path, params_hash):
+        """Cache key for producing an output from input_path with given parameters"""
+        return f"{self.input_hash(input_path)}:{params_hash}"
+
+    def is_current(self, output_path, key):
+        """True if output_path exists and was produced with this key"""
+        output_path = os.fspath(output_path)
+        if not os.path.exists(output_path):
+            return False
+        with self.lock:
+            row = self.conn.execute("SELECT key FROM outputs WHERE path = ?", (output_path,)).fetchone()
+        return row is not None and row[0] == key
+
+    def put(self, output_path, key):
+        """Record that output_path is up to date for key"""
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO outputs (path, key) VALUES (?, ?)",
+                              (os.fspath(output_path), key))
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
@@ -0,0 +1,305 @@
+import os
+import time
+import numpy as np
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import vmc_metrics
+
+RECORD_DTYPE = np.dtype([('orbit', 'U8'), ('image_number', 'i4'), ('mean', 'f4'), ('std', 'f4'),
+                         ('deviation', 'f4')])
+
+class ImageStatistics:
+    """One-pass, mergeable statistics of a stream of equally sized 0-1 frames
+
+    Per pixel: Welford mean/variance, min and max, and a coarse histogram of
+    median_bins bins from which an approximate median map is read. Over all
+    pixels: a histogram of `bins` bins, which doubles as a quantile sketch
+    (values are bounded to 0-1, so quantiles are exact to 1/bins). Per frame:
+    mean, std and the RMS difference from the mean map, kept as a few scalars
+    for anomaly detection. update() measures that difference against the
+    running mean (corrected for its sampling noise); rescore() replaces it
+    with the difference from the finished mean map.
+
+    Memory is independent of the number of frames (apart from the per-frame
+    scalars). Two partial results over disjoint frames combine with merge(),
+    so workers and orbits can be reduced in any order.
+    """
+    def __init__(self, bins=1024, median_bins=16, warmup=20):
+        self.bins = bins
+        self.median_bins = median_bins
+        self.warmup = warmup
+        self.n = 0
+        self.shape = None
+        self.mean = self.m2 = self.min = self.max = None
+        self.median_counts = None
+        self.histogram = np.zeros(bins, dtype=np.int64)
+        self.records = []
+
+    def _allocate(self, shape):
+        self.shape = shape
+        self.mean = np.zeros(shape, dtype=np.float64)
+        self.m2 = np.zeros(shape, dtype=np.float64)
+        self.min = np.full(shape, np.inf, dtype=np.float32)
+        self.max = np.full(shape, -np.inf, dtype=np.float32)
+        if self.median_bins:
+            self.median_counts = np.zeros((self.median_bins,) + shape, dtype=np.uint32)
+
+    def update(self, image, orbit='', image_number=-1):
+        """Add one frame (e.g. the output of VMCImageProcessor.preprocess_image)"""
+        with vmc_metrics.timer('stats.update'):
+            image = np.asarray(image, dtype=np.float32)
+            if self.shape is None:
+                self._allocate(image.shape)
+            elif image.shape != self.shape:
+                raise ValueError(f"frame shape {image.shape} does not match {self.shape}")
+
+            # Welford update; delta against the mean before this frame also scores the frame.
+            # A mean of n frames adds its own noise: E|x - mean_n|^2 = (1 + 1/n) sigma^2
+            delta = image - self.mean
+            deviation = np.sqrt(np.mean(delta ** 2) / (1 + 1 / self.n)) if self.n >= self.warmup else np.nan
+            self.n += 1
+            self.mean += delta / self.n
+            self.m2 += delta * (image - self.mean)
+            np.minimum(self.min, image, out=self.min)
+            np.maximum(self.max, image, out=self.max)
+
+            clipped = np.clip(image, 0, 1)
+            self.histogram += np.bincount(np.minimum((clipped * self.bins).astype(np.intp), self.bins - 1).ravel(),
+                                          minlength=self.bins)
+            if self.median_bins:
+                level = np.minimum((clipped * self.median_bins).astype(np.intp), self.median_bins - 1)
+                # One increment per pixel: index (level, pixel) of the flattened count array
+                flat = level.ravel() * level.size + np.arange(level.size)
+                self.median_counts.reshape(-1)[flat] += 1
+
+            self.records.append((orbit, image_number, float(image.mean()), float(image.std()), deviation))
+            vmc_metrics.count('stats.frames')
+
+    def rescore(self, frames):
+        """
+        Score frames by their RMS difference from the finished mean map
+        
+        frames: iterable of (position in the records, image) for frames already
+            added with update(), e.g. from a second pass over the orbit
+        """
+        for i, image in frames:
+            orbit, number, mean, std, _ = self.records[i]
+            delta = np.asarray(image, dtype=np.float32) - self.mean
+            self.records[i] = (orbit, number, mean, std, float(np.sqrt(np.mean(delta ** 2))))
+
+    def merge(self, other):
+        """Fold another partial result into this one (Chan et al. parallel variance)"""
+        if other.n == 0:
+            return self
+        if self.n == 0:
+            self.__dict__.update({key: value.copy() if isinstance(value, np.ndarray) else value
+                                  for key, value in other.__dict__.items() if key != 'records'})
+            self.records = list(other.records)
+            return self
+        if other.shape != self.shape or other.bins != self.bins or other.median_bins != self.median_bins:
+            raise ValueError("cannot merge statistics with different shapes or bins")
+
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.m2 += other.m2 + delta ** 2 * (self.n * other.n / n)
+        self.mean += delta * (other.n / n)
+        self.n = n
+        np.minimum(self.min, other.min, out=self.min)
+        np.maximum(self.max, other.max, out=self.max)
+        self.histogram += other.histogram
+        if self.median_bins:
+            self.median_counts += other.median_counts
+        self.records.extend(other.records)
+        return self
+
+    def variance(self):
+        """Per-pixel sample variance"""
+        return self.m2 / max(self.n - 1, 1)
+
+    def std(self):
+        return np.sqrt(self.variance())
+
+    def median(self):
+        """Approximate per-pixel median map, interpolated within the coarse histogram bins"""
+        if not self.median_bins or self.n == 0:
+            return None
+        cumulative = np.cumsum(self.median_counts, axis=0, dtype=np.int64)
+        half = self.n / 2
+        level = np.argmax(cumulative >= half, axis=0)
+        below = np.where(level > 0, np.take_along_axis(cumulative, np.maximum(level - 1, 0)[None], 0)[0], 0)
+        inside = np.take_along_axis(self.median_counts, level[None], 0)[0].astype(np.float64)
+        fraction = (half - below) / np.maximum(inside, 1)
+        return ((level + fraction) / self.median_bins).astype(np.float32)
+
+    def quantile(self, q):
+        """Approximate quantile(s) of all pixel values from the histogram sketch"""
+        cumulative = np.cumsum(self.histogram)
+        if cumulative[-1] == 0:
+            return np.full(np.shape(q), np.nan)
+        edges = np.arange(1, self.bins + 1) / self.bins
+        return np.interp(np.asarray(q) * cumulative[-1], np.concatenate([[0], cumulative]),
+                         np.concatenate([[0], edges]))
+
+    def frame_records(self):
+        """Per-frame scalars as a structured array (orbit, image_number, mean, std, deviation)"""
+        return np.array(self.records, dtype=RECORD_DTYPE)
+
+    def anomalies(self, threshold=5.0):
+        """
+        Frames whose brightness or difference from the mean map is an outlier
+
+        Uses robust z-scores (median and MAD over frames) of the frame mean
+        and of the RMS difference from the mean map. Returns the
+        records sorted by score, with the score as an extra field.
+        """
+        records = self.frame_records()
+        if len(records) < 3:
+            return records[:0]
+        scores = np.zeros(len(records))
+        for field in ('mean', 'deviation'):
+            values = records[field].astype(np.float64)
+            valid = np.isfinite(values)
+            if valid.sum() < 3:
+                continue
+            median = np.median(values[valid])
+            mad = np.median(np.abs(values[valid] - median)) * 1.4826
+            z = np.abs(values - median) / max(mad, 1e-6)
+            scores = np.fmax(scores, np.where(valid, z, 0))
+        order = np.argsort(-scores)
+        order = order[scores[order] > threshold]
+        result = np.empty(len(order), dtype=RECORD_DTYPE.descr + [('score', 'f4')])
+        for name in RECORD_DTYPE.names:
+            result[name] = records[name][order]
+        result['score'] = scores[order]
+        return result
+
+    def summary(self):
+        """Scalar summary of everything seen so far"""
+        p1, p50, p99 = self.quantile([0.01, 0.5, 0.99])
+        return {
+            'frames': self.n,
+            'mean': float(self.mean.mean()) if self.n else np.nan,
+            'pixel_std': float(np.sqrt(self.variance()).mean()) if self.n > 1 else np.nan,
+            'p1': float(p1), 'median': float(p50), 'p99': float(p99),
+        }
+
+    def save(self, path):
+        """Write to an .npz file (written to a temporary name and moved into place)"""
+        arrays = {'n': self.n, 'bins': self.bins, 'median_bins': self.median_bins, 'warmup': self.warmup,
+                  'histogram': self.histogram, 'records': self.frame_records()}
+        if self.n:
+            arrays.update(mean=self.mean, m2=self.m2, min=self.min, max=self.max)
+            if self.median_bins:
+                arrays['median_counts'] = self.median_counts
+        path = Path(path)
+        tmp_path = path.with_name(path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            stats = cls(int(data['bins']), int(data['median_bins']), int(data['warmup']))
+            stats.n = int(data['n'])
+            stats.histogram = data['histogram']
+            stats.records = data['records'].tolist()
+            if stats.n:
+                stats.mean, stats.m2, stats.min, stats.max = data['mean'], data['m2'], data['min'], data['max']
+                stats.shape = stats.mean.shape
+                if stats.median_bins:
+                    stats.median_counts = data['median_counts']
+        return stats
+
+def orbit_statistics(processed_dir, orbit, rescore=True, **options):
+    """
+    Stream every processed frame of one orbit through an ImageStatistics
+
+    rescore: second pass scoring each frame against the finished orbit mean
+        (one more read per frame; .npy frames are memory-mapped)
+    """
+    from vmc_feature_detector import VMCFeatureDetector
+    detector = VMCFeatureDetector(processed_dir)
+    stats = ImageStatistics(**options)
+    added = []
+    for _, number, path in detector.find_images([orbit]):
+        try:
+            stats.update(detector.load_image(orbit, number), orbit, number)
+            added.append((len(stats.records) - 1, number))
+        except Exception as e:
+            print(f"Error adding {path}: {e}")
+    if rescore:
+        with vmc_metrics.timer('stats.rescore'):
+            stats.rescore((i, detector.load_image(orbit, number)) for i, number in added)
+    return stats
+
+def _orbit_task(processed_dir, orbit, output_path, options):
+    """Worker: statistics of one orbit, saved to output_path"""
+    stats = orbit_statistics(processed_dir, orbit, **options)
+    stats.save(output_path)
+    return orbit, output_path, stats.n
+
+def collect_statistics(processed_dir, output_dir, orbits=None, workers=None, skip_existing=True, **options):
+    """
+    Per-orbit and mission statistics of processed frames in one parallel pass
+
+    Parameters:
+    processed_dir: directory of per-orbit processed frames
+    output_dir: receives stats_<orbit>.npz per orbit and stats_mission.npz
+    orbits: orbits to include (None = every orbit under processed_dir)
+    workers: number of worker processes (None = all cores, 1 = in process)
+    skip_existing: reuse stats_<orbit>.npz files newer than every frame of the orbit
+    options: ImageStatistics parameters (bins, median_bins, warmup)
+
+    Each orbit is reduced in one worker; the mission result is the merge of
+    the orbit results. Returns the mission ImageStatistics.
+    """
+    processed_dir, output_dir = Path(processed_dir), Path(output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    if orbits is None:
+        orbits = sorted(p.name for p in processed_dir.iterdir() if p.is_dir())
+
+    start = time.perf_counter()
+    paths, pending = {}, []
+    for orbit in orbits:
+        path = output_dir / f"stats_{orbit}.npz"
+        paths[orbit] = path
+        frames = list((processed_dir / orbit).glob('proc_*'))
+        if skip_existing and path.exists() and all(p.stat().st_mtime <= path.stat().st_mtime for p in frames):
+            continue
+        pending.append(orbit)
+
+    if workers == 1:
+        for orbit in pending:
+            _orbit_task(processed_dir, orbit, paths[orbit], options)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(vmc_metrics.worker_call, _orbit_task, processed_dir, orbit, paths[orbit], options)
+                       for orbit in pending]
+            for future in as_completed(futures):
+                vmc_metrics.unwrap(future.result())
+
+    mission = ImageStatistics(**options)
+    for orbit in orbits:
+        if paths[orbit].exists():
+            mission.merge(ImageStatistics.load(paths[orbit]))
+    mission.save(output_dir / "stats_mission.npz")
+
+    summary = mission.summary()
+    print(f"Statistics of {summary['frames']} frames in {len(orbits)} orbits "
+          f"({len(pending)} recomputed) in {time.perf_counter() - start:.1f} s")
+    print(f"Mean {summary['mean']:.3f}, median {summary['median']:.3f}, "
+          f"1-99% range {summary['p1']:.3f}-{summary['p99']:.3f}")
+    anomalies = mission.anomalies()
+    if len(anomalies):
+        print(f"{len(anomalies)} anomalous frames:")
+        for record in anomalies[:10]:
+            print(f"  {record['orbit']} {record['image_number']:04d}: score {record['score']:.1f}")
+    return mission
+
+if __name__ == "__main__":
+    processed_dir = "/Users/n_welikala/cvprojects/venus/data/vmc/processed/uv2"
+    stats_dir = "/Users/n_welikala/cvprojects/venus/data/vmc/statistics/uv2"
+
+    collect_statistics(processed_dir, stats_dir, workers=os.cpu_count())
@@ -0,0 +1,174 @@
+import os
+import threading
+import time
+import functools
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+def make_synthetic_browse_tree(root, n_orbits=5, pairs_per_orbit=20, jpg_bytes=60000, first_orbit=550):
+    """
+    Create a BROWSE-like tree of orbit directories with JPG/LBL pairs
+
+    Parameters:
+    root: str, directory to create the tree in
+    n_orbits: int, number of orbit directories (0550/, 0551/, ...)
+    pairs_per_orbit: int, number of JPG/LBL pairs in each orbit
+    jpg_bytes: int, size of each placeholder JPG payload
+    """
+    os.makedirs(root, exist_ok=True)
+    payload = os.urandom(jpg_bytes)
+
+    for orbit_number in range(first_orbit, first_orbit + n_orbits):
+        orbit = f"{orbit_number:04d}"
+        orbit_dir = os.path.join(root, orbit)
+        os.makedirs(orbit_dir, exist_ok=True)
+
+        for i in range(pairs_per_orbit):
+            name = f"V{orbit}_{i:04d}_UV2"
+            with open(os.path.join(orbit_dir, name + ".JPG"), 'wb') as f:
+                f.write(payload)
+            with open(os.path.join(orbit_dir, name + ".LBL"), 'w') as f:
+                f.write(f'PRODUCT_ID = "{name}"\n')
+
+    return root
+
+def make_cloud_image(shape=(1024, 1024), n_features=60, seed=None):
+    """
+    Synthetic VMC-like UV frame in 0-1: smooth background plus Gaussian cloud cells
+
+    Feature sizes span the 3-30 pixel sigma range searched by detect_blobs.
+    """
+    import numpy as np
+    from scipy import ndimage
+
+    rng = np.random.default_rng(seed)
+    height, width = shape
+    image = ndimage.gaussian_filter(rng.random(shape), sigma=min(shape) / 16) * 0.5
+
+    yy, xx = np.ogrid[:height, :width]
+    for _ in range(n_features):
+        y, x = rng.uniform(0, height), rng.uniform(0, width)
+        sigma = np.exp(rng.uniform(np.log(3), np.log(30)))
+        amplitude = rng.uniform(0.3, 1.0) * rng.choice([-1, 1])
+        image += amplitude * np.exp(-((yy - y) ** 2 + (xx - x) ** 2) / (2 * sigma ** 2))
+
+    image += rng.normal(0, 0.02, shape)
+    image -= image.min()
+    image /= image.max()
+    return image.astype(np.float32)
+
+LABEL_TEMPLATE = """PDS_VERSION_ID = PDS3
+RECORD_TYPE = UNDEFINED
+^IMAGE = "{name}.JPG"
+DATA_SET_ID = "VEX-V-VMC-3-RDR-EXT1-V3.0"
+PRODUCT_ID = "{name}"
+MISSION_NAME = "VENUS EXPRESS"
+INSTRUMENT_ID = VMC
+ORBIT_NUMBER = {orbit_number}
+START_TIME = {start_time}
+STOP_TIME = {stop_time}
+FILTER_NAME = "{filter_name}"
+EXPOSURE_DURATION = {exposure:.3f} <s>
+OBJECT = IMAGE
+  LINES = {height}
+  LINE_SAMPLES = {width}
+  SAMPLE_BITS = 8
+  SAMPLE_TYPE = UNSIGNED_INTEGER
+END_OBJECT = IMAGE
+END
+"""
+
+def make_synthetic_orbit_tree(root, n_orbits=3, frames_per_orbit=10, filters=('UV2', 'VI2', 'N12', 'N22'),
+                              image_size=512, first_orbit=550, cadence=60.0, seed=0):
+    """
+    Create a raw-data-like tree of decodable JPGs with full PDS3 labels
+
+    Parameters:
+    root: str, directory to create the tree in
+    n_orbits: int, number of orbit directories
+    frames_per_orbit: int, acquisitions per orbit (one JPG/LBL pair per filter each)
+    filters: filter names written for every acquisition
+    image_size: int, side length of the square frames
+    cadence: float, seconds between acquisitions (START_TIME spacing)
+
+    Unlike make_synthetic_browse_tree the files can be decoded and parsed, so
+    every pipeline stage can run on the tree. Returns root.
+    """
+    from datetime import datetime, timedelta
+    from PIL import Image
+
+    os.makedirs(root, exist_ok=True)
+    # A few distinct frames reused across the tree keep generation fast
+    frames = [make_cloud_image((image_size, image_size), seed=seed + i) for i in range(4)]
+    frames = [Image.fromarray((frame * 255).astype('uint8')) for frame in frames]
+    epoch = datetime(2006, 5, 1)
+
+    for k, orbit_number in enumerate(range(first_orbit, first_orbit + n_orbits)):
+        orbit = f"{orbit_number:04d}"
+        orbit_dir = os.path.join(root, orbit)
+        os.makedirs(orbit_dir, exist_ok=True)
+        orbit_start = epoch + timedelta(days=k)
+
+        for i in range(frames_per_orbit):
+            for j, filter_name in enumerate(filters):
+                name = f"V{orbit}_{i * len(filters) + j:04d}_{filter_name}"
+                start = orbit_start + timedelta(seconds=i * cadence + j * 2.0)
+                exposure = 0.02 * (j + 1)
+                frames[(i + j) % len(frames)].save(os.path.join(orbit_dir, name + ".JPG"), quality=90)
+                with open(os.path.join(orbit_dir, name + ".LBL"), 'w') as f:
+                    f.write(LABEL_TEMPLATE.format(
+                        name=name, orbit_number=orbit_number, filter_name=filter_name, exposure=exposure,
+                        start_time=start.isoformat(timespec='milliseconds'),
+                        stop_time=(start + timedelta(seconds=exposure)).isoformat(timespec='milliseconds'),
+                        height=image_size, width=image_size))
+
+    return root
+
+class _LatencyHandler(SimpleHTTPRequestHandler):
+    """Directory-listing handler with a fixed delay per request and byte-range support"""
+    latency = 0.0
+
+    def send_head(self):
+        if self.latency:
+            time.sleep(self.latency)
+
+        range_header = self.headers.get('Range', '')
+        path = self.translate_path(self.path)
+        if not range_header.startswith('bytes=') or not os.path.isfile(path):
+            return super().send_head()
+
+        # Only the open-ended "bytes=N-" form used by the downloader
+        start = int(range_header[len('bytes='):].split('-')[0] or 0)
+        size = os.path.getsize(path)
+        if start >= size:
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{size}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+
+        f = open(path, 'rb')
+        f.seek(start)
+        self.send_response(206)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Range', f"bytes {start}-{size - 1}/{size}")
+        self.send_header('Content-Length', str(size - start))
+        self.send_header('Last-Modified', self.date_time_string(os.path.getmtime(path)))
+        self.end_headers()
+        return f
+
+    def log_message(self, format, *args):
+        pass  # Keep benchmark output clean
+
+def serve_directory(root, port=0, latency=0.0):
+    """
+    Serve a directory over HTTP with the same kind of index pages as the archive
+
+    Returns (server, base_url). Call server.shutdown() when done.
+    """
+    handler = type('Handler', (_LatencyHandler,), {'latency': latency})
+    server = ThreadingHTTPServer(('127.0.0.1', port), functools.partial(handler, directory=root))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+    return server, base_url
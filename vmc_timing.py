@@ -1,47 +1,55 @@
 import os
 from datetime import datetime
-import re
+from vmc_pds3 import parse_label
 from collections import defaultdict
+import vmc_metrics
 
 def extract_time_from_lbl(lbl_path):
     """Extract START_TIME from LBL file"""
     try:
-        with open(lbl_path, 'r') as f:
-            content = f.read()
-            
-        # Find START_TIME
-        time_pattern = r'START_TIME\s*=\s*"([^"]*)"'
-        match = re.search(time_pattern, content)
+        with vmc_metrics.timer('timing.parse_label'):
+            start_time = parse_label(lbl_path).get('START_TIME')
+        vmc_metrics.count('timing.labels')
         
-        if match:
-            time_str = match.group(1)
+        if isinstance(start_time, datetime):
+            return start_time
+        if start_time:
             # Convert to datetime object
-            return datetime.strptime(time_str, "%Y-%m-%dT%H:%M:%S.%f")
+            return datetime.strptime(start_time, "%Y-%m-%dT%H:%M:%S.%f")
         return None
             
     except Exception as e:
         print(f"Error reading {lbl_path}: {e}")
         return None
 
-def analyze_orbit_timing(data_dir):
-    """Analyze timing patterns within each orbit"""
+@vmc_metrics.timed('timing.analyze')
+def analyze_orbit_timing(data_dir, index=None):
+    """Analyze timing patterns within each orbit
+    
+    If a ProductIndex is given the START_TIMEs come from the index instead
+    of reopening every LBL file.
+    """
     orbit_times = defaultdict(list)
     
-    # Walk through the data directory
-    for root, dirs, files in os.walk(data_dir):
-        # Process only LBL files
-        lbl_files = sorted([f for f in files if f.endswith('.LBL')])
-        
-        if lbl_files:
-            orbit = os.path.basename(root)
+    if index is not None:
+        with vmc_metrics.timer('timing.index_query'):
+            orbit_times.update(index.start_times())
+    else:
+        # Walk through the data directory
+        for root, dirs, files in os.walk(data_dir):
+            # Process only LBL files
+            lbl_files = sorted([f for f in files if f.endswith('.LBL')])
+            
+            if lbl_files:
+                orbit = os.path.basename(root)
             
-            # Extract times for each LBL file in the orbit
-            for lbl_file in lbl_files:
-                full_path = os.path.join(root, lbl_file)
-                time = extract_time_from_lbl(full_path)
-                if time:
-                    # Store tuple of (filename, time)
-                    orbit_times[orbit].append((lbl_file, time))
+                # Extract times for each LBL file in the orbit
+                for lbl_file in lbl_files:
+                    full_path = os.path.join(root, lbl_file)
+                    time = extract_time_from_lbl(full_path)
+                    if time:
+                        # Store tuple of (filename, time)
+                        orbit_times[orbit].append((lbl_file, time))
     
     # Analyze and print results
     print("\nTiming Analysis by Orbit:")
@@ -1,64 +1,176 @@
 import os
-from collections import defaultdict
+import sys
+import errno
 import shutil
+from collections import defaultdict
+
+FILTERS = ('UV2', 'VI2', 'N12', 'N22')
+LINK_MODES = ('auto', 'hardlink', 'reflink', 'symlink', 'copy')
+FICLONE = 0x40049409  # Linux ioctl: share extents between two files (btrfs, XFS, ...)
+
+def _reflink(src, dst):
+    """Clone src to dst without copying data (copy-on-write filesystems only)"""
+    if not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, "reflink is only supported on Linux")
+    import fcntl
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        try:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        except OSError:
+            fdst.close()
+            os.unlink(dst)
+            raise
+    shutil.copystat(src, dst)
 
-def extract_uv2_images(raw_dir, base_dir):
+def _is_current(src, dst, mode):
+    """True if dst already mirrors src for the given mode"""
+    try:
+        if mode == 'symlink':
+            return os.path.islink(dst) and os.readlink(dst) == os.path.abspath(src)
+        src_stat, dst_stat = os.stat(src), os.lstat(dst)
+    except OSError:
+        return False
+    if (src_stat.st_ino, src_stat.st_dev) == (dst_stat.st_ino, dst_stat.st_dev):
+        return True  # Same file (hardlink)
+    return mode != 'hardlink' and src_stat.st_size == dst_stat.st_size and \
+        int(src_stat.st_mtime) == int(dst_stat.st_mtime)
+
+def link_file(src, dst, mode='auto'):
     """
-    Extract UV2 images and their LBL files to a filtered directory
+    Place src at dst without duplicating data where possible
+
+    mode 'auto' tries a hardlink, then a reflink, then falls back to a copy
+    (e.g. across filesystems). Returns the method actually used.
+    """
+    tmp = dst + '.tmp'
+    if os.path.lexists(tmp):
+        os.unlink(tmp)
+
+    methods = ('hardlink', 'reflink', 'copy') if mode == 'auto' else (mode,)
+    for method in methods:
+        try:
+            if method == 'hardlink':
+                os.link(src, tmp)
+            elif method == 'reflink':
+                _reflink(src, tmp)
+            elif method == 'symlink':
+                os.symlink(os.path.abspath(src), tmp)
+            else:
+                shutil.copy2(src, tmp)
+            break
+        except OSError:
+            if method == methods[-1]:
+                raise
+    # Atomic replace of any stale file
+    os.replace(tmp, dst)
+    return method
+
+def extract_filter_images(raw_dir, base_dir, filters=('UV2',), mode='auto', index=None, orbits=None):
+    """
+    Extract images of the given filters and their LBL files to filtered/<filter>/<orbit>
     
     Parameters:
     raw_dir: str, path to raw data directory
     base_dir: str, path to base VMC directory
-    """
-    # Create filtered directory structure
-    filtered_dir = os.path.join(base_dir, 'filtered')
-    os.makedirs(filtered_dir, exist_ok=True)
+    filters: filter names to extract, any of UV2, VI2, N12, N22
+    mode: 'auto' (hardlink, then reflink, then copy), 'hardlink', 'reflink', 'symlink' or 'copy'
+    index: ProductIndex over raw_dir, optional; used instead of walking raw_dir
+    orbits: list of orbit names, optional; only these orbits are extracted
     
-    output_dir = os.path.join(filtered_dir, 'uv2')
-    os.makedirs(output_dir, exist_ok=True)
+    Files already present and unchanged are skipped, so re-runs only handle
+    new downloads. Returns {filter: {orbit: [new files]}}.
+    """
+    if mode not in LINK_MODES:
+        raise ValueError(f"mode must be one of {LINK_MODES}")
+    filters = [f.upper() for f in filters]
     
-    uv2_files = defaultdict(list)
+    # Collect sources per (filter, orbit)
+    sources = defaultdict(lambda: defaultdict(list))
+    if index is not None:
+        # Indexed lookup of the products
+        for filter_type in filters:
+            for product in index.products(filter_type=filter_type):
+                for path in (product['jpg_path'], product['lbl_path']):
+                    if path:
+                        sources[filter_type][product['orbit']].append(path)
+    else:
+        # Walk through raw data directory (only the requested orbits if given)
+        roots = [os.path.join(raw_dir, orbit) for orbit in orbits] if orbits is not None else [raw_dir]
+        for top in roots:
+            for root, _, files in os.walk(top):
+                orbit = os.path.basename(root)
+                for file in files:
+                    base, ext = os.path.splitext(file)
+                    if ext in ('.JPG', '.LBL') and base[-3:] in filters and base[-4:-3] == '_':
+                        sources[base[-3:]][orbit].append(os.path.join(root, file))
     
-    # Walk through raw data directory
-    for root, _, files in os.walk(raw_dir):
-        orbit = os.path.basename(root)
+    extracted = {}
+    methods = defaultdict(int)
+    unchanged = 0
+    for filter_type in filters:
+        output_dir = os.path.join(base_dir, 'filtered', filter_type.lower())
+        os.makedirs(output_dir, exist_ok=True)
+        extracted[filter_type] = defaultdict(list)
         
-        # Find UV2 files and their corresponding LBL files
-        for file in files:
-            if '_UV2.' in file:  # Match UV2 files
-                orbit_dir = os.path.join(output_dir, orbit)
-                os.makedirs(orbit_dir, exist_ok=True)
-                
-                # Copy file to new location
-                src = os.path.join(root, file)
+        for orbit, paths in sources[filter_type].items():
+            if orbits is not None and orbit not in orbits:
+                continue
+            # One directory per orbit, created outside the file loop
+            orbit_dir = os.path.join(output_dir, orbit)
+            os.makedirs(orbit_dir, exist_ok=True)
+            
+            for src in paths:
+                file = os.path.basename(src)
                 dst = os.path.join(orbit_dir, file)
-                shutil.copy2(src, dst)
-                uv2_files[orbit].append(file)
+                if _is_current(src, dst, mode):
+                    unchanged += 1
+                    continue
+                methods[link_file(src, dst, mode)] += 1
+                extracted[filter_type][orbit].append(file)
     
     # Print summary
-    print("\nUV2 Image Extraction Summary:")
-    print("-" * 50)
-    
-    total_jpg = 0
-    total_lbl = 0
-    
-    for orbit in sorted(uv2_files.keys()):
-        jpg_count = len([f for f in uv2_files[orbit] if f.endswith('.JPG')])
-        lbl_count = len([f for f in uv2_files[orbit] if f.endswith('.LBL')])
+    for filter_type in filters:
+        files_by_orbit = extracted[filter_type]
+        print(f"\n{filter_type} Image Extraction Summary:")
+        print("-" * 50)
+        
+        total_jpg = 0
+        total_lbl = 0
         
-        print(f"\nOrbit {orbit}:")
-        print(f"  JPG files: {jpg_count}")
-        print(f"  LBL files: {lbl_count}")
+        for orbit in sorted(files_by_orbit.keys()):
+            jpg_count = len([f for f in files_by_orbit[orbit] if f.endswith('.JPG')])
+            lbl_count = len([f for f in files_by_orbit[orbit] if f.endswith('.LBL')])
+            
+            print(f"\nOrbit {orbit}:")
+            print(f"  JPG files: {jpg_count}")
+            print(f"  LBL files: {lbl_count}")
+            
+            total_jpg += jpg_count
+            total_lbl += lbl_count
         
-        total_jpg += jpg_count
-        total_lbl += lbl_count
+        print(f"\nTotal {filter_type} files extracted:")
+        print(f"Total JPG files: {total_jpg}")
+        print(f"Total LBL files: {total_lbl}")
+    
+    print(f"\nAlready up to date: {unchanged} files")
+    if methods:
+        print("Placed by: " + ", ".join(f"{method} {count}" for method, count in sorted(methods.items())))
+    return extracted
+
+def extract_uv2_images(raw_dir, base_dir, index=None, orbits=None, mode='auto'):
+    """
+    Extract UV2 images and their LBL files to a filtered directory
     
-    print(f"\nTotal UV2 files extracted:")
-    print(f"Total JPG files: {total_jpg}")
-    print(f"Total LBL files: {total_lbl}")
+    Parameters:
+    raw_dir: str, path to raw data directory
+    base_dir: str, path to base VMC directory
+    index: ProductIndex over raw_dir, optional; used instead of walking raw_dir
+    orbits: list of orbit names, optional; only these orbits are extracted
+    mode: how files are placed, see extract_filter_images ('copy' for the old behaviour)
+    """
+    return extract_filter_images(raw_dir, base_dir, ('UV2',), mode, index, orbits)['UV2']
 
 if __name__ == "__main__":
     raw_dir = "/Users/n_welikala/cvprojects/venus/data/vmc/raw"
     base_dir = "/Users/n_welikala/cvprojects/venus/data/vmc"
     extract_uv2_images(raw_dir, base_dir)
-    
@@ -0,0 +1,251 @@
+import os
+import re
+import time
+import numpy as np
+from pathlib import Path
+from scipy import fft
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from vmc_feature_detector import VMCFeatureDetector
+
+NAME_PATTERN = re.compile(r'V(\d{4})_(\d{4})_UV2')
+
+def frame_times_from_index(index):
+    """Map orbit -> [(image_number, datetime)] for UV2 frames in a ProductIndex"""
+    frame_times = {}
+    for orbit, times in index.start_times(filter_type='UV2').items():
+        frames = []
+        for lbl_name, start_time in times:
+            match = NAME_PATTERN.match(lbl_name)
+            if match:
+                frames.append((int(match.group(2)), start_time))
+        frame_times[orbit] = sorted(frames, key=lambda frame: frame[1])
+    return frame_times
+
+def frame_times_from_labels(label_dir, workers=None):
+    """Map orbit -> [(image_number, datetime)] by batch-parsing the UV2 labels under label_dir"""
+    from vmc_pds3 import parse_labels
+
+    paths = sorted(Path(label_dir).glob("*/V*_UV2.LBL"))
+    table = parse_labels(paths, keys=['START_TIME'], workers=workers)
+    frame_times = {}
+    for path, start_time in zip(table['path'], table['START_TIME']):
+        match = NAME_PATTERN.match(os.path.basename(path))
+        if match and not np.isnat(start_time):
+            frame_times.setdefault(match.group(1), []).append(
+                (int(match.group(2)), start_time.astype('datetime64[us]').item()))
+    for frames in frame_times.values():
+        frames.sort(key=lambda frame: frame[1])
+    return frame_times
+
+def consecutive_pairs(frames, max_gap=3600.0, min_gap=1.0):
+    """
+    Pair each frame with the next one in time
+
+    Parameters:
+    frames: [(image_number, datetime)] sorted by time
+    max_gap, min_gap: accepted time separation in seconds
+
+    Returns [(image_a, image_b, dt_seconds, time_a)].
+    """
+    pairs = []
+    for (a, time_a), (b, time_b) in zip(frames, frames[1:]):
+        dt = (time_b - time_a).total_seconds()
+        if min_gap <= dt <= max_gap:
+            pairs.append((a, b, dt, time_a))
+    return pairs
+
+class PhaseCorrelator:
+    """Tiled FFT phase correlation between frame pairs of a fixed shape
+
+    The tile grid and Hann window are built once per frame shape
+    and reused for every tile and every pair; the FFTs of all tiles of all
+    pairs in a batch run as one multi-threaded scipy.fft call.
+    """
+    def __init__(self, shape, tile_size=64, step=32, fft_workers=1):
+        self.shape = tuple(shape)
+        self.tile_size = tile_size
+        self.step = step
+        self.fft_workers = fft_workers
+
+        height, width = self.shape
+        self.rows = np.arange(0, height - tile_size + 1, step)
+        self.cols = np.arange(0, width - tile_size + 1, step)
+        # Tile centres in full-frame pixel coordinates
+        self.centers_y = self.rows + tile_size / 2
+        self.centers_x = self.cols + tile_size / 2
+        self.window = np.outer(np.hanning(tile_size), np.hanning(tile_size)).astype(np.float32)
+
+    def _tiles(self, frames):
+        """(P, ny, nx, T, T) windowed, zero-mean tiles of a (P, H, W) stack (view then one copy)"""
+        view = np.lib.stride_tricks.sliding_window_view(frames, (self.tile_size, self.tile_size), axis=(1, 2))
+        tiles = view[:, ::self.step, ::self.step][:, :len(self.rows), :len(self.cols)].astype(np.float32)
+        tiles -= tiles.mean(axis=(-2, -1), keepdims=True)
+        tiles *= self.window
+        return tiles
+
+    def displacements(self, frames_a, frames_b):
+        """
+        Shift of each tile from frames_a to frames_b
+
+        Parameters:
+        frames_a, frames_b: (P, H, W) stacks (or single (H, W) frames)
+
+        Returns (dy, dx, peak) arrays of shape (P, ny, nx); peak is the
+        phase-correlation peak height (0-1) usable as a confidence.
+        """
+        frames_a = np.asarray(frames_a, dtype=np.float32)
+        frames_b = np.asarray(frames_b, dtype=np.float32)
+        single = frames_a.ndim == 2
+        if single:
+            frames_a, frames_b = frames_a[None], frames_b[None]
+
+        T = self.tile_size
+        spec_a = fft.rfft2(self._tiles(frames_a), workers=self.fft_workers)
+        spec_b = fft.rfft2(self._tiles(frames_b), workers=self.fft_workers)
+        cross = spec_b * np.conj(spec_a)
+        cross /= np.maximum(np.abs(cross), 1e-12)
+        corr = fft.irfft2(cross, s=(T, T), workers=self.fft_workers)
+
+        # Integer peak per tile
+        flat = corr.reshape(corr.shape[:-2] + (T * T,))
+        peak_index = flat.argmax(axis=-1)
+        py, px = np.divmod(peak_index, T)
+        peak = np.take_along_axis(flat, peak_index[..., None], axis=-1)[..., 0]
+
+        # Parabolic sub-pixel refinement along each axis (with wrap-around)
+        def neighbour(dy, dx):
+            index = ((py + dy) % T) * T + (px + dx) % T
+            return np.take_along_axis(flat, index[..., None], axis=-1)[..., 0]
+
+        def refine(minus, plus):
+            denom = minus - 2 * peak + plus
+            return np.where(np.abs(denom) > 1e-12, 0.5 * (minus - plus) / denom, 0.0)
+
+        dy = py + refine(neighbour(-1, 0), neighbour(1, 0))
+        dx = px + refine(neighbour(0, -1), neighbour(0, 1))
+        dy = np.where(dy > T / 2, dy - T, dy)
+        dx = np.where(dx > T / 2, dx - T, dx)
+
+        if single:
+            return dy[0], dx[0], peak[0]
+        return dy, dx, peak
+
+def track_orbit(processed_dir, orbit, frames, tile_size=64, step=32, max_gap=3600.0,
+                batch_pairs=8, km_per_pixel=None, fft_workers=1):
+    """
+    Cloud-motion vectors for every consecutive UV2 pair of one orbit
+
+    Parameters:
+    processed_dir: directory of processed frames (npy or JPG)
+    orbit: orbit name, e.g. '0550'
+    frames: [(image_number, datetime)] sorted by time
+    km_per_pixel: if given, velocities are also returned in m/s
+
+    Returns a dict of arrays: u/v in pixels per second with shape
+    (pairs, ny, nx), peak confidence, pair image numbers, times and gaps,
+    and tile centre coordinates.
+    """
+    detector = VMCFeatureDetector(processed_dir)
+    available = {number for _, number, _ in detector.find_images([orbit])}
+    frames = [frame for frame in frames if frame[0] in available]
+    pairs = consecutive_pairs(frames, max_gap=max_gap)
+    if not pairs:
+        return None
+
+    # Load each frame once even though most appear in two pairs
+    cache = {}
+    def load(number):
+        if number not in cache:
+            cache[number] = np.asarray(detector.load_image(orbit, number), dtype=np.float32)
+        return cache[number]
+
+    correlator = PhaseCorrelator(load(pairs[0][0]).shape, tile_size, step, fft_workers)
+    u, v, peaks = [], [], []
+    for start in range(0, len(pairs), batch_pairs):
+        batch = pairs[start:start + batch_pairs]
+        stack_a = np.stack([load(a) for a, _, _, _ in batch])
+        stack_b = np.stack([load(b) for _, b, _, _ in batch])
+        dy, dx, peak = correlator.displacements(stack_a, stack_b)
+        dt = np.array([pair[2] for pair in batch])[:, None, None]
+        u.append(dx / dt)
+        v.append(dy / dt)
+        peaks.append(peak)
+        # Frames of earlier pairs are no longer needed
+        for a, _, _, _ in batch:
+            cache.pop(a, None)
+
+    result = {
+        'orbit': orbit,
+        'u': np.concatenate(u).astype(np.float32),
+        'v': np.concatenate(v).astype(np.float32),
+        'peak': np.concatenate(peaks).astype(np.float32),
+        'image_a': np.array([pair[0] for pair in pairs]),
+        'image_b': np.array([pair[1] for pair in pairs]),
+        'dt': np.array([pair[2] for pair in pairs]),
+        'time': np.array([np.datetime64(pair[3], 'us') for pair in pairs]),
+        'centers_y': correlator.centers_y,
+        'centers_x': correlator.centers_x,
+    }
+    if km_per_pixel:
+        result['u_ms'] = result['u'] * km_per_pixel * 1000
+        result['v_ms'] = result['v'] * km_per_pixel * 1000
+    return result
+
+def _track_task(args):
+    """Worker: track one orbit and save its velocity grids, capturing the orbit's error"""
+    processed_dir, orbit, frames, output_dir, options = args
+    start = time.perf_counter()
+    try:
+        result = track_orbit(processed_dir, orbit, frames, **options)
+        if result is None:
+            return orbit, 0, time.perf_counter() - start, None
+        np.savez_compressed(Path(output_dir) / f"winds_{orbit}.npz", **result)
+    except Exception as e:
+        return orbit, 0, time.perf_counter() - start, f"{type(e).__name__}: {e}"
+    return orbit, len(result['dt']), time.perf_counter() - start, None
+
+def track_mission(processed_dir, frame_times, output_dir, workers=None, **options):
+    """
+    Track every orbit in a process pool and write winds_<orbit>.npz files
+
+    Parameters:
+    processed_dir: directory of processed UV2 frames
+    frame_times: orbit -> [(image_number, datetime)], e.g. from frame_times_from_index
+    output_dir: where the per-orbit velocity grids are written
+    workers: number of processes (one orbit per task)
+    options: passed to track_orbit (tile_size, step, max_gap, km_per_pixel, ...)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    tasks = [(str(processed_dir), orbit, frames, str(output_dir), options)
+             for orbit, frames in sorted(frame_times.items())]
+
+    start = time.perf_counter()
+    total_pairs = 0
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for future in as_completed([pool.submit(_track_task, task) for task in tasks]):
+            orbit, n_pairs, seconds, error = future.result()
+            if error is not None:
+                failed.append((orbit, error))
+                print(f"Orbit {orbit}: failed after {seconds:.1f} s")
+                continue
+            total_pairs += n_pairs
+            print(f"Orbit {orbit}: {n_pairs} frame pairs in {seconds:.1f} s")
+
+    elapsed = time.perf_counter() - start
+    print(f"\nTracked {total_pairs} frame pairs over {len(tasks)} orbits in {elapsed:.1f} s, "
+          f"{len(failed)} orbits failed")
+    for orbit, error in failed:
+        print(f"  Failed: orbit {orbit}: {error}")
+    return total_pairs
+
+if __name__ == "__main__":
+    from vmc_product_index import open_index
+
+    raw_dir = "/Users/n_welikala/cvprojects/venus/data/vmc/raw"
+    processed_dir = "/Users/n_welikala/cvprojects/venus/data/vmc/processed/uv2"
+    output_dir = "/Users/n_welikala/cvprojects/venus/data/vmc/winds"
+
+    frame_times = frame_times_from_index(open_index(raw_dir))
+    track_mission(processed_dir, frame_times, output_dir)